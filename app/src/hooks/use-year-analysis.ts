@@ -1,5 +1,26 @@
 import {useEffect, useState} from "react";
 import {UneAnalysis} from "@/src/lib/types.ts";
+import {resolveAnalysis} from "@/src/lib/analysis-format.ts";
+
+let manifest: Promise<Record<string, string>> | null = null
+let status: Promise<{ sync_date?: string }> | null = null
+
+// year -> content-hashed filename, fetched once (missing years fall back to the unhashed file)
+function loadManifest() {
+    manifest ??= fetch('/data/manifest.json', {cache: 'no-cache'})
+        .then(r => r.ok ? r.json() : {years: {}})
+        .then(json => json.years ?? {})
+        .catch(() => ({}))
+    return manifest
+}
+
+// sync freshness lives apart from the analysis files, so these only change with the data
+function loadStatus() {
+    status ??= fetch('/data/status.json', {cache: 'no-cache'})
+        .then(r => r.ok ? r.json() : {})
+        .catch(() => ({}))
+    return status
+}
 
 export default function useYearAnalysis(selectedYear: number) {
     const [data, setData] = useState<UneAnalysis | null>(null)
@@ -9,14 +30,18 @@ export default function useYearAnalysis(selectedYear: number) {
         const controller = new AbortController()
 
         setLoading(true)
-        fetch(`/data/analysis_data_${selectedYear}.json`, {
-            signal: controller.signal
-        })
+        loadManifest()
+            .then(years => fetch(`/data/${years[selectedYear] ?? `analysis_data_${selectedYear}.json`}`, {
+                signal: controller.signal
+            }))
             .then(r => {
                 if (!r.ok) throw new Error()
                 return r.json()
             })
-            .then(setData)
+            .then(json => loadStatus().then(({sync_date}) => {
+                const analysis = resolveAnalysis(json)
+                setData({...analysis, sync_date: analysis.sync_date || sync_date || ''})
+            }))
             .catch(e => {
                 if (e.name !== 'AbortError') console.error(e)
             })
@@ -0,0 +1,35 @@
+import {CompactUneAnalysis, MessageCountRef, TelegramMessage, UneAnalysis} from "@/src/lib/types.ts";
+
+/**
+ * Resolves the message references of a v2 (compact) analysis file into the `UneAnalysis` shape.
+ * v1 files are returned as they are. The sync date is not part of the analysis files (see `status.json`).
+ */
+export function resolveAnalysis(json: UneAnalysis | CompactUneAnalysis): UneAnalysis {
+    if (!('version' in json) || json.version !== 2) return json as UneAnalysis
+
+    const {version, link_base, messages, ...data} = json
+
+    const message = (id: number): TelegramMessage => ({...messages[id], link: `${link_base}/${id}`})
+    const withCount = (ref: MessageCountRef): TelegramMessage => ({...message(ref.id), count: ref.count})
+
+    return {
+        sync_date: '',
+        ...data,
+        first_message: message(data.first_message),
+        last_message: message(data.last_message),
+        shortest_message: withCount(data.shortest_message),
+        longest_message: withCount(data.longest_message),
+        top3_most_viewed_messages: data.top3_most_viewed_messages.map(withCount),
+        top3_most_replied_messages: data.top3_most_replied_messages.map(withCount),
+        top3_most_positive_reaction_messages: data.top3_most_positive_reaction_messages.map(withCount),
+        top3_most_negative_reaction_messages: data.top3_most_negative_reaction_messages.map(withCount),
+        sen_analysis: {
+            ...data.sen_analysis,
+            failure_events: data.sen_analysis.failure_events.map(event => ({
+                ...event,
+                start_message: message(event.start_message),
+                end_message: message(event.end_message),
+            })),
+        },
+    }
+}
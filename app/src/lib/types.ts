@@ -29,6 +29,7 @@ export interface BlockAnalysis {
   estimated_affected_seconds: number;
   weekday_off_seconds: Record<number, number>;
   weekday_off_avg_seconds: Record<number, number>;
+  hourly_off_seconds?: Record<number, number>;
 }
 
 export interface SenFailureEvent {
@@ -90,6 +91,38 @@ export interface UneAnalysis {
   sen_analysis: SenAnalysis;
 }
 
+// v2 (compact) export format: messages are stored once in `messages` and referenced by id
+export type CompactTelegramMessage = Omit<TelegramMessage, 'link' | 'date_utc_d' | 'date_cuba_d' | 'count'>;
+
+export interface MessageCountRef {
+  id: number;
+  count: number;
+}
+
+export interface CompactSenFailureEvent
+  extends Omit<SenFailureEvent, 'start_date_d' | 'start_message' | 'end_date_d' | 'end_message'> {
+  start_message: number;
+  end_message: number;
+}
+
+export interface CompactUneAnalysis extends Omit<UneAnalysis,
+  'sync_date' | 'first_message' | 'last_message' | 'shortest_message' | 'longest_message' |
+  'top3_most_viewed_messages' | 'top3_most_replied_messages' |
+  'top3_most_positive_reaction_messages' | 'top3_most_negative_reaction_messages' | 'sen_analysis'> {
+  version: 2;
+  link_base: string;
+  first_message: number;
+  last_message: number;
+  shortest_message: MessageCountRef;
+  longest_message: MessageCountRef;
+  top3_most_viewed_messages: MessageCountRef[];
+  top3_most_replied_messages: MessageCountRef[];
+  top3_most_positive_reaction_messages: MessageCountRef[];
+  top3_most_negative_reaction_messages: MessageCountRef[];
+  sen_analysis: Omit<SenAnalysis, 'failure_events'> & { failure_events: CompactSenFailureEvent[] };
+  messages: Record<string, CompactTelegramMessage>;
+}
+
 export type YearTheme = {
   bg: string;
   primary: string;
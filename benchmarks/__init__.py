@@ -0,0 +1,6 @@
+import os
+
+from tests.synthetic import CHANNEL_USERNAME
+
+# The benchmarks run offline over synthetic archives, so they do not need a `.env`
+os.environ.setdefault('CHANNEL_USERNAME', CHANNEL_USERNAME)
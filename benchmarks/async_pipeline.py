@@ -0,0 +1,77 @@
+"""
+Benchmark of the asyncio backfill pipeline (`core.scrapper.backfill_messages`) against the serial
+`process_all_messages`, with fake clients that simulate the latency of each API request.
+
+Usage: python -m benchmarks.async_pipeline [messages] [latency_seconds]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from tests.fakes import FakeTelegramClient, FakeAsyncTelegramClient
+from tests.synthetic import generate_messages
+from core.database import setup_database, close_databases, get_sync_state
+from core.scrapper import process_all_messages, backfill_messages, BACKFILL_CHECKPOINT
+
+
+def __stored_messages() -> int:
+    conn = setup_database()
+    try:
+        assert get_sync_state(conn, BACKFILL_CHECKPOINT) is None
+        return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def __timed(name: str, function) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            stored = __stored_messages()
+        finally:
+            close_databases()
+            os.chdir(cwd)
+
+    print(f"{name:<32} {elapsed:8.2f} s  ({stored} messages stored)")
+    return elapsed
+
+
+def run(count: int = 20_000, latency: float = 0.05):
+    messages = list(generate_messages(count))
+    print(f"Benchmarking backfill of {count} messages with {latency * 1000:.0f} ms per request")
+
+    serial = __timed('serial', lambda: process_all_messages(FakeTelegramClient(messages, latency)))
+    for concurrency in (1, 4, 8):
+        pipelined = __timed(
+            f'pipeline, {concurrency} ranges',
+            lambda: asyncio.run(backfill_messages(FakeAsyncTelegramClient(messages, latency), concurrency=concurrency))
+        )
+        print(f"  speedup x{serial / pipelined:.1f}")
+
+    __timed('pipeline, 4 ranges + flood wait', lambda: asyncio.run(
+        backfill_messages(FakeAsyncTelegramClient(messages, latency, flood_wait=1), concurrency=4)
+    ))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            try:
+                asyncio.run(backfill_messages(FakeAsyncTelegramClient(messages, fail_after=count // 3), concurrency=4))
+            except ConnectionError as e:
+                print(f"⚠️ Backfill interrupted: {e}")
+            asyncio.run(backfill_messages(FakeAsyncTelegramClient(messages), concurrency=4))
+            print(f"✅ Resumed backfill stored {__stored_messages()} messages")
+        finally:
+            close_databases()
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000, float(sys.argv[2]) if len(sys.argv) > 2 else 0.05)
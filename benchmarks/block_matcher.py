@@ -0,0 +1,111 @@
+"""
+Micro-benchmark of `core.blocks.match_blocks` against the per-block `re.search(pattern.format(i=block), text)`
+detection it replaced, over the messages stored on `telegram_messages.db`. Both must give the same blocks on every
+stored message and on generated texts mixing block references with spaces, newlines, tabs and non-breaking spaces.
+
+Usage: python -m benchmarks.block_matcher [repetitions]
+"""
+import random
+import re
+import sys
+import time
+
+from core.blocks import match_blocks, extract_blocks_from_list
+from core.classes import BlockMatches
+from core.database import setup_database
+
+LEGACY_BLOCK_START_PATTERNS = [
+    r"(afect|déficit|fuera).*bloque\s*(no\.?|nº)?\s*{i}",
+    r"bloque\s*(no\.?|nº)?\s*{i}.*(afect|déficit|fuera)",
+]
+LEGACY_BLOCK_END_PATTERNS = [
+    r"(restablec|recuper|normaliz|cierra).*bloque\s*(no\.?|nº)?\s*{i}"
+]
+WHITESPACE_TOKENS = [
+    'bloque', 'bloques', 'bloques:', 'b', 'no.', 'no', 'nº', 'y', ',', '.', '#', ' ', '  ', '\n', '\t', '\xa0',
+    '1', '2', '3', '4', '5', '6', '7', 'restablecimiento', 'afectación', 'afectacion', 'afect', 'fuera', 'recuper',
+    'cierra', '✅', '🚨', 'emergencia', 'texto',
+]
+
+
+def legacy_match_blocks(text: str) -> BlockMatches:
+    """
+    Block detection as done by the analyzer before `core.blocks`: one regex search per pattern and block.
+    """
+    matches = BlockMatches()
+    matches.listed = extract_blocks_from_list(text)
+
+    alert_emojis = r'[✅🚨‼️❗]'
+
+    for i in range(1, 7):
+        if any(re.search(pattern.format(i=i), text) for pattern in LEGACY_BLOCK_START_PATTERNS):
+            matches.started.add(i)
+        if any(re.search(pattern.format(i=i), text) for pattern in LEGACY_BLOCK_END_PATTERNS):
+            matches.ended.add(i)
+
+        block_pattern = rf'(bloque|b|bloque no\.?)[ \.#]*{i}'
+        pattern_for_this_block = rf'(bloques?|no\.?|y|,|\s)[ \.#]*{i}'
+        if re.search(rf'{pattern_for_this_block}\b', text, re.IGNORECASE):
+            matches.mentioned.add(i)
+        if "restablecimiento" in text:
+            if re.search(rf'restablecimiento[\s\S]*?{pattern_for_this_block}', text, re.IGNORECASE):
+                if not re.search(rf'(bloque|b|no\.?)[ \.#]*{i}[\s\S]*?afectaci[oó]n', text, re.IGNORECASE):
+                    matches.recovered.add(i)
+        if re.search(rf'{alert_emojis}[\s\S]*?{block_pattern}', text):
+            matches.affected.add(i)
+            if re.search(rf'{alert_emojis}[\s\S]*?{block_pattern}[\s\S]*?emergencia', text):
+                matches.emergencies.add(i)
+
+    return matches
+
+
+def __load_texts() -> list[str]:
+    conn = setup_database()
+    try:
+        return [row[0].lower() for row in conn.execute('SELECT text FROM messages WHERE text IS NOT NULL AND text != ""')]
+    finally:
+        conn.close()
+
+
+def __whitespace_texts(count: int = 20000, seed: int = 0) -> list[str]:
+    generator = random.Random(seed)
+    return [
+        ''.join(generator.choice(WHITESPACE_TOKENS) for _ in range(generator.randint(1, 14)))
+        for _ in range(count)
+    ] + ['bloques: \n1, 2', 'restablecimiento bloque 1 \n2', 'x \xa05', 'texto \n3 afectado']
+
+
+def __check_identical(texts: list[str], source: str):
+    mismatches = [text for text in texts if legacy_match_blocks(text) != match_blocks(text)]
+    if mismatches:
+        print(f"❌ {len(mismatches)} {source} differ, first one:\n{mismatches[0]!r}")
+        sys.exit(1)
+
+
+def __best_time(function, texts: list[str], repetitions: int) -> float:
+    best = float("inf")
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(repetitions: int = 3):
+    texts = __load_texts()
+    print(f"Benchmarking block detection over {len(texts)} messages (best of {repetitions})")
+
+    __check_identical(texts, "messages")
+    __check_identical(__whitespace_texts(), "generated texts")
+
+    legacy = __best_time(legacy_match_blocks, texts, repetitions)
+    current = __best_time(match_blocks, texts, repetitions)
+
+    print(f"legacy re.search + format(): {legacy:8.3f} s  ({len(texts) / legacy:10.0f} msg/s)")
+    print(f"core.blocks.match_blocks:    {current:8.3f} s  ({len(texts) / current:10.0f} msg/s)")
+    print(f"✅ Identical results, speedup x{legacy / current:.1f}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
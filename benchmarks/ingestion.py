@@ -0,0 +1,62 @@
+"""
+Benchmark of the database ingestion: one commit per message (previous `save_message_to_db`) against the
+batched `save_messages_to_db`, over a synthetic archive written to temporary databases.
+
+Usage: python -m benchmarks.ingestion [messages]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from tests.synthetic import generate_messages
+from core.database import setup_database, save_messages_to_db
+
+
+def legacy_save_messages(conn, messages):
+    """
+    Ingestion as done before `save_messages_to_db`: one `INSERT OR REPLACE` per row and a commit per message.
+    """
+    for msg in messages:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO messages (id, date_utc, date_cuba, views, replies, text)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (msg.id, msg.date_utc, msg.date_cuba, msg.views, msg.replies, msg.text))
+
+        for emoji, count in msg.reactions.items():
+            cursor.execute('''
+                INSERT OR REPLACE INTO message_reactions (message_id, emoji, count)
+                VALUES (?, ?, ?)
+            ''', (msg.id, emoji, count))
+
+        conn.commit()
+
+
+def __timed(name: str, function, messages, directory: str):
+    conn = setup_database(os.path.join(directory, f'{name}.db'))
+    start = time.perf_counter()
+    function(conn, messages)
+    elapsed = time.perf_counter() - start
+    stored = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    conn.close()
+
+    print(f"{name:<22} {elapsed:8.2f} s  ({stored / elapsed:10.0f} msg/s)")
+    return elapsed
+
+
+def run(count: int = 100_000):
+    messages = list(generate_messages(count))
+    print(f"Benchmarking ingestion of {count} synthetic messages")
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = __timed('commit per message', legacy_save_messages, messages, directory)
+        batched = __timed('batched', lambda c, m: save_messages_to_db(c, m, verbose=False), messages, directory)
+        wal = __timed('batched + WAL', lambda c, m: save_messages_to_db(c, m, wal=True, verbose=False),
+                      messages, directory)
+
+    print(f"✅ Speedup x{legacy / batched:.1f} (batched), x{legacy / wal:.1f} (batched + WAL)")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
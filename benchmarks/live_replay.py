@@ -0,0 +1,117 @@
+"""
+Offline replay of the live tail (`core.scrapper.tail_channel`): the recorded messages of a year of
+`telegram_messages.db` are stored one by one on a temporary database, as the tail does with Telegram events,
+and applied to a `core.live.LiveAnalysis`, with a few edits of older messages on the way.
+
+The latency of every applied message and of the exports is compared with a full `analyze_data`, and the final
+live analysis must be identical to it. `replay` runs over any list of messages (see `tests/test_live.py`).
+
+Usage: python -m benchmarks.live_replay [year] [preloaded_fraction] [edits]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+from core.analyzer import analyze_data, serialize_analysis, DATA_DIRECTORY
+from core.database import setup_database, close_databases, connection, save_messages_to_db, iter_messages_by_year
+from core.classes import TelegramMessage
+from core.live import LiveAnalysis
+
+EXPORT_EVERY = 100
+
+
+def run(year: int = 2025, preloaded_fraction: float = 0.5, edits: int = 3):
+    recorded = list(iter_messages_by_year(year))
+    close_databases()
+    result = replay(year, recorded, preloaded_fraction, edits)
+
+    print(f"Loaded {result['preloaded']} messages of {year} in {__ms(result['load_seconds'])}")
+    print(f"⚡ {len(result['latencies'])} new messages applied: {__ms(statistics.median(result['latencies']))} "
+          f"median, {__ms(max(result['latencies']))} max")
+    if result['edit_latencies']:
+        print(f"✏️ {len(result['edit_latencies'])} edits of older messages (reload): "
+              f"{__ms(statistics.median(result['edit_latencies']))} median")
+    if result['export_latencies']:
+        print(f"📤 {len(result['export_latencies'])} exports: {__ms(statistics.median(result['export_latencies']))} median")
+    print(f"🐢 Full analyze_data: {__ms(result['full_seconds'])}")
+    assert result['live_content'] == result['full_content'], "the live analysis differs from analyze_data"
+    print("✅ Live analysis identical to analyze_data")
+
+
+def replay(year: int, recorded: list[TelegramMessage], preloaded_fraction: float = 0.5, edits: int = 3) -> dict:
+    """
+    Replays the messages of a year on a temporary database (see the module docstring).
+
+    :param year: year of the messages
+    :param recorded: messages of the year, in date order
+    :param preloaded_fraction: fraction of the messages stored before the live analysis starts
+    :param edits: number of edits of older messages
+    :return: dict with the latencies (seconds) of the applied messages, edits and exports, the load and full
+             analysis times, and the serialized live and full analyses
+    """
+    preloaded = int(len(recorded) * preloaded_fraction)
+    history, new_posts = recorded[:preloaded], recorded[preloaded:]
+    edit_every = len(new_posts) // (edits + 1) if edits else 0
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.makedirs(DATA_DIRECTORY)
+            setup_database().close()
+            with connection() as conn:
+                save_messages_to_db(conn, history)
+
+            live = LiveAnalysis(year)
+            started = time.perf_counter()
+            live.update()
+            load_seconds = time.perf_counter() - started
+
+            latencies, edit_latencies, export_latencies = [], [], []
+            for i, message in enumerate(new_posts, 1):
+                started = time.perf_counter()
+                with connection() as conn:
+                    save_messages_to_db(conn, [message])
+                live.apply(message)
+                latencies.append(time.perf_counter() - started)
+
+                if edit_every and i % edit_every == 0 and i // edit_every <= edits:
+                    edited = replace(history[i % len(history)], text=history[i % len(history)].text + ' (editado)')
+                    started = time.perf_counter()
+                    with connection() as conn:
+                        save_messages_to_db(conn, [edited])
+                    live.apply(edited)
+                    live.update()
+                    edit_latencies.append(time.perf_counter() - started)
+
+                if i % EXPORT_EVERY == 0:
+                    started = time.perf_counter()
+                    live.export()
+                    export_latencies.append(time.perf_counter() - started)
+
+            live_content = serialize_analysis(live.export())
+            started = time.perf_counter()
+            full_content = serialize_analysis(analyze_data(year, update_manifest=False))
+            full_seconds = time.perf_counter() - started
+        finally:
+            close_databases()
+            os.chdir(cwd)
+
+    return {
+        'preloaded': preloaded, 'load_seconds': load_seconds, 'latencies': latencies,
+        'edit_latencies': edit_latencies, 'export_latencies': export_latencies, 'full_seconds': full_seconds,
+        'live_content': live_content, 'full_content': full_content,
+    }
+
+
+def __ms(seconds: float) -> str:
+    return f"{seconds * 1000:.1f} ms"
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2025,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.5,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 3)
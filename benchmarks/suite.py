@@ -0,0 +1,236 @@
+"""
+Benchmark suite of the whole pipeline over a synthetic UNE channel (see `tests.synthetic`), with every
+message in a single year: ingestion (`save_messages_to_db` and `save_message_to_db`), loading
+(`get_messages_by_year` and `get_year_messages`), message classification, every aggregator of `analyze_data`,
+the streamed load and aggregation of `analyze_data`, the state machines resumed from their checkpoints, the word
+counts, the all-time rollup of the stored month partials and the JSON export are timed separately.
+
+The suite runs twice over fresh databases: once for wall times and throughput, and once under tracemalloc
+for the peak memory of each section. With `--save-baseline` the results are stored in `benchmarks/baselines/`,
+otherwise they are compared against the stored baseline of the same scale (as well as the analysis output), and
+the suite fails if there is no baseline for the scale or the output differs. Baselines of the documented scales
+are committed.
+
+Usage: python -m benchmarks.suite [10k|100k|1m|<messages>] [--save-baseline] [--no-memory]
+"""
+import datetime
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import islice
+
+from tests.synthetic import generate_messages
+from core.aggregators import run_aggregators
+from core.analyzer import new_analysis, build_aggregators, serialize_analysis, rollup_analysis, DATA_DIRECTORY
+from core.artifacts import write_artifact
+from core.checkpoints import resume_aggregators, collect_checkpoints, save_checkpoints
+from core.columnar import YearMessages, get_year_messages, stream_year_messages
+from core.database import setup_database, connection, close_databases, save_messages_to_db, save_message_to_db, get_messages_by_year
+from core.features import save_message_features
+from core.partials import save_partials
+from core.words import get_top_words
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+YEAR = 2025
+CHUNK_SIZE = 10_000
+SINGLE_WRITES = 1_000
+REGRESSION_THRESHOLD = 1.2
+BASELINE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def run(count: int = 10_000, save_baseline: bool = False, memory: bool = True):
+    baseline_path = os.path.join(BASELINE_DIRECTORY, f'suite_{count}.json')
+    baseline = None
+    if not save_baseline:
+        if not os.path.exists(baseline_path):
+            print(f"❌ No baseline for {count} messages ({baseline_path}), run with --save-baseline to create it")
+            sys.exit(1)
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    print(f"Benchmarking the pipeline over {count} synthetic messages of {YEAR}")
+    times, items, output_hash = __run_pass(count, trace=False)
+    peaks = {}
+    if memory:
+        tracemalloc.start()
+        peaks, _, _ = __run_pass(count, trace=True)
+        tracemalloc.stop()
+
+    __report(times, items, peaks, baseline)
+
+    if baseline is not None:
+        if baseline['output_sha256'] != output_hash:
+            print("❌ Analysis output differs from the baseline")
+            sys.exit(1)
+        print("✅ Analysis output matches the baseline")
+
+    if save_baseline:
+        os.makedirs(BASELINE_DIRECTORY, exist_ok=True)
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump({'count': count, 'time': times, 'memory': peaks, 'output_sha256': output_hash}, f, indent=4)
+        print(f"💾 Baseline saved to {baseline_path}")
+
+
+def __run_pass(count: int, trace: bool) -> tuple[dict[str, float], dict[str, int], str]:
+    """
+    Runs every section once on a fresh temporary database.
+
+    :return: (section -> seconds or peak bytes, section -> processed items, sha256 of the analysis output)
+    """
+    recorder = SectionRecorder(trace)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            os.makedirs(DATA_DIRECTORY)
+            output_hash = __run_sections(count, recorder)
+        finally:
+            close_databases()
+            os.chdir(cwd)
+
+    return recorder.results, recorder.items, output_hash
+
+
+class SectionRecorder:
+    """
+    Accumulates the wall time (or, when tracing, the peak traced memory) and processed items of each section.
+    """
+
+    def __init__(self, trace: bool):
+        self.trace = trace
+        self.results: dict[str, float] = {}
+        self.items: dict[str, int] = {}
+
+    @contextmanager
+    def section(self, name: str, processed: int = 0):
+        if self.trace:
+            tracemalloc.reset_peak()
+            yield
+            self.results[name] = max(self.results.get(name, 0), tracemalloc.get_traced_memory()[1])
+            self.items[name] = self.items.get(name, 0) + processed
+        else:
+            start = time.perf_counter()
+            yield
+            self.add(name, time.perf_counter() - start, processed)
+
+    def add(self, name: str, seconds: float, processed: int = 0):
+        self.results[name] = self.results.get(name, 0) + seconds
+        self.items[name] = self.items.get(name, 0) + processed
+
+
+def __run_sections(count: int, recorder: SectionRecorder) -> str:
+    section = recorder.section
+    messages = generate_messages(count, start=datetime.datetime(YEAR, 1, 1),
+                                 mean_interval=365 * 24 * 60 * 60 / count * 0.99)
+
+    # ----------------------------------------- INGESTION ------------------------------------------ #
+    conn = setup_database()
+    while chunk := list(islice(messages, CHUNK_SIZE)):
+        with section('save_messages_to_db', len(chunk)):
+            save_messages_to_db(conn, chunk, verbose=False)
+    conn.close()
+
+    single = setup_database('single.db')
+    sample = list(generate_messages(SINGLE_WRITES, seed=7, start=datetime.datetime(YEAR, 1, 1)))
+    with section('save_message_to_db', len(sample)):
+        for msg in sample:
+            save_message_to_db(single, msg)
+    single.close()
+
+    # ----------------------------------------- LOADING ------------------------------------------ #
+    with section('get_messages_by_year', count):
+        legacy = get_messages_by_year(YEAR)
+    del legacy
+
+    with section('get_year_messages', count):
+        year_messages = get_year_messages(YEAR)
+
+    with section('classification', count):
+        for i in range(len(year_messages)):
+            year_messages.features(i)
+
+    conn = setup_database()
+    with conn:
+        save_message_features(conn, year_messages.computed_features)
+    conn.close()
+    del year_messages
+
+    with section('get_year_messages (cached features)', count):
+        year_messages = get_year_messages(YEAR)
+
+    # ----------------------------------------- AGGREGATION ------------------------------------------ #
+    data = new_analysis(YEAR)
+    partials = {}
+    aggregators = build_aggregators(YEAR, year_messages, partials=partials)
+    timings = {}
+    with section('aggregation', len(year_messages)):
+        run_aggregators(year_messages, aggregators, data, timings)
+    if not recorder.trace:
+        for name, seconds in timings.items():
+            recorder.add(f"  {name}", seconds, len(year_messages))
+
+    with section('stream_year_messages + aggregation', count):
+        streamed = YearMessages()
+        run_aggregators(streamed, build_aggregators(YEAR, streamed, partials={}), new_analysis(YEAR),
+                        rows=stream_year_messages(YEAR, streamed))
+    del streamed
+
+    checkpointed = resume_aggregators(YEAR, build_aggregators(YEAR, year_messages))
+    run_aggregators(year_messages, checkpointed, new_analysis(YEAR))
+    with connection() as conn:
+        save_checkpoints(conn, collect_checkpoints(YEAR, year_messages, checkpointed))
+    resumed_timings = {}
+    with section('aggregation (resumed state machines)', len(year_messages)):
+        run_aggregators(year_messages, resume_aggregators(YEAR, build_aggregators(YEAR, year_messages)),
+                        new_analysis(YEAR), resumed_timings)
+    if not recorder.trace:
+        for name in ('SENAggregator', 'BlockOutageAggregator'):
+            recorder.add(f"  {name} (resumed)", resumed_timings[name], len(year_messages))
+
+    # ----------------------------------------- WORDS ------------------------------------------ #
+    with section('words', len(year_messages)):
+        data.top25_most_repeated_words = get_top_words(YEAR, k=25)
+    with section('words (cached snapshots)', len(year_messages)):
+        get_top_words(YEAR, k=25)
+
+    # ----------------------------------------- ROLLUP ------------------------------------------ #
+    with section('save_partials'):
+        with connection() as conn:
+            save_partials(conn, YEAR, partials)
+    with section('rollup (stored partials)', len(year_messages)):
+        rollup_analysis()
+
+    # ----------------------------------------- EXPORT ------------------------------------------ #
+    with section('export v1'):
+        content_v1 = serialize_analysis(data, 1)
+    with section('export v2'):
+        content_v2 = serialize_analysis(data, 2)
+    with section('write_artifact'):
+        write_artifact(DATA_DIRECTORY, f"analysis_data_{YEAR}", content_v2)
+
+    return hashlib.sha256(content_v1).hexdigest()
+
+
+def __report(times: dict, items: dict, peaks: dict, baseline: dict | None):
+    print(f"{'section':<62} {'time':>9} {'msg/s':>11} {'peak':>10} {'vs base':>9}")
+    for name, seconds in times.items():
+        throughput = f"{items[name] / seconds:11.0f}" if items.get(name) and seconds else f"{'':>11}"
+        peak = f"{peaks[name] / 2 ** 20:8.1f}MB" if name in peaks else f"{'':>10}"
+        comparison = ""
+        if baseline is not None and baseline['time'].get(name):
+            ratio = seconds / baseline['time'][name]
+            comparison = f"x{ratio:.2f}" + (" ⚠️" if ratio > REGRESSION_THRESHOLD else "")
+        print(f"{name:<62} {seconds:8.3f}s {throughput} {peak} {comparison:>9}")
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    scale = args[0] if args else '10k'
+    run(SCALES.get(scale.lower()) or int(scale), save_baseline='--save-baseline' in sys.argv,
+        memory='--no-memory' not in sys.argv)
@@ -0,0 +1,71 @@
+"""
+Checkpointed sync of `core.scrapper` against `FakeTelegramClient`: interrupted and resumed backfill,
+incremental syncs and the API requests each one needs. Runs on a temporary database.
+
+Usage: python -m benchmarks.sync_checkpoint [messages]
+"""
+import os
+import sys
+import tempfile
+
+from tests.fakes import FakeTelegramClient
+from tests.synthetic import generate_messages
+from core.database import setup_database, close_databases, get_sync_state, get_last_message_id
+from core.scrapper import process_all_messages, process_latest_messages, BACKFILL_CHECKPOINT, REFRESH_WINDOW
+
+
+def __stored_messages() -> int:
+    conn = setup_database()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def __checkpoint() -> int | None:
+    conn = setup_database()
+    try:
+        return get_sync_state(conn, BACKFILL_CHECKPOINT)
+    finally:
+        conn.close()
+
+
+def run(count: int = 5000):
+    archive = list(generate_messages(count + REFRESH_WINDOW * 5))
+    history, new_posts = archive[:count], archive[count:]
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            client = FakeTelegramClient(history, fail_after=count // 2)
+            try:
+                process_all_messages(client)
+            except ConnectionError as e:
+                print(f"⚠️ Backfill interrupted: {e}")
+            checkpoint = __checkpoint()
+            print(f"Stored {__stored_messages()} messages, checkpoint at message {checkpoint}, {client.requests} requests")
+
+            client = FakeTelegramClient(history)
+            process_all_messages(client)
+            assert __stored_messages() == count and __checkpoint() is None
+            print(f"✅ Backfill resumed: {client.requests} requests (a restart would need {count // 100})")
+
+            client = FakeTelegramClient(history + new_posts[:10])
+            process_latest_messages(client)
+            print(f"✅ Sync with 10 new messages: {client.requests} requests")
+
+            client = FakeTelegramClient(archive)
+            process_latest_messages(client)
+            conn = setup_database()
+            assert __stored_messages() == len(archive) and get_last_message_id(conn) == archive[-1].id
+            conn.close()
+            print(f"✅ Sync with {len(new_posts) - 10} new messages (more than the refresh window): "
+                  f"{client.requests} requests, no gaps")
+        finally:
+            close_databases()
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
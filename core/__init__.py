@@ -1,12 +1,31 @@
-from core.analyzer import analyze_data
+import importlib
+
+from core.analyzer import analyze_data, analyze_years
 from core.classes import TelegramMessage, TelegramMessageWithCount, UneAnalysis, SENAnalysis, BlockAnalysis, SENFailureAnalysisEvent
-from core.database import get_year_range, setup_database, save_message_to_db, get_messages_by_year
-from core.scrapper import process_latest_messages, process_all_messages
-from core.session_manager import session_generator
+from core.database import get_year_range, setup_database, save_message_to_db, save_messages_to_db, get_messages_by_year, \
+    get_dirty_years, clear_dirty_year
+
+# Telegram modules (and Telethon) are only imported on first use, so analysis-only runs start fast and offline
+__lazy_attributes = {
+    'process_latest_messages': 'core.scrapper',
+    'process_all_messages': 'core.scrapper',
+    'process_all_messages_concurrently': 'core.scrapper',
+    'tail_messages': 'core.scrapper',
+    'session_generator': 'core.session_manager',
+}
 
 __all__ = [
     'analyze_data',
+    'analyze_years',
     'get_year_range',
+    'get_dirty_years',
+    'clear_dirty_year',
     'process_latest_messages',
     'process_all_messages',
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name: str):
+    if name in __lazy_attributes:
+        return getattr(importlib.import_module(__lazy_attributes[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
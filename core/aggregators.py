@@ -0,0 +1,509 @@
+import time
+from array import array
+from collections import Counter
+from dataclasses import fields
+from typing import Callable, Iterable
+
+from core.classes import UneAnalysis, TelegramMessage, TelegramMessageWithCount, SENFailureAnalysisEvent, MessageRow, \
+    MessageFeatures, Ranking
+from core.columnar import YearMessages
+from core.ranking import TopK
+from core.timebuckets import YearCalendar, split_interval, DAY_SECONDS, HOUR_SECONDS
+from core.constants import POSITIVE_EMOJIS, NEGATIVE_EMOJIS, BLOCK_COUNT, MAX_BLOCK_DURATION_SECONDS
+
+
+class Aggregator:
+    """
+    Base reducer of the analysis pipeline.
+
+    Every aggregator consumes each message exactly once (in date order) through `consume`
+    and writes its metrics into the `UneAnalysis` object on `finalize`.
+    """
+
+    def consume(self, m: MessageRow, features: MessageFeatures):
+        """
+        Consumes one message.
+
+        :param m: the `MessageRow` view of the message
+        :param features: classification of the message (see `core.features`)
+        """
+        raise NotImplementedError
+
+    def finalize(self, data: UneAnalysis):
+        """
+        Writes the accumulated metrics into the analysis.
+
+        :param data: the `UneAnalysis` object
+        """
+        raise NotImplementedError
+
+    def state(self) -> dict:
+        """
+        JSON serializable state after the consumed messages, to resume the aggregator later with `restore`.
+        Only implemented by the state machines that are checkpointed (see `core.checkpoints`).
+        """
+        raise NotImplementedError
+
+    def restore(self, state: dict):
+        """
+        Restores a `state`, as if the messages it was taken after had been consumed.
+        """
+        raise NotImplementedError
+
+    @property
+    def name(self) -> str:
+        """
+        Name of the aggregator in timings and logs.
+        """
+        return type(self).__name__
+
+
+def run_aggregators(messages: YearMessages, aggregators: list[Aggregator], data: UneAnalysis,
+                    timings: dict[str, float] | None = None, rows: Iterable[MessageRow] | None = None):
+    """
+    Feeds every message once to all the aggregators and finalizes them in order.
+
+    :param messages: the `YearMessages` container
+    :param aggregators: list of `Aggregator` objects
+    :param data: the `UneAnalysis` object to fill
+    :param timings: if given, filled with the seconds spent by every aggregator (by name) and by the rows and
+        features themselves (`rows`). Timing each call has its own overhead, so it is opt-in
+    :param rows: the rows of `messages` (default: `messages.rows()`), e.g. a `core.columnar.stream_year_messages`
+        stream that fills `messages` while it is consumed
+    """
+    rows = messages.rows() if rows is None else rows
+    if timings is not None:
+        return __run_timed_aggregators(messages, aggregators, data, timings, rows)
+
+    consume_rows(messages, aggregators, rows)
+    for aggregator in aggregators:
+        aggregator.finalize(data)
+
+
+def consume_rows(messages: YearMessages, aggregators: list[Aggregator], rows: Iterable[MessageRow]) -> int:
+    """
+    Feeds every message once to all the aggregators, without finalizing them (so they can keep consuming
+    messages later, see `core.live`).
+
+    :param messages: the `YearMessages` container
+    :param aggregators: list of `Aggregator` objects
+    :param rows: the rows of `messages` to consume, in date order
+    :return: number of consumed messages
+    """
+    consumers = [aggregator.consume for aggregator in aggregators]
+
+    count = 0
+    for m in rows:
+        features = messages.features(m.index, m.text)
+        for consume in consumers:
+            consume(m, features)
+        count += 1
+    return count
+
+
+def __run_timed_aggregators(messages, aggregators, data, timings, rows):
+    names = [aggregator.name for aggregator in aggregators]
+    timings['rows'] = timings.get('rows', 0.0)
+    for name in names:
+        timings[name] = timings.get(name, 0.0)
+    clock = time.perf_counter
+
+    start = clock()
+    for m in rows:
+        features = messages.features(m.index, m.text)
+        timings['rows'] += clock() - start
+        for name, aggregator in zip(names, aggregators):
+            start = clock()
+            aggregator.consume(m, features)
+            timings[name] += clock() - start
+        start = clock()
+
+    for name, aggregator in zip(names, aggregators):
+        start = clock()
+        aggregator.finalize(data)
+        timings[name] += clock() - start
+
+
+# ------------------------------------ GENERAL INFORMATION --------------------------------- #
+class GeneralInformationAggregator(Aggregator):
+    """
+    First and last messages with text (the shortest and longest ones are rankings, see `RankingAggregator`).
+    """
+
+    def __init__(self, messages: YearMessages):
+        self.messages = messages
+        self.first = None
+        self.last = None
+
+    def consume(self, m, features):
+        if not m.text:
+            return
+
+        if self.first is None:
+            self.first = m.index
+        self.last = m.index
+
+    def finalize(self, data):
+        data.first_message = self.messages.message(self.first)
+        data.last_message = self.messages.message(self.last)
+
+
+# ------------------------------------------ TOTALS & AVGs --------------------------------------- #
+class TotalsAggregator(Aggregator):
+    """
+    Totals and averages of views, replies, reactions and text length.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.views = 0
+        self.replies = 0
+        self.reactions = 0
+        self.positive = 0
+        self.negative = 0
+        self.text_length = 0
+        self.first_id = None
+        self.last_id = None
+
+    def consume(self, m, features):
+        if self.first_id is None:
+            self.first_id = m.id
+        self.last_id = m.id
+
+        self.messages += 1
+        self.views += m.views
+        self.replies += m.replies
+        self.text_length += len(m.text)
+
+        for emoji, count in m.reactions.items():
+            self.reactions += count
+            if emoji in POSITIVE_EMOJIS:
+                self.positive += count
+            elif emoji in NEGATIVE_EMOJIS:
+                self.negative += count
+
+    def finalize(self, data):
+        n = self.messages
+
+        data.total_messages = n
+        data.total_views = self.views
+        data.total_replies = self.replies
+        data.total_reactions = self.reactions
+        data.total_erased_messages = (self.last_id - self.first_id + 1) - n
+        data.total_positive_reactions = self.positive
+        data.total_negative_reactions = self.negative
+
+        data.avg_views = round(self.views / n)
+        data.avg_replies = round(self.replies / n)
+        data.avg_reactions = round(self.reactions / n)
+        data.avg_positive_reactions = round(self.positive / n)
+        data.avg_negative_reactions = round(self.negative / n)
+        data.avg_text_length = round(self.text_length / n)
+
+
+# ----------------------------------------- DATES ----------------------------------------------- #
+class DatesAggregator(Aggregator):
+    """
+    Monthly views, replies, reactions and messages, and daily messages.
+    """
+
+    def __init__(self, year: int):
+        self.calendar = YearCalendar(year)
+        self.monthly_views = {i: 0 for i in range(1, 13)}
+        self.monthly_replies = {i: 0 for i in range(1, 13)}
+        self.monthly_reactions = {i: 0 for i in range(1, 13)}
+        self.monthly_messages = {i: 0 for i in range(1, 13)}
+        self.daily_messages = {i: 0 for i in range(1, 367)}
+
+    def consume(self, m, features):
+        day = self.calendar.day_index(m.date_cuba_ts)
+        month = self.calendar.months[day]
+        self.monthly_messages[month] += 1
+        self.monthly_views[month] += m.views
+        self.monthly_replies[month] += m.replies
+        self.monthly_reactions[month] += sum(m.reactions.values())
+        self.daily_messages[day + 1] += 1
+
+    def finalize(self, data):
+        data.monthly_views = self.monthly_views
+        data.monthly_replies = self.monthly_replies
+        data.monthly_reactions = self.monthly_reactions
+        data.monthly_messages = self.monthly_messages
+        data.daily_messages = self.daily_messages
+
+
+# ---------------------------------------- DISTRIBUTIONS ---------------------------------------- #
+class ReactionDistributionAggregator(Aggregator):
+    """
+    Total count of each reaction emoji.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def consume(self, m, features):
+        self.counts.update(m.reactions)
+
+    def finalize(self, data):
+        data.distribution_reaction = dict(sorted(self.counts.items(), key=lambda item: item[1], reverse=True))
+
+
+class MessageTypeAggregator(Aggregator):
+    """
+    Classification of messages according to `MessageType`.
+    """
+
+    def __init__(self):
+        self.distribution = {mt: 0 for mt in [1, 2, 3, 4, 5]}
+
+    def consume(self, m, features):
+        self.distribution[features.message_type] += 1
+
+    def finalize(self, data):
+        data.distribution_message = self.distribution
+
+
+# ---------------------------------------------- TOPs ------------------------------------------- #
+class RankingAggregator(Aggregator):
+    """
+    Every message ranking (top viewed, replied, reacted, shortest, longest...) of messages with text, in one pass
+    with a bounded heap per ranking (see `core.ranking.TopK`), so no ranking sorts the messages.
+    """
+
+    def __init__(self, messages: YearMessages, rankings: list[Ranking]):
+        self.messages = messages
+        self.rankings = rankings
+        self.scorers = [(ranking.score, TopK(ranking.k, ranking.lowest, ranking.latest_on_ties)) for ranking in rankings]
+
+    def consume(self, m, features):
+        if not m.text:
+            return
+
+        for score, top in self.scorers:
+            top.push(score(m), m.index)
+
+    def finalize(self, data):
+        for ranking, (_, top) in zip(self.rankings, self.scorers):
+            ranked = [to_msg_count(self.messages.message(index), score) for score, index in top.ranked()]
+            setattr(data, ranking.field_name, (ranked[0] if ranked else None) if ranking.single else ranked)
+
+
+# --------------------------------------------- EXTRA ANALYSIS ------------------------------------ #
+# ------------------------ BLOCKS -------------------- #
+class BlockDeclarationsAggregator(Aggregator):
+    """
+    Mentions, declared recoveries, affectations and emergencies of each block.
+    """
+
+    def __init__(self):
+        self.mentions = Counter()
+        self.recoveries = Counter()
+        self.affectations = Counter()
+        self.emergencies = Counter()
+
+    def consume(self, m, features):
+        blocks = features.blocks
+        self.mentions.update(blocks.mentioned)
+        self.recoveries.update(blocks.recovered)
+        self.affectations.update(blocks.affected)
+        self.emergencies.update(blocks.emergencies)
+
+    def finalize(self, data):
+        for block in data.blocks_analysis:
+            block.mentions = self.mentions[block.number]
+            block.declared_recoveries = self.recoveries[block.number]
+            block.declared_affectations = self.affectations[block.number]
+            block.declared_emergencies = self.emergencies[block.number]
+
+
+# ------------------------ SEN ------------------------ #
+class SENAggregator(Aggregator):
+    """
+    SEN mentions and SEN failure events (from disconnection to 100 % recovery).
+    """
+
+    def __init__(self, messages: YearMessages):
+        self.messages = messages
+        self.mentions = 0
+        self.current_start = None
+        self.events = []
+
+    def consume(self, m, features):
+        if features.sen_mention:
+            self.mentions += 1
+
+        if self.current_start is None:
+            if features.sen_failure_start:
+                self.current_start = m.index
+        elif features.sen_failure_end:
+            self.events.append((self.current_start, m.index))
+            self.current_start = None
+
+    def finalize(self, data):
+        events = []
+        for start, end in self.events:
+            start_message = self.messages.message(start)
+            end_message = self.messages.message(end)
+            duration = (end_message.date_cuba_d - start_message.date_cuba_d).total_seconds()
+            events.append(SENFailureAnalysisEvent(
+                start_date=start_message.date_cuba,
+                start_date_d=start_message.date_cuba_d,
+                start_message=start_message,
+                end_date=end_message.date_cuba,
+                end_date_d=end_message.date_cuba_d,
+                end_message=end_message,
+                estimated_duration_seconds=int(duration)
+            ))
+
+        data.sen_analysis.mentions = self.mentions
+        data.sen_analysis.total_failure_events = len(events)
+        data.sen_analysis.failure_events = events
+
+    def state(self):
+        return {"mentions": self.mentions, "current_start": self.current_start, "events": list(self.events)}
+
+    def restore(self, state):
+        self.mentions = state["mentions"]
+        self.current_start = state["current_start"]
+        self.events = [tuple(event) for event in state["events"]]
+
+
+# ------------------------ BLOCKS - ESTIMATED AFFECTED SECONDS -------------------- #
+class BlockOutageAggregator(Aggregator):
+    """
+    Block state machine that estimates the affected seconds of each block (total, by weekday and by hour of day).
+
+    Times are `date_cuba_ts` epoch seconds, and the off intervals are split in per-day and per-hour buckets
+    of the year (see `core.timebuckets`), folded by month, weekday and hour of day on finalize.
+    """
+
+    def __init__(self, year: int):
+        self.calendar = YearCalendar(year)
+        self.block_day_off = {i: self.calendar.day_buckets() for i in range(1, BLOCK_COUNT + 1)}
+        self.block_hour_off = {i: self.calendar.hour_buckets() for i in range(1, BLOCK_COUNT + 1)}
+        self.block_monthly_off = {}
+        self.block_weekday_off = {}
+        self.block_states = {
+            i: {
+                "active": False,
+                "start": None,
+                "accumulated": 0
+            }
+            for i in range(1, BLOCK_COUNT + 1)
+        }
+        self.sen_active = False
+        self.last_date = None
+        self.weekday_counts = self.calendar.weekday_counts()
+
+    def consume(self, m, features):
+        self.last_date = m.date_cuba_ts
+        if not m.text:
+            return
+
+        t = m.date_cuba_ts
+
+        blocks = features.blocks
+        listed_blocks = blocks.listed
+        is_list_message = bool(listed_blocks)
+
+        if features.sen_failure_start:
+            self.sen_active = True
+            for i in range(1, BLOCK_COUNT + 1):
+                if self.block_states[i]["active"]:
+                    self.__close_block(i, t)
+            return
+
+        if features.sen_failure_end and self.sen_active:
+            self.sen_active = False
+            return
+
+        for i in range(1, BLOCK_COUNT + 1):
+            self.__apply_block_safety_timeout(i, t)
+
+        for i in range(1, BLOCK_COUNT + 1):
+            state = self.block_states[i]
+
+            if not state["active"] and i in blocks.started:
+                state["active"] = True
+                state["start"] = t
+                continue
+
+            if not state["active"] and is_list_message and i in listed_blocks:
+                state["active"] = True
+                state["start"] = t
+                continue
+
+            if state["active"] and i in blocks.ended:
+                self.__close_block(i, t)
+                continue
+
+            if state["active"] and is_list_message and i not in listed_blocks:
+                self.__close_block(i, t)
+
+    def finalize(self, data):
+        last_date = self.last_date
+
+        for i in range(1, BLOCK_COUNT + 1):
+            state = self.block_states[i]
+            if state["active"] and state["start"] is not None and last_date is not None:
+                self.__accumulate_block_off(i, state["start"], last_date)
+                state["accumulated"] += last_date - state["start"]
+
+        for i in range(1, BLOCK_COUNT + 1):
+            self.block_monthly_off[i] = self.calendar.fold_by_month(self.block_day_off[i])
+            self.block_weekday_off[i] = self.calendar.fold_by_weekday(self.block_day_off[i])
+
+            block = data.blocks_analysis[i - 1]
+            block.weekday_off_seconds = self.block_weekday_off[i]
+            block.weekday_off_avg_seconds = {
+                d: (
+                    self.block_weekday_off[i][d] / self.weekday_counts[d]
+                    if self.weekday_counts[d] > 0 else 0
+                )
+                for d in range(7)
+            }
+            block.hourly_off_seconds = self.calendar.fold_by_hour(self.block_hour_off[i])
+            block.estimated_affected_seconds = self.block_states[i]["accumulated"]
+
+    def state(self):
+        return {
+            "block_states": {i: dict(block_state) for i, block_state in self.block_states.items()},
+            "sen_active": self.sen_active,
+            "last_date": self.last_date,
+            "block_day_off": {i: buckets.tolist() for i, buckets in self.block_day_off.items()},
+            "block_hour_off": {i: buckets.tolist() for i, buckets in self.block_hour_off.items()},
+        }
+
+    def restore(self, state):
+        self.block_states = {int(i): dict(block_state) for i, block_state in state["block_states"].items()}
+        self.sen_active = state["sen_active"]
+        self.last_date = state["last_date"]
+        self.block_day_off = {int(i): array('q', buckets) for i, buckets in state["block_day_off"].items()}
+        self.block_hour_off = {int(i): array('q', buckets) for i, buckets in state["block_hour_off"].items()}
+
+    def __close_block(self, block: int, t: int):
+        state = self.block_states[block]
+        self.__accumulate_block_off(block, state["start"], t)
+        state["accumulated"] += t - state["start"]
+        state["active"] = False
+        state["start"] = None
+
+    def __accumulate_block_off(self, block: int, start: int, end: int):
+        split_interval(start, end, DAY_SECONDS, self.block_day_off[block], self.calendar.start)
+        split_interval(start, end, HOUR_SECONDS, self.block_hour_off[block], self.calendar.start)
+
+    def __apply_block_safety_timeout(self, block: int, current_time: int):
+        state = self.block_states[block]
+        if state["active"] and state["start"] is not None:
+            elapsed = current_time - state["start"]
+            if elapsed >= MAX_BLOCK_DURATION_SECONDS:
+                end_time = state["start"] + MAX_BLOCK_DURATION_SECONDS
+                self.__accumulate_block_off(block, state["start"], end_time)
+                state["accumulated"] += MAX_BLOCK_DURATION_SECONDS
+                state["active"] = False
+                state["start"] = None
+
+
+# ----------------------------------------------- HELPERS ------------------------------------------- #
+def to_msg_count(m: TelegramMessage, count_value: int) -> TelegramMessageWithCount:
+    return TelegramMessageWithCount(**{f.name: getattr(m, f.name) for f in fields(m)}, count=count_value)
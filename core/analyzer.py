@@ -1,452 +1,402 @@
 import datetime
-import calendar
 import json
-from core.classes import UneAnalysis, TelegramMessageWithCount, TelegramMessage, SENAnalysis, SENFailureAnalysisEvent, \
-    BlockAnalysis
-from core.database import get_messages_by_year
-from dataclasses import asdict
-from collections import Counter
+import os
 import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from core.aggregators import Aggregator, run_aggregators, GeneralInformationAggregator, TotalsAggregator, DatesAggregator, \
+    ReactionDistributionAggregator, MessageTypeAggregator, RankingAggregator, BlockDeclarationsAggregator, SENAggregator, BlockOutageAggregator
+from core.classes import UneAnalysis, SENAnalysis, BlockAnalysis, Ranking
+from core.constants import POSITIVE_EMOJIS, NEGATIVE_EMOJIS, BLOCK_COUNT
+from core.columnar import YearMessages, stream_year_messages
+from core.database import connection, get_messages_by_ids
+from core.checkpoints import resume_aggregators, collect_checkpoints, save_checkpoints
+from core.features import refresh_message_features, save_message_features
+from core.partials import AnalysisPartial, PartialsAggregator, save_partials, load_partials, stale_partial_years
+from core.profiling import profile_year, start_run
+from core.words import get_top_words, refresh_token_counts, load_token_counts, merge_token_counts
+from dataclasses import asdict
 from zoneinfo import ZoneInfo
 
-from core.serializers import UneAnalysisEncoder
-
-POSITIVE_EMOJIS = {'👍', '👏', '😁', '❤', '🙏'}
-NEGATIVE_EMOJIS = {'👎', '🤬', '😱', '😢'}
-STOP_WORDS = {
-    'el','la','los','las','un','una','unos','unas',
-    'de','del','al','a','en','por','para','con','sin','sobre','entre',
-    'y','o','u','que','como','cuando','donde','cuanto','quien','cual',
-    'yo','tú','él','ella','nosotros','vosotros','ellos','ellas',
-    'me','te','se','nos','os','lo','le','les',
-    'mi','tu','su','sus','nuestro','nuestra','vuestro','vuestra',
-    'es','son','fue','eran','ser','estar','está','están','hay','había',
-    'porque','pero','si','no','sí','ya','muy','más','menos','también',
-    'todo','nada','algo','cada','cualquier','ninguno','ninguna',
-    'este','esta','estos','estas','ese','esa','esos','esas',
-    'entonces','pues','aunque','además','solo','solamente','mismo','misma',
-    'ahí','aquí','allí','allá','hacia','desde','hasta','dentro','fuera',
-    'bien','mal','ahora','antes','después','luego','siempre','nunca',
-    'encuentran', 'todos', 'encuentra', 'estén', 'pm', 'san'
-}
-SEN_PATTERNS = [
-    "sen", "sistema electrico nacional", "sistema eléctrico nacional",
-    "sistema electroenergetico nacional", "sistema electroenergético nacional"
-]
-START_FAILURE_TRIGGER = "desconexión del sistema electroenergético nacional"
-END_FAILURE_TRIGGER = "100 %"
-
-BLOCK_COUNT = 6
-
-BLOCK_START_PATTERNS = [
-    r"(afect|déficit|fuera).*bloque\s*(no\.?|nº)?\s*{i}",
-    r"bloque\s*(no\.?|nº)?\s*{i}.*(afect|déficit|fuera)",
-]
-
-BLOCK_END_PATTERNS = [
-    r"(restablec|recuper|normaliz|cierra).*bloque\s*(no\.?|nº)?\s*{i}"
-]
-
-BLOCK_LIST_PATTERN = re.compile(r"bloques?:?\s*([1-6,\s]+)", re.IGNORECASE)
-
-MAX_BLOCK_DURATION_SECONDS = 24 * 60 * 60
-
-def analyze_data(year: int):
+from core.artifacts import write_artifact, write_manifest, write_status, STATUS_FILENAME
+from core.serializers import UneAnalysisEncoder, to_compact_dict, compact_legacy_dict, without_volatile_fields
+
+EXPORT_FORMAT_VERSION = 2
+DATA_DIRECTORY = "./app/public/data"
+TOP_K = 3
+
+def analyze_years(years: list[int], workers: int | None = None,
+                  export_version: int = EXPORT_FORMAT_VERSION) -> list[UneAnalysis]:
+    """
+    Analyze several years in parallel (one process per year, up to `workers`), exporting each one to JSON.
+
+    Each worker reads the database through its own read-only connection, so the output is the same as
+    calling `analyze_data` for every year. Stale message features and word count snapshots are refreshed before
+    (see `core.features` and `core.words`), and the month partials and state machine checkpoints of each year are
+    stored by this process.
+    The all-time analysis is merged from the partials of every year (see `export_rollup`), and the manifest and
+    status are written once, after every year is exported.
+    :param years: years to analyze
+    :param workers: maximum number of processes (default: number of CPUs). With 1, years are analyzed serially
+    :param export_version: JSON export format (see `analyze_data`)
+    :return: list of `UneAnalysis` objects in the same order as `years`
+    """
+    start_run()
+    workers = min(workers or os.cpu_count() or 1, len(years))
+    if workers <= 1:
+        results = [analyze_data(year, export_version=export_version, update_manifest=False) for year in years]
+    else:
+        with connection() as conn:
+            for year in years:
+                refresh_message_features(conn, year)
+                refresh_token_counts(conn, year)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            analyses = list(executor.map(partial(__analyze_year_state, export_version=export_version), years))
+
+        results = []
+        with connection() as conn:
+            for year, (data, partials, checkpoints) in zip(years, analyses):
+                save_partials(conn, year, partials)
+                save_checkpoints(conn, checkpoints)
+                results.append(data)
+
+    export_rollup(export_version, trust_stored=True)
+    write_manifest(DATA_DIRECTORY)
+    write_status(DATA_DIRECTORY, datetime.datetime.now(ZoneInfo("America/Havana")))
+    return results
+
+
+def analyze_data(year: int, read_only: bool = False, export_version: int = EXPORT_FORMAT_VERSION,
+                 update_manifest: bool = True, partials: dict[int, AnalysisPartial] | None = None,
+                 checkpoints: list[tuple] | None = None) -> UneAnalysis:
     """
-    Analyze the UNE data for UNE-Unwrapped project and exports it to JSON on root path
+    Analyze the UNE data for UNE-Unwrapped project and exports it to JSON on root path.
+
+    Every metric is computed by an `Aggregator` (see `core.aggregators`), so the messages are traversed only once,
+    while they are streamed from the database (see `core.columnar.stream_year_messages`).
+    Messages are only classified if their cached features are missing or stale, and the new ones are stored
+    (unless `read_only`), as well as the month partials of the year (see `core.partials`). The block and SEN state
+    machines resume from their checkpoint, and only consume the messages after it (see `core.checkpoints`).
+    Each step runs in a named span (see `core.profiling`: wall and CPU time, messages and memory, logged as JSON lines with
+    `UNE_PERF_LOG`, and a cProfile dump with `UNE_PROFILE`).
     :param year: The current year
-    :return:
+    :param read_only: read the messages through a read-only connection
+    :param export_version: JSON export format: 2 (minified, messages referenced by id, see
+        `core.serializers.to_compact_dict`) or 1 (indented, messages embedded)
+    :param update_manifest: rewrite the all-time analysis (see `export_rollup`), the data manifest and status after
+        the export (see `core.artifacts`)
+    :param partials: dict to fill with the month partials instead of storing them
+    :param checkpoints: list to fill with the state machine checkpoints instead of storing them
+    :return: the `UneAnalysis` object
     """
-    messages = get_messages_by_year(year)
-    messages.sort(key=lambda message: message.date_cuba)
-    messages_with_text = [m for m in messages if m.text]
-    data = UneAnalysis()
+    with profile_year(year) as spans:
+        messages = YearMessages()
+        data = new_analysis(year)
+        month_partials = {} if partials is None else partials
+
+        # ----------------------------------------- AGGREGATION ------------------------------------------ #
+        with spans.span('aggregate') as span:
+            timings = {} if spans.enabled else None
+            aggregators = resume_aggregators(year, build_aggregators(year, messages, partials=month_partials),
+                                             read_only=read_only)
+            run_aggregators(messages, aggregators, data, timings,
+                            rows=stream_year_messages(year, messages, read_only=read_only))
+            span['messages'] = len(messages)
+            for name, seconds in (timings or {}).items():
+                spans.add(f"aggregate/{name}", seconds, len(messages))
+        if messages.computed_features and not read_only:
+            with spans.span('save_features', len(messages.computed_features)):
+                __save_computed_features(messages)
+        year_checkpoints = collect_checkpoints(year, messages, aggregators)
+        if checkpoints is not None:
+            checkpoints.extend(year_checkpoints)
+        if not read_only and (partials is None or checkpoints is None):
+            with spans.span('save_state', len(messages)):
+                with connection() as conn:
+                    if partials is None:
+                        save_partials(conn, year, month_partials)
+                    if checkpoints is None:
+                        save_checkpoints(conn, year_checkpoints)
+
+        # ----------------------------------------------- WORDS ------------------------------------------- #
+        with spans.span('words', len(messages)):
+            data.top25_most_repeated_words = get_top_words(year, k=25, read_only=read_only)
+
+        # ----------------------------------------------- EXPORT ------------------------------------------- #
+        with spans.span('export'):
+            export_analysis_to_json(data, export_version)
+        if update_manifest:
+            with spans.span('rollup'):
+                export_rollup(export_version, trust_stored=True)
+            with spans.span('manifest'):
+                write_manifest(DATA_DIRECTORY)
+                write_status(DATA_DIRECTORY, data.sync_date)
+    return data
+
+
+def rollup_analysis(years: list[int] | None = None, read_only: bool = False,
+                    trust_stored: bool = False) -> UneAnalysis:
+    """
+    Analysis of several years (every year on the database by default) merged from their month partials (see
+    `core.partials`), instead of analyzing their messages again. Years whose partials are missing or stale are
+    aggregated first, and their partials stored (unless `read_only`).
+
+    Checking that the partials and word count snapshots are up to date reads every message of the archive. With
+    `trust_stored`, the stored ones are used as they are and only the years without partials are read: they are
+    stored together by every analysis, and `core.database.save_messages_to_db` removes the partials of every year
+    it changes, so that is enough right after analyzing the changed years.
+
+    Block seconds and SEN events are the ones of each year analysis (the state machines start again every year).
+    The monthly and daily fields add up the same month / day of every year, and `year` is 0.
+    :param years: years to merge
+    :param read_only: use read-only connections (stale partials are computed but not stored)
+    :param trust_stored: only check the years without stored partials against their messages
+    :return: the `UneAnalysis` object
+    """
+    return merge_rollup(*load_rollup(years, read_only, trust_stored), read_only=read_only)
 
-    # ------------------------------------ GENERAL INFORMATION --------------------------------- #
-    data.sync_date = datetime.datetime.now(ZoneInfo("America/Havana"))
-    data.year = year
-    data.first_message = messages_with_text[0]
-    data.last_message = messages_with_text[-1]
-    data.shortest_message = TelegramMessageWithCount(**asdict(m := min(messages_with_text, key=lambda x: len(x.text))),
-                                                     count=len(m.text))
-    data.longest_message = TelegramMessageWithCount(**asdict(m := max(messages_with_text, key=lambda x: len(x.text))),
-                                                    count=len(m.text))
-
-    # ------------------------------------------ TOTALS --------------------------------------- #
-    data.total_messages = len(messages)
-    data.total_views = sum(m.views for m in messages)
-    data.total_replies = sum(m.replies for m in messages)
-    data.total_reactions = sum(sum(m.reactions.values()) for m in messages)
-    data.total_erased_messages = (messages[-1].id - messages[0].id + 1) - len(messages)
-    data.total_positive_reactions = sum(
-        sum(count for emoji, count in m.reactions.items() if emoji in POSITIVE_EMOJIS) for m in messages)
-    data.total_negative_reactions = sum(
-        sum(count for emoji, count in m.reactions.items() if emoji in NEGATIVE_EMOJIS) for m in messages)
-
-    # ------------------------------------------- AVGs ------------------------------------------- #
-    total_v, total_rep, total_react, total_pos, total_neg, total_len = 0, 0, 0, 0, 0, 0
-    n = len(messages)
-
-    for m in messages:
-        total_v += m.views
-        total_rep += m.replies
-        total_len += len(m.text)
-
-        for emoji, count in m.reactions.items():
-            total_react += count
-            if emoji in POSITIVE_EMOJIS:
-                total_pos += count
-            elif emoji in NEGATIVE_EMOJIS:
-                total_neg += count
-
-    data.avg_views = round(total_v / n)
-    data.avg_replies = round(total_rep / n)
-    data.avg_reactions = round(total_react / n)
-    data.avg_positive_reactions = round(total_pos / n)
-    data.avg_negative_reactions = round(total_neg / n)
-    data.avg_text_length = round(total_len / n)
-
-    # ----------------------------------------- DATES ----------------------------------------------- #
-    data.monthly_views = {i: 0 for i in range(1, 13)}
-    data.monthly_replies = {i: 0 for i in range(1, 13)}
-    data.monthly_reactions = {i: 0 for i in range(1, 13)}
-    data.monthly_messages = {i: 0 for i in range(1, 13)}
-    data.daily_messages = {i: 0 for i in range(1, 367)}
-    for m in messages:
-        if m.date_cuba_d:
-            month = m.date_cuba_d.month
-            data.monthly_messages[month] += 1
-            data.monthly_views[month] += m.views
-            data.monthly_replies[month] += m.replies
-            data.monthly_reactions[month] += sum(m.reactions.values())
-
-            week_number = m.date_cuba_d.isocalendar()[1]
-            day_of_year = m.date_cuba_d.timetuple().tm_yday
-            data.daily_messages[day_of_year] += 1
-
-            # ---------------------------------------- DISTRIBUTIONS ---------------------------------------- #
-    reac_counts = Counter()
-    for m in messages:
-        reac_counts.update(m.reactions)
-    data.distribution_reaction = dict(sorted(reac_counts.items(), key=lambda item: item[1], reverse=True))
-
-    data.distribution_message = {mt: 0 for mt in [1,2,3,4,5]}
-    re_blocks = re.compile(r'\b(bloque|b|bloque no\.?)[ \.#]*([1-6])', re.IGNORECASE)
-    for m in messages:
-        text_lower = (m.text or "").lower()
-        classified = False
-
-        if "disparado automático por frecuencia" in text_lower or "daf" in text_lower:
-            data.distribution_message[2] += 1
-            classified = True
-        elif "disparo del circuito" in text_lower or "averías primarias" in text_lower or "averías secundarias" in text_lower or "transformadores dañados" in text_lower:
-            data.distribution_message[3] += 1
-            classified = True
-        elif "en el día de ayer" in text_lower:
-            data.distribution_message[4] += 1
-            classified = True
-        elif re_blocks.search(text_lower):
-            data.distribution_message[5] += 1
-            classified = True
-        if not classified:
-            data.distribution_message[1] += 1
-
-    # ---------------------------------------------- TOPs ------------------------------------------- #
-    top_viewed = sorted(messages_with_text, key=lambda m: m.views, reverse=True)[:3]
-    data.top3_most_viewed_messages = [__to_msg_count(m, m.views) for m in top_viewed]
-
-    top_replied = sorted(messages_with_text, key=lambda m: m.replies, reverse=True)[:3]
-    data.top3_most_replied_messages = [__to_msg_count(m, m.replies) for m in top_replied]
-
-    top_pos = sorted(
-        messages_with_text,
-        key=lambda m: sum(count for emo, count in m.reactions.items() if emo in POSITIVE_EMOJIS),
-        reverse=True
-    )[:3]
-    data.top3_most_positive_reaction_messages = [
-        __to_msg_count(m, sum(count for emo, count in m.reactions.items() if emo in POSITIVE_EMOJIS))
-        for m in top_pos
-    ]
 
-    top_neg = sorted(
-        messages_with_text,
-        key=lambda m: sum(count for emo, count in m.reactions.items() if emo in NEGATIVE_EMOJIS),
-        reverse=True
-    )[:3]
-    data.top3_most_negative_reaction_messages = [
-        __to_msg_count(m, sum(count for emo, count in m.reactions.items() if emo in NEGATIVE_EMOJIS))
-        for m in top_neg
-    ]
+def load_rollup(years: list[int] | None = None, read_only: bool = False, trust_stored: bool = False) \
+        -> tuple[dict[tuple[int, int], AnalysisPartial], dict[tuple[int, int], dict[int, Counter]]]:
+    """
+    Month partials and word counts of several years, up to date (see `rollup_analysis`), to merge with
+    `merge_rollup`.
 
-    all_text = " ".join([m.text.lower() for m in messages if m.text])
-    words = re.findall(r'[a-záéíóúüñ]{2,}', all_text)
-    word_counts = Counter(word for word in words if word not in STOP_WORDS)
-    data.top25_most_repeated_words = dict(word_counts.most_common(25))
-
-    # --------------------------------------------- EXTRA ANALYSIS ------------------------------------ #
-    # ------------------------ BLOCKS -------------------- #
-    alert_emojis = r'[✅🚨‼️❗]'
-    data.blocks_analysis = [BlockAnalysis(number=i) for i in range(1, 7)]
-
-    def get_block_pattern(i):
-        return rf'(bloques?|no\.?|y|,|\s)[ \.#]*{i}'
-
-    for i in range(1, 7):
-        block_pattern = rf'(bloque|b|bloque no\.?)[ \.#]*{i}'
-        pattern_for_this_block = get_block_pattern(i)
-        re_mentions = re.compile(rf'{pattern_for_this_block}\b', re.IGNORECASE)
-        re_recovery = re.compile(rf'restablecimiento[\s\S]*?{pattern_for_this_block}', re.IGNORECASE)
-        re_exclusion = re.compile(rf'(bloque|b|no\.?)[ \.#]*{i}[\s\S]*?afectaci[oó]n', re.IGNORECASE)
-        block_idx = i - 1
-
-        for m in messages:
-            text_lower = (m.text or "").lower()
-
-            if re_mentions.search(text_lower):
-                data.blocks_analysis[block_idx].mentions += 1
-
-            if "restablecimiento" in text_lower:
-                if re_recovery.search(text_lower):
-                    if not re_exclusion.search(text_lower):
-                        data.blocks_analysis[block_idx].declared_recoveries += 1
-
-            if re.search(rf'{alert_emojis}[\s\S]*?{block_pattern}', text_lower):
-                data.blocks_analysis[block_idx].declared_affectations += 1
-                if re.search(rf'{alert_emojis}[\s\S]*?{block_pattern}[\s\S]*?emergencia', text_lower):
-                    data.blocks_analysis[block_idx].declared_emergencies += 1
-
-    # ------------------------ SEN ------------------------ #
-    # Inicializar SEN Analysis
-    data.sen_analysis = SENAnalysis()
-    current_event = None
-    all_events = []
-    mentions_count = 0
-
-    for m in messages:
-        text_lower = m.text.lower()
-
-        if any(pattern in text_lower for pattern in SEN_PATTERNS):
-            mentions_count += 1
-
-        if current_event is None:
-            if START_FAILURE_TRIGGER in text_lower:
-                current_event = SENFailureAnalysisEvent(
-                    start_date=m.date_cuba,
-                    start_date_d=m.date_cuba_d,
-                    start_message=m
-                )
+    :param years: years to load (default: every year)
+    :param read_only: use read-only connections (stale partials are computed but not stored)
+    :param trust_stored: only check the years without stored partials against their messages
+    :return: tuple (dict (year, month) -> `AnalysisPartial`, dict (year, month) -> n -> `Counter`)
+    """
+    rankings = build_rankings()
+    with connection(read_only) as conn:
+        monthly = load_partials(conn, rankings, years)
+        if trust_stored:
+            stored_years = {year for year, _ in monthly}
+            stale = stale_partial_years(conn, [year for year in __archive_years(conn, years)
+                                               if year not in stored_years])
         else:
-            if END_FAILURE_TRIGGER in text_lower:
-                current_event.end_date = m.date_cuba
-                current_event.end_date_d = m.date_cuba_d
-                current_event.end_message = m
-
-                if current_event.start_date_d and current_event.end_date_d:
-                    duration = (current_event.end_date_d - current_event.start_date_d).total_seconds()
-                    current_event.estimated_duration_seconds = int(duration)
-
-                all_events.append(current_event)
-                current_event = None
-
-    data.sen_analysis.mentions = mentions_count
-    data.sen_analysis.total_failure_events = len(all_events)
-    data.sen_analysis.failure_events = all_events
-
-    # ------------------------ BLOCKS - ESTIMATED AFFECTED SECONDS -------------------- #
-
-    block_monthly_off = {
-        i: {m: 0 for m in range(1, 13)}
-        for i in range(1, BLOCK_COUNT + 1)
-    }
-
-    block_weekday_off = {
-        i: {d: 0 for d in range(7)}
-        for i in range(1, BLOCK_COUNT + 1)
-    }
-
-    days_per_month = {
-        m: calendar.monthrange(year, m)[1]
-        for m in range(1, 13)
-    }
-
-    start_date = datetime.date(year, 1, 1)
-    total_days = 366 if calendar.isleap(year) else 365
-
-    weekday_counts = Counter(
-        (start_date + datetime.timedelta(days=i)).weekday()
-        for i in range(total_days)
-    )
-
-    def __accumulate_block_off(block: int, start: datetime.datetime, end: datetime.datetime):
-        daily_chunks = __distribute_seconds_by_day(start, end)
-
-        for day_dt, seconds in daily_chunks:
-            month = day_dt.month
-            weekday = day_dt.weekday()
-
-            block_monthly_off[block][month] += seconds
-            block_weekday_off[block][weekday] += seconds
-
-    def __apply_block_safety_timeout(state: dict, current_time: datetime.datetime, block_idx: int):
-        if state["active"] and state["start"]:
-            elapsed = (current_time - state["start"]).total_seconds()
-            if elapsed >= MAX_BLOCK_DURATION_SECONDS:
-                end_time = state["start"] + datetime.timedelta(seconds=MAX_BLOCK_DURATION_SECONDS)
-                __accumulate_block_off(block_idx, state["start"], end_time)
-                state["accumulated"] += MAX_BLOCK_DURATION_SECONDS
-                state["active"] = False
-                state["start"] = None
-                return True
-        return False
-
-    block_states = {
-        i: {
-            "active": False,
-            "start": None,
-            "accumulated": 0
-        }
-        for i in range(1, BLOCK_COUNT + 1)
-    }
-
-    sen_active = False
-
-    for m in messages:
-        if not m.date_cuba_d or not m.text:
-            continue
+            stale = stale_partial_years(conn, years)
+
+    for year in stale:
+        partials = __aggregate_partials(year, read_only)
+        monthly = {key: value for key, value in monthly.items() if key[0] != year}
+        monthly.update(((year, month), value) for month, value in partials.items())
+        if not read_only:
+            with connection() as conn:
+                save_partials(conn, year, partials)
+
+    words = {}
+    with connection(read_only) as conn:
+        for year in sorted({year for year, _ in monthly}):
+            counts = load_token_counts(conn, year) if trust_stored and year not in stale else None
+            if not counts:
+                counts = refresh_token_counts(conn, year, persist=not read_only)
+            words.update(((year, month), counters) for month, counters in counts.items())
+    return monthly, words
+
+
+def merge_rollup(monthly: dict[tuple[int, int], AnalysisPartial], words: dict[tuple[int, int], dict[int, Counter]],
+                 read_only: bool = False) -> UneAnalysis:
+    """
+    All-time analysis from month partials and word counts (see `load_rollup`), merged in date order. The partials
+    are not modified, so they can be merged again.
 
-        text = m.text.lower()
-        t: datetime.datetime = m.date_cuba_d
-
-        listed_blocks = __extract_blocks_from_list(text)
-        is_list_message = bool(listed_blocks)
-
-        if START_FAILURE_TRIGGER in text:
-            sen_active = True
-            for i in range(1, BLOCK_COUNT + 1):
-                state = block_states[i]
-                if state["active"]:
-                    __accumulate_block_off(i, state["start"], t)
-                    state["accumulated"] += int((t - state["start"]).total_seconds())
-                    state["active"] = False
-                    state["start"] = None
-            continue
+    :param monthly: dict (year, month) -> `AnalysisPartial`
+    :param words: dict (year, month) -> n -> `Counter`
+    :param read_only: read the referenced messages through a read-only connection
+    :return: the `UneAnalysis` object
+    """
+    rankings = build_rankings()
+    merged = AnalysisPartial(rankings)
+    for key in sorted(monthly):
+        merged.merge(monthly[key])
 
-        if END_FAILURE_TRIGGER in text and sen_active:
-            sen_active = False
-            continue
+    data = new_analysis(0)
+    merged.finalize(data, get_messages_by_ids(merged.message_ids(), read_only=read_only), rankings)
+    data.top25_most_repeated_words = dict(merge_token_counts([words[key] for key in sorted(words)]).most_common(25))
+    return data
 
-        for i in range(1, BLOCK_COUNT + 1):
-            __apply_block_safety_timeout(block_states[i], t, i)
-
-        for i in range(1, BLOCK_COUNT + 1):
-            state = block_states[i]
-
-            if not state["active"] and __block_start_detected(i, text):
-                state["active"] = True
-                state["start"] = t
-                continue
-
-            if not state["active"] and is_list_message and i in listed_blocks:
-                state["active"] = True
-                state["start"] = t
-                continue
-
-            if state["active"] and __block_end_detected(i, text):
-                __accumulate_block_off(i, state["start"], t)
-                state["accumulated"] += int((t - state["start"]).total_seconds())
-                state["active"] = False
-                state["start"] = None
-                continue
-
-            if state["active"] and is_list_message and i not in listed_blocks:
-                __accumulate_block_off(i, state["start"], t)
-                state["accumulated"] += int((t - state["start"]).total_seconds())
-                state["active"] = False
-                state["start"] = None
-
-    last_date = messages[-1].date_cuba_d
-
-    for i in range(1, BLOCK_COUNT + 1):
-        state = block_states[i]
-        if state["active"] and state["start"] and last_date:
-            __accumulate_block_off(i, state["start"], last_date)
-            state["accumulated"] += int((last_date - state["start"]).total_seconds())
-
-    for i in range(1, BLOCK_COUNT + 1):
-        block = data.blocks_analysis[i - 1]
-        block.weekday_off_seconds = block_weekday_off[i]
-        block.weekday_off_avg_seconds = {
-            d: (
-                block_weekday_off[i][d] / weekday_counts[d]
-                if weekday_counts[d] > 0 else 0
-            )
-            for d in range(7)
-        }
-        block.estimated_affected_seconds = (
-            block_states[i]["accumulated"]
-        )
-
-    # ----------------------------------------------- EXPORT ------------------------------------------- #
-    __export_analysis_to_json(data)
-
-
-def __export_analysis_to_json(analysis: UneAnalysis):
-    """
-    Serialize analysis to JSON to <analysis_data_%year%.json>
-    """
 
-    filename = f"./app/public/data/analysis_data_{analysis.year}.json"
+def export_rollup(export_version: int = EXPORT_FORMAT_VERSION, read_only: bool = False,
+                  trust_stored: bool = False, data: UneAnalysis | None = None) -> UneAnalysis:
+    """
+    Exports the all-time analysis (see `rollup_analysis`) to <analysis_data_all.%hash%.json>.
 
+    :param data: all-time analysis already merged (see `merge_rollup`), instead of computing it
+    """
+    data = data or rollup_analysis(read_only=read_only, trust_stored=trust_stored)
     try:
-        analysis_dict = asdict(analysis)
-
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(
-                analysis_dict,
-                f,
-                indent=4,
-                ensure_ascii=False,
-                cls=UneAnalysisEncoder
-            )
-        print(f"✅ Analysis exported successfully to {filename}")
+        filename = write_artifact(DATA_DIRECTORY, "analysis_data_all", serialize_analysis(data, export_version))
+        print(f"✅ All-time analysis exported successfully to {filename}")
 
     except Exception as e:
         print(f"❌ Error exporting to JSON: {e}")
+    return data
 
-def __to_msg_count(m: TelegramMessage, count_value: int) -> TelegramMessageWithCount:
-    return TelegramMessageWithCount(**asdict(m), count=count_value)
 
-def __extract_blocks_from_list(text: str) -> set[int]:
-    match = BLOCK_LIST_PATTERN.search(text)
-    if not match:
-        return set()
-    return {int(b) for b in re.findall(r"[1-6]", match.group(1))}
+def __archive_years(conn, years: list[int] | None = None) -> list[int]:
+    # First to last year of the archive, from the `date_cuba_ts` index
+    first, last = conn.execute('SELECT MIN(date_cuba_ts), MAX(date_cuba_ts) FROM messages').fetchone()
+    if first is None:
+        return []
+    return [year for year in range(time.gmtime(first).tm_year, time.gmtime(last).tm_year + 1)
+            if years is None or year in years]
 
 
-def __block_start_detected(block: int, text: str) -> bool:
-    for pattern in BLOCK_START_PATTERNS:
-        if re.search(pattern.format(i=block), text):
-            return True
-    return False
+def migrate_legacy_exports(export_version: int = EXPORT_FORMAT_VERSION) -> list[int]:
+    """
+    Republishes the analysis files exported before the content-hashed artifacts (<analysis_data_%year%.json>) as
+    artifacts of the given format, so every year is on the manifest even if it is not analyzed again. Their
+    `sync_date` goes to the status file (unless there is one already), and `write_artifact` removes them.
 
+    :param export_version: JSON export format (see `analyze_data`)
+    :return: migrated years
+    """
+    legacy_pattern = re.compile(r"analysis_data_(\d+)\.json")
+    migrated = []
+    sync_dates = []
+    for filename in sorted(os.listdir(DATA_DIRECTORY)):
+        match = legacy_pattern.fullmatch(filename)
+        if not match:
+            continue
 
-def __block_end_detected(block: int, text: str) -> bool:
-    for pattern in BLOCK_END_PATTERNS:
-        if re.search(pattern.format(i=block), text):
-            return True
-    return False
+        with open(os.path.join(DATA_DIRECTORY, filename), encoding='utf-8') as f:
+            analysis_dict = json.load(f)
+        if analysis_dict.get('sync_date'):
+            sync_dates.append(datetime.datetime.fromisoformat(analysis_dict['sync_date']))
+        if export_version == 1:
+            content = json.dumps(without_volatile_fields(analysis_dict), indent=4, ensure_ascii=False)
+        else:
+            content = json.dumps(compact_legacy_dict(analysis_dict), separators=(',', ':'), ensure_ascii=False)
+        write_artifact(DATA_DIRECTORY, f"analysis_data_{match.group(1)}", content.encode('utf-8'))
+        migrated.append(int(match.group(1)))
 
-def __distribute_seconds_by_day(start: datetime.datetime, end: datetime.datetime):
-    result = []
-    current = start
+    if migrated:
+        if sync_dates and not os.path.exists(os.path.join(DATA_DIRECTORY, STATUS_FILENAME)):
+            write_status(DATA_DIRECTORY, max(sync_dates))
+        write_manifest(DATA_DIRECTORY)
+        print(f"📦 Legacy analysis files of {', '.join(map(str, migrated))} republished as artifacts")
+    return migrated
 
-    while current < end:
-        next_day = (current + datetime.timedelta(days=1)).replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-        segment_end = min(next_day, end)
-        seconds = int((segment_end - current).total_seconds())
-        result.append((current, seconds))
-        current = segment_end
 
-    return result
\ No newline at end of file
+def new_analysis(year: int) -> UneAnalysis:
+    """
+    Empty analysis of a year, with its general information.
+    """
+    data = UneAnalysis()
+    data.sync_date = datetime.datetime.now(ZoneInfo("America/Havana"))
+    data.year = year
+    data.blocks_analysis = [BlockAnalysis(number=i) for i in range(1, BLOCK_COUNT + 1)]
+    data.sen_analysis = SENAnalysis()
+    return data
+
+
+def build_rankings(k: int = TOP_K) -> list[Ranking]:
+    """
+    Message rankings of the analysis. Ties keep the earliest message first.
+
+    :param k: size of the top lists (the `top3_*` fields)
+    :return: list of `Ranking` objects
+    """
+    return [
+        Ranking('shortest_message', lambda m: len(m.text), k=1, lowest=True, single=True),
+        Ranking('longest_message', lambda m: len(m.text), k=1, single=True),
+        Ranking('top3_most_viewed_messages', lambda m: m.views, k=k),
+        Ranking('top3_most_replied_messages', lambda m: m.replies, k=k),
+        Ranking('top3_most_positive_reaction_messages',
+                lambda m: sum(count for emo, count in m.reactions.items() if emo in POSITIVE_EMOJIS), k=k),
+        Ranking('top3_most_negative_reaction_messages',
+                lambda m: sum(count for emo, count in m.reactions.items() if emo in NEGATIVE_EMOJIS), k=k),
+    ]
+
+
+def build_aggregators(year: int, messages: YearMessages, top_k: int = TOP_K,
+                      partials: dict[int, AnalysisPartial] | None = None) -> list[Aggregator]:
+    """
+    Aggregators of every section of the analysis, in export order.
+
+    :param year: year of analysis
+    :param messages: the `YearMessages` container of the year
+    :param top_k: size of the top lists (see `build_rankings`)
+    :param partials: dict to fill with the month partials of the year (see `core.partials.PartialsAggregator`)
+    :return: list of `Aggregator` objects
+    """
+    rankings = build_rankings(top_k)
+    sen = SENAggregator(messages)
+    outage = BlockOutageAggregator(year)
+    aggregators = [
+        GeneralInformationAggregator(messages),
+        TotalsAggregator(),
+        DatesAggregator(year),
+        ReactionDistributionAggregator(),
+        MessageTypeAggregator(),
+        RankingAggregator(messages, rankings),
+        BlockDeclarationsAggregator(),
+        sen,
+        outage,
+    ]
+    if partials is not None:
+        aggregators.append(PartialsAggregator(messages, rankings, outage, sen, partials))
+    return aggregators
+
+
+def __analyze_year_state(year: int, export_version: int) -> tuple[UneAnalysis, dict[int, AnalysisPartial], list]:
+    partials, checkpoints = {}, []
+    data = analyze_data(year, read_only=True, export_version=export_version, update_manifest=False,
+                        partials=partials, checkpoints=checkpoints)
+    return data, partials, checkpoints
+
+
+def __aggregate_partials(year: int, read_only: bool) -> dict[int, AnalysisPartial]:
+    """
+    Month partials of a year, aggregated without analyzing (nor exporting) the rest of the year.
+    """
+    messages = YearMessages()
+    partials = {}
+    rankings = build_rankings()
+    sen = SENAggregator(messages)
+    outage = BlockOutageAggregator(year)
+    run_aggregators(messages, [sen, outage, PartialsAggregator(messages, rankings, outage, sen, partials)],
+                    new_analysis(year), rows=stream_year_messages(year, messages, read_only=read_only))
+    if messages.computed_features and not read_only:
+        __save_computed_features(messages)
+    return partials
+
+
+def __save_computed_features(messages):
+    with connection() as conn, conn:
+        save_message_features(conn, messages.computed_features)
+    print(f"🏷️ Cached features of {len(messages.computed_features)} messages")
+
+
+def export_analysis_to_json(analysis: UneAnalysis, export_version: int = EXPORT_FORMAT_VERSION):
+    """
+    Serialize analysis to JSON to <analysis_data_%year%.%hash%.json> (plus precompressed siblings, see
+    `core.artifacts.write_artifact`)
+
+    Volatile fields (`sync_date`) are left out, so an unchanged analysis keeps its hash and its files untouched.
+    """
+
+    try:
+        filename = write_artifact(DATA_DIRECTORY, f"analysis_data_{analysis.year}",
+                                  serialize_analysis(analysis, export_version))
+        print(f"✅ Analysis exported successfully to {filename}")
+
+    except Exception as e:
+        print(f"❌ Error exporting to JSON: {e}")
+
+
+def serialize_analysis(analysis: UneAnalysis, export_version: int = EXPORT_FORMAT_VERSION) -> bytes:
+    """
+    Serializes the analysis (without volatile fields) in the given export format (see `analyze_data`).
+    """
+    if export_version == 1:
+        content = json.dumps(without_volatile_fields(asdict(analysis)), indent=4, ensure_ascii=False,
+                             cls=UneAnalysisEncoder)
+    else:
+        content = json.dumps(to_compact_dict(analysis), separators=(',', ':'), ensure_ascii=False,
+                             cls=UneAnalysisEncoder)
+    return content.encode('utf-8')
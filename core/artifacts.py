@@ -0,0 +1,85 @@
+import datetime
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+
+import brotli
+
+MANIFEST_FILENAME = 'manifest.json'
+STATUS_FILENAME = 'status.json'
+HASH_LENGTH = 12
+
+
+def write_artifact(directory: str, stem: str, content: bytes) -> str:
+    """
+    Writes `content` to `<stem>.<content hash>.json` plus its precompressed `.gz` and `.br` siblings, and removes
+    the previous versions of the artifact (also the unhashed `<stem>.json` of the exports before the manifest).
+
+    Byte-identical files are not rewritten, so an unchanged artifact leaves the directory untouched.
+    :param directory: output directory
+    :param stem: artifact name without hash nor extension (e.g. `analysis_data_2025`)
+    :param content: serialized artifact
+    :return: filename of the artifact (relative to `directory`)
+    """
+    filename = f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}.json"
+    path = os.path.join(directory, filename)
+
+    __write_if_changed(path, content)
+    __write_if_changed(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+    __write_if_changed(path + '.br', brotli.compress(content, quality=11))
+
+    stem_pattern = os.path.join(glob.escape(directory), glob.escape(stem))
+    for stale in glob.glob(f"{stem_pattern}.*.json*") + glob.glob(f"{stem_pattern}.json*"):
+        if not os.path.basename(stale).startswith(filename):
+            os.remove(stale)
+
+    return filename
+
+
+def write_manifest(directory: str, prefix: str = 'analysis_data_') -> dict[str, str]:
+    """
+    Writes `manifest.json`, mapping each year (and `all`, the all-time analysis) to the hashed filename of its
+    analysis (see `write_artifact`).
+
+    The manifest is rebuilt from the directory contents, so it is always consistent with the artifacts on disk.
+    :param directory: output directory
+    :param prefix: filename prefix of the artifacts
+    :return: mapping year (or `all`) -> filename
+    """
+    pattern = re.compile(rf"{re.escape(prefix)}(\d+|all)\.[0-9a-f]{{{HASH_LENGTH}}}\.json")
+    years = {}
+    for filename in sorted(os.listdir(directory)):
+        match = pattern.fullmatch(filename)
+        if match:
+            years[match.group(1)] = filename
+
+    content = json.dumps({"years": years}, separators=(',', ':')).encode('utf-8')
+    __write_if_changed(os.path.join(directory, MANIFEST_FILENAME), content)
+    return years
+
+
+def write_status(directory: str, sync_date: datetime.datetime):
+    """
+    Writes `status.json` with the sync date, the only file that changes on runs without data changes.
+
+    :param directory: output directory
+    :param sync_date: date of the sync
+    """
+    content = json.dumps({"sync_date": sync_date.isoformat()}, separators=(',', ':')).encode('utf-8')
+    __write_if_changed(os.path.join(directory, STATUS_FILENAME), content)
+
+
+def __write_if_changed(path: str, content: bytes) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
+
+    with open(path, 'wb') as f:
+        f.write(content)
+    return True
@@ -0,0 +1,99 @@
+import re
+
+from core.classes import BlockMatches
+from core.constants import BLOCK_START_KEYWORDS, BLOCK_END_KEYWORDS, BLOCK_REFERENCE_PATTERN, BLOCK_MENTION_PATTERN, \
+    BLOCK_EXCLUSION_PATTERN, BLOCK_ALERT_PATTERN, ALERT_EMOJIS, BLOCK_LIST_PATTERN
+
+__number = r"(?P<number>[1-6])"
+
+# Block references plus start/end keywords (as lookaheads, so overlapping keywords are not lost) in a single scan
+BLOCK_STATE_PATTERN = re.compile(
+    rf"(?P<reference>{BLOCK_REFERENCE_PATTERN.format(i=__number)})"
+    rf"|(?=(?P<start>{'|'.join(BLOCK_START_KEYWORDS)}))"
+    rf"|(?=(?P<end>{'|'.join(BLOCK_END_KEYWORDS)}))"
+)
+BLOCK_MENTION_REGEX = re.compile(rf"{BLOCK_MENTION_PATTERN.format(i=__number)}\b", re.IGNORECASE)
+BLOCK_RECOVERY_REGEX = re.compile(BLOCK_MENTION_PATTERN.format(i=__number), re.IGNORECASE)
+BLOCK_EXCLUSION_REGEX = re.compile(BLOCK_EXCLUSION_PATTERN.format(i=__number), re.IGNORECASE)
+BLOCK_ALERT_REGEX = re.compile(BLOCK_ALERT_PATTERN.format(i=__number))
+ALERT_EMOJIS_REGEX = re.compile(ALERT_EMOJIS)
+BLOCK_NUMBER_REGEX = re.compile(r"[1-6]")
+
+
+def match_blocks(text: str) -> BlockMatches:
+    """
+    Detects every block started, ended, listed, mentioned, recovered and affected on a message.
+
+    Equivalent to evaluating `BLOCK_START_PATTERNS`, `BLOCK_END_PATTERNS` and the declaration patterns
+    of `core.constants` for each block 1-6, but every regex is compiled once and scanned once per message
+    with the block number as a named group.
+    :param text: lowercased text of the message
+    :return: `BlockMatches` object
+    """
+    matches = BlockMatches()
+    if not text:
+        return matches
+
+    if "bloque" in text:
+        __match_block_states(text, matches)
+
+    matches.listed = extract_blocks_from_list(text)
+    matches.mentioned = {int(match.group("number")) for match in BLOCK_MENTION_REGEX.finditer(text)}
+
+    recovery = text.find("restablecimiento")
+    if recovery != -1:
+        last_affectation = max(text.rfind("afectación"), text.rfind("afectacion"))
+        excluded = {
+            int(match.group("number")) for match in BLOCK_EXCLUSION_REGEX.finditer(text)
+            if match.end() <= last_affectation
+        }
+        matches.recovered = {
+            int(match.group("number"))
+            for match in BLOCK_RECOVERY_REGEX.finditer(text, recovery + len("restablecimiento"))
+        } - excluded
+
+    alert = ALERT_EMOJIS_REGEX.search(text)
+    if alert:
+        last_emergency = text.rfind("emergencia")
+        for match in BLOCK_ALERT_REGEX.finditer(text, alert.end()):
+            number = int(match.group("number"))
+            matches.affected.add(number)
+            if match.end() <= last_emergency:
+                matches.emergencies.add(number)
+
+    return matches
+
+def extract_blocks_from_list(text: str) -> set[int]:
+    match = BLOCK_LIST_PATTERN.search(text)
+    if not match:
+        return set()
+    return {int(b) for b in BLOCK_NUMBER_REGEX.findall(match.group(1))}
+
+def __match_block_states(text: str, matches: BlockMatches):
+    references = []
+    start_keywords = []
+    end_keywords = []
+
+    for match in BLOCK_STATE_PATTERN.finditer(text):
+        kind = match.lastgroup
+        if kind == "reference":
+            references.append((match.start(), match.end(), int(match.group("number"))))
+        elif kind == "start":
+            start_keywords.append(match.span("start"))
+        else:
+            end_keywords.append(match.span("end"))
+
+    for reference_start, reference_end, number in references:
+        if (__keyword_before(text, reference_start, start_keywords)
+                or __keyword_after(text, reference_end, start_keywords)):
+            matches.started.add(number)
+        if __keyword_before(text, reference_start, end_keywords):
+            matches.ended.add(number)
+
+def __keyword_before(text: str, position: int, keywords: list[tuple[int, int]]) -> bool:
+    # <keyword>.*<reference>: same line, keyword ending before the reference
+    return any(end <= position and text.find("\n", end, position) == -1 for _, end in keywords)
+
+def __keyword_after(text: str, position: int, keywords: list[tuple[int, int]]) -> bool:
+    # <reference>.*<keyword>: same line, keyword starting after the reference
+    return any(start >= position and text.find("\n", position, start) == -1 for start, _ in keywords)
@@ -0,0 +1,113 @@
+import json
+import zlib
+
+from core.aggregators import Aggregator, BlockOutageAggregator, SENAggregator
+from core.columnar import YearMessages
+from core.database import connection, year_bounds
+from core.features import CLASSIFIER_VERSION
+
+# Bump when the state of a checkpointed aggregator changes, so every stored checkpoint is discarded
+STATE_VERSION = 1
+CHECKPOINTED_AGGREGATORS = (BlockOutageAggregator, SENAggregator)
+
+
+class Checkpointed(Aggregator):
+    """
+    Resumable state machine (see `Aggregator.state`): restored from the checkpoint of its year, it skips the
+    messages up to the checkpoint, so its cost only grows with the messages after it. Its state is taken again
+    right before finalizing (finalizing closes the open intervals), to be stored as the next checkpoint.
+    """
+
+    def __init__(self, aggregator: Aggregator, resume_index: int = 0):
+        """
+        :param aggregator: the (restored) aggregator
+        :param resume_index: index of the first message after the checkpoint
+        """
+        self.aggregator = aggregator
+        self.resume_index = resume_index
+        self.checkpoint = None
+
+    def consume(self, m, features):
+        if m.index >= self.resume_index:
+            self.aggregator.consume(m, features)
+
+    def finalize(self, data):
+        self.checkpoint = self.aggregator.state()
+        self.aggregator.finalize(data)
+
+    @property
+    def name(self) -> str:
+        return self.aggregator.name
+
+
+def resume_aggregators(year: int, aggregators: list[Aggregator], read_only: bool = False) -> list[Aggregator]:
+    """
+    Wraps the state machines of a year (`CHECKPOINTED_AGGREGATORS`) in `Checkpointed`, restored from their stored
+    checkpoints if these are still valid: same `STATE_VERSION` and `CLASSIFIER_VERSION`, and the same number of
+    messages up to the checkpoint (changed messages already remove the checkpoints after them, see
+    `core.database`).
+
+    :param year: year of analysis
+    :param aggregators: list of `Aggregator` objects (see `core.analyzer.build_aggregators`)
+    :param read_only: use a read-only connection
+    :return: list of `Aggregator` objects, in the same order
+    """
+    start, _ = year_bounds(year)
+    with connection(read_only) as conn:
+        checkpoints = {}
+        for name, version, classifier_version, count, last_id, last_ts, state in conn.execute('''
+                SELECT name, version, classifier_version, message_count, last_message_id, last_date_ts, state
+                FROM state_checkpoints
+                WHERE year = ?
+            ''', (year,)):
+            if (version, classifier_version) != (STATE_VERSION, CLASSIFIER_VERSION):
+                continue
+            stored_count = conn.execute('''
+                SELECT COUNT(*) FROM messages
+                WHERE date_cuba_ts >= ? AND date_cuba_ts <= ? AND (date_cuba_ts, id) <= (?, ?)
+            ''', (start, last_ts, last_ts, last_id)).fetchone()[0]
+            if stored_count == count:
+                checkpoints[name] = (count, state)
+
+    resumed = []
+    for aggregator in aggregators:
+        if not isinstance(aggregator, CHECKPOINTED_AGGREGATORS):
+            resumed.append(aggregator)
+            continue
+
+        count, state = checkpoints.get(aggregator.name, (0, None))
+        if state is not None:
+            aggregator.restore(json.loads(zlib.decompress(state)))
+            print(f"⏩ {aggregator.name} resumed after {count} messages")
+        resumed.append(Checkpointed(aggregator, count))
+    return resumed
+
+
+def collect_checkpoints(year: int, messages: YearMessages, aggregators: list[Aggregator]) -> list[tuple]:
+    """
+    Checkpoints of the finalized `Checkpointed` aggregators of a year, after its last message.
+
+    :return: list of `state_checkpoints` rows (see `save_checkpoints`)
+    """
+    if not len(messages):
+        return []
+
+    last = len(messages) - 1
+    return [
+        (year, aggregator.name, STATE_VERSION, CLASSIFIER_VERSION, len(messages), messages.ids[last],
+         messages.date_cuba_ts[last], zlib.compress(json.dumps(aggregator.checkpoint, separators=(',', ':')).encode()))
+        for aggregator in aggregators
+        if isinstance(aggregator, Checkpointed) and aggregator.checkpoint is not None
+    ]
+
+
+def save_checkpoints(conn, checkpoints: list[tuple]):
+    """
+    Stores checkpoints (see `collect_checkpoints`), replacing the previous ones of the same year and aggregator.
+    """
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO state_checkpoints
+                (year, name, version, classifier_version, message_count, last_message_id, last_date_ts, state)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', checkpoints)
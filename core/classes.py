@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Callable
 from enum import Enum
 
 
@@ -45,6 +45,20 @@ class MessageType(Enum):
     DAILY_RESUME = 4
     BLOCK_INFORMATION = 5
 
+@dataclass(slots=True)
+class MessageRow:
+    """
+    Lightweight view of one message of a `YearMessages` container (see `core.columnar`), as consumed by
+    the aggregators. It has no date strings nor link: `index` is used to build the full `TelegramMessage`.
+    """
+    index: int = 0
+    id: int = 0
+    date_cuba_ts: int = 0
+    reactions: Dict[str, int] = field(default_factory=dict)
+    views: int = 0
+    replies: int = 0
+    text: str = ""
+
 @dataclass
 class TelegramMessageWithCount(TelegramMessage):
     """
@@ -65,6 +79,7 @@ class BlockAnalysis:
     estimated_affected_seconds: int = 0
     weekday_off_seconds: Dict[int, int] = field(default_factory=dict)
     weekday_off_avg_seconds: Dict[int, float] = field(default_factory=dict)
+    hourly_off_seconds: Dict[int, int] = field(default_factory=dict)
 
 @dataclass
 class SENFailureAnalysisEvent:
@@ -140,3 +155,65 @@ class UneAnalysis:
     # EXTRA ANALYSIS
     blocks_analysis: list[BlockAnalysis] = field(default_factory=list)
     sen_analysis: SENAnalysis = None
+
+@dataclass
+class BlockMatches:
+    """
+    Blocks detected on a single message text.
+    """
+    started: set[int] = field(default_factory=set)
+    ended: set[int] = field(default_factory=set)
+    listed: set[int] = field(default_factory=set)
+    mentioned: set[int] = field(default_factory=set)
+    recovered: set[int] = field(default_factory=set)
+    affected: set[int] = field(default_factory=set)
+    emergencies: set[int] = field(default_factory=set)
+
+@dataclass(slots=True)
+class MessageFeatures:
+    """
+    Classification of a single message (see `core.features`), cached on the `message_features` table.
+    """
+    message_type: int = 1
+    blocks: BlockMatches = field(default_factory=BlockMatches)
+    sen_mention: bool = False
+    sen_failure_start: bool = False
+    sen_failure_end: bool = False
+
+@dataclass
+class IdRange:
+    """
+    Range of message ids fetched by a backfill worker, with its progress.
+    """
+    min_id: int = 0
+    max_id: int = 0
+    last_written_id: int = 0
+    fetched: bool = False
+    done: bool = False
+
+
+@dataclass(frozen=True)
+class TelegramConfig:
+    """
+    Telegram credentials and channel, only needed to sync (see `core.config`).
+    """
+    api_id: int
+    api_hash: str
+    api_session: str | None
+    phone: str | None
+    channel_username: str
+
+
+@dataclass(frozen=True)
+class Ranking:
+    """
+    One message ranking of the analysis (see `core.aggregators.RankingAggregator`).
+
+    With `single`, the field takes the best message only (or None) instead of a list.
+    """
+    field_name: str
+    score: Callable[[MessageRow], int]
+    k: int = 3
+    lowest: bool = False
+    latest_on_ties: bool = False
+    single: bool = False
@@ -0,0 +1,205 @@
+import datetime
+import json
+from array import array
+from typing import Iterator
+
+from core.classes import TelegramMessage, MessageRow, MessageFeatures
+from core.database import connection, year_bounds, construct_link_by_id, REACTIONS_JSON_COLUMN, LOAD_ARRAYSIZE
+from core.features import CLASSIFIER_VERSION, BLOCK_FEATURES, extract_features, text_hash, decode_features
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+FEATURE_COLUMNS = ", ".join(f"f.{name}" for name in BLOCK_FEATURES)
+
+
+class YearMessages:
+    """
+    Columnar, date sorted container of the messages of a year.
+
+    Scalars are kept in typed `array` columns (epoch seconds instead of parsed dates), the texts in a single
+    UTF-8 buffer with offsets, and the reactions as a sparse (CSR) matrix of emoji indexes and counts.
+    Full `TelegramMessage` objects are only built by `message` for the messages that are exported.
+
+    The cached features of each message (see `core.features`) are kept encoded too. Messages without valid
+    cached features are classified on `features`, and collected in `computed_features` to be stored.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.date_utc_ts = array('q')
+        self.date_cuba_ts = array('q')
+        self.views = array('q')
+        self.replies = array('q')
+        self.texts = bytearray()
+        self.text_offsets = array('q', [0])
+        self.emojis: list[str] = []
+        self.reaction_offsets = array('q', [0])
+        self.reaction_emojis = array('H')
+        self.reaction_counts = array('q')
+        self.features_cached = array('B')
+        self.message_types = array('B')
+        self.block_masks = array('B')
+        self.feature_flags = array('B')
+        self.computed_features: dict[int, tuple[int, MessageFeatures]] = {}
+        self.__emoji_indexes: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, message_id: int, date_utc_ts: int, date_cuba_ts: int, views: int, replies: int, text: str,
+               reactions: dict[str, int] | None = None, cached_features: tuple | None = None) -> int:
+        """
+        Appends a message. Messages must be appended in date order.
+
+        `cached_features` is the `message_features` row (text hash, version, message type, block masks, flags),
+        only used if it matches the text and `CLASSIFIER_VERSION`.
+        :return: index of the message
+        """
+        self.ids.append(message_id)
+        self.date_utc_ts.append(date_utc_ts or 0)
+        self.date_cuba_ts.append(date_cuba_ts or 0)
+        self.views.append(views or 0)
+        self.replies.append(replies or 0)
+        self.texts += (text or "").encode('utf-8')
+        self.text_offsets.append(len(self.texts))
+
+        valid = (cached_features is not None and cached_features[1] == CLASSIFIER_VERSION
+                 and cached_features[0] == text_hash(text))
+        self.features_cached.append(valid)
+        self.message_types.append(cached_features[2] if valid else 0)
+        self.block_masks.extend(cached_features[3:-1] if valid else [0] * len(BLOCK_FEATURES))
+        self.feature_flags.append(cached_features[-1] if valid else 0)
+
+        for emoji, count in (reactions or {}).items():
+            emoji_index = self.__emoji_indexes.get(emoji)
+            if emoji_index is None:
+                emoji_index = self.__emoji_indexes[emoji] = len(self.emojis)
+                self.emojis.append(emoji)
+            self.reaction_emojis.append(emoji_index)
+            self.reaction_counts.append(count or 0)
+        self.reaction_offsets.append(len(self.reaction_emojis))
+        return len(self.ids) - 1
+
+    def text(self, i: int) -> str:
+        return str(memoryview(self.texts)[self.text_offsets[i]:self.text_offsets[i + 1]], 'utf-8')
+
+    def reactions(self, i: int) -> dict[str, int]:
+        start, end = self.reaction_offsets[i], self.reaction_offsets[i + 1]
+        emojis = self.emojis
+        return {emojis[e]: count for e, count in zip(self.reaction_emojis[start:end], self.reaction_counts[start:end])}
+
+    def features(self, i: int, text: str | None = None) -> MessageFeatures:
+        """
+        Features of the i-th message, classifying it (and keeping the result in `computed_features`) if not cached.
+
+        :param i: index of the message
+        :param text: text of the message, if already decoded
+        """
+        if self.features_cached[i]:
+            n = len(BLOCK_FEATURES)
+            return decode_features(self.message_types[i], self.block_masks[i * n:(i + 1) * n], self.feature_flags[i])
+
+        text = self.text(i) if text is None else text
+        features = extract_features(text)
+        self.computed_features[self.ids[i]] = (text_hash(text), features)
+        return features
+
+    def rows(self) -> Iterator[MessageRow]:
+        """
+        Iterates the messages in date order as `MessageRow` views.
+        """
+        for i in range(len(self.ids)):
+            yield MessageRow(
+                index=i,
+                id=self.ids[i],
+                date_cuba_ts=self.date_cuba_ts[i],
+                reactions=self.reactions(i),
+                views=self.views[i],
+                replies=self.replies[i],
+                text=self.text(i),
+            )
+
+    def message(self, i: int) -> TelegramMessage:
+        """
+        Builds the full `TelegramMessage` object of the i-th message.
+        """
+        date_utc_d = EPOCH + datetime.timedelta(seconds=self.date_utc_ts[i])
+        date_cuba_d = EPOCH + datetime.timedelta(seconds=self.date_cuba_ts[i])
+        return TelegramMessage(
+            id=self.ids[i],
+            link=construct_link_by_id(self.ids[i]),
+            date_utc=date_utc_d.strftime(DATE_FORMAT),
+            date_utc_d=date_utc_d,
+            date_cuba=date_cuba_d.strftime(DATE_FORMAT),
+            date_cuba_d=date_cuba_d,
+            reactions=self.reactions(i),
+            views=self.views[i],
+            replies=self.replies[i],
+            text=self.text(i),
+        )
+
+
+def get_year_messages(year: int, read_only: bool = False) -> YearMessages:
+    """
+    Get all messages of a year from db into a date sorted `YearMessages` container.
+
+    :param year: year of analysis
+    :param read_only: use a read-only connection (see `core.database.connect_read_only`)
+    :return: `YearMessages` object
+    """
+    messages = YearMessages()
+    for _ in stream_year_messages(year, messages, read_only=read_only):
+        pass
+    return messages
+
+
+def stream_year_messages(year: int, messages: YearMessages, read_only: bool = False,
+                         after: tuple[int, int] | None = None) -> Iterator[MessageRow]:
+    """
+    Loads the messages of a year with a single date ordered query (reactions aggregated as a JSON object and
+    cached features joined), appending each one to `messages` and yielding it as soon as its batch of
+    `LOAD_ARRAYSIZE` rows is fetched, so the analysis consumes the messages while they are loaded.
+
+    :param year: year of analysis
+    :param messages: the `YearMessages` container to fill (empty, unless `after` is given)
+    :param read_only: use a read-only connection (see `core.database.connect_read_only`)
+    :param after: only the messages after this (`date_cuba_ts`, id) key, e.g. the last one already in `messages`
+    :return: iterator of `MessageRow` views in date order
+    """
+    start, end = year_bounds(year)
+    after_ts, after_id = after or (start, None)
+
+    if after is None:
+        print(f'\n\nRetrieving messages for year {year}.')
+
+    with connection(read_only) as conn:
+        cursor = conn.cursor()
+        cursor.arraysize = LOAD_ARRAYSIZE
+        cursor.execute(f'''
+                       SELECT m.id, CAST(strftime('%s', m.date_utc) AS INTEGER), m.date_cuba_ts, m.views, m.replies,
+                              m.text, {REACTIONS_JSON_COLUMN}, f.text_hash, f.version, f.message_type,
+                              {FEATURE_COLUMNS}, f.flags
+                       FROM messages m
+                       LEFT JOIN message_features f ON f.id = m.id
+                       WHERE m.date_cuba_ts >= ? AND m.date_cuba_ts < ?
+                         AND (? IS NULL OR (m.date_cuba_ts, m.id) > (?, ?))
+                       ORDER BY m.date_cuba_ts, m.id
+                       ''', (max(start, after_ts), end, after_id, after_ts, after_id))
+        while rows := cursor.fetchmany():
+            for message_id, date_utc_ts, date_cuba_ts, views, replies, text, reactions, *cached_features in rows:
+                text = text or ""
+                reactions = json.loads(reactions) if reactions else {}
+                index = messages.append(message_id, date_utc_ts, date_cuba_ts, views, replies, text, reactions,
+                                        cached_features if cached_features[0] is not None else None)
+                yield MessageRow(
+                    index=index,
+                    id=message_id,
+                    date_cuba_ts=date_cuba_ts or 0,
+                    reactions=reactions,
+                    views=views or 0,
+                    replies=replies or 0,
+                    text=text,
+                )
+
+    if after is None:
+        print(f'Finished retrieval. Found {len(messages)} messages for year {year}.')
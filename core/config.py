@@ -0,0 +1,44 @@
+import os
+from functools import cache
+
+from dotenv import load_dotenv
+
+from core.classes import TelegramConfig
+
+
+@cache
+def channel_username() -> str:
+    """
+    Username of the channel from the environment (or `.env`). Also needed offline, to build the message links.
+
+    :return: value of `CHANNEL_USERNAME`
+    :raise RuntimeError: if `CHANNEL_USERNAME` is missing
+    """
+    load_dotenv()
+    username = os.getenv("CHANNEL_USERNAME")
+    if not username:
+        raise RuntimeError("CHANNEL_USERNAME is required to sync and to build message links (see .env.example)")
+    return username
+
+
+@cache
+def telegram_config() -> TelegramConfig:
+    """
+    Telegram configuration from the environment (or `.env`), read on first use, so only syncing needs credentials.
+
+    :return: `TelegramConfig` object
+    :raise RuntimeError: if `API_ID` or `API_HASH` are missing
+    """
+    load_dotenv()
+    api_id = os.getenv("API_ID")
+    api_hash = os.getenv("API_HASH")
+    if not api_id or not api_hash:
+        raise RuntimeError("API_ID and API_HASH are required to sync with Telegram (see .env.example)")
+
+    return TelegramConfig(
+        api_id=int(api_id),
+        api_hash=api_hash,
+        api_session=os.getenv("API_SESSION"),
+        phone=os.getenv("PHONE"),
+        channel_username=channel_username(),
+    )
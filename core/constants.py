@@ -0,0 +1,52 @@
+import re
+
+POSITIVE_EMOJIS = {'👍', '👏', '😁', '❤', '🙏'}
+NEGATIVE_EMOJIS = {'👎', '🤬', '😱', '😢'}
+STOP_WORDS = {
+    'el','la','los','las','un','una','unos','unas',
+    'de','del','al','a','en','por','para','con','sin','sobre','entre',
+    'y','o','u','que','como','cuando','donde','cuanto','quien','cual',
+    'yo','tú','él','ella','nosotros','vosotros','ellos','ellas',
+    'me','te','se','nos','os','lo','le','les',
+    'mi','tu','su','sus','nuestro','nuestra','vuestro','vuestra',
+    'es','son','fue','eran','ser','estar','está','están','hay','había',
+    'porque','pero','si','no','sí','ya','muy','más','menos','también',
+    'todo','nada','algo','cada','cualquier','ninguno','ninguna',
+    'este','esta','estos','estas','ese','esa','esos','esas',
+    'entonces','pues','aunque','además','solo','solamente','mismo','misma',
+    'ahí','aquí','allí','allá','hacia','desde','hasta','dentro','fuera',
+    'bien','mal','ahora','antes','después','luego','siempre','nunca',
+    'encuentran', 'todos', 'encuentra', 'estén', 'pm', 'san'
+}
+SEN_PATTERNS = [
+    "sen", "sistema electrico nacional", "sistema eléctrico nacional",
+    "sistema electroenergetico nacional", "sistema electroenergético nacional"
+]
+START_FAILURE_TRIGGER = "desconexión del sistema electroenergético nacional"
+END_FAILURE_TRIGGER = "100 %"
+
+BLOCK_COUNT = 6
+
+BLOCK_START_KEYWORDS = ["afect", "déficit", "fuera"]
+BLOCK_END_KEYWORDS = ["restablec", "recuper", "normaliz", "cierra"]
+BLOCK_REFERENCE_PATTERN = r"bloque\s*(no\.?|nº)?\s*{i}"
+
+BLOCK_START_PATTERNS = [
+    rf"({'|'.join(BLOCK_START_KEYWORDS)}).*{BLOCK_REFERENCE_PATTERN}",
+    rf"{BLOCK_REFERENCE_PATTERN}.*({'|'.join(BLOCK_START_KEYWORDS)})",
+]
+
+BLOCK_END_PATTERNS = [
+    rf"({'|'.join(BLOCK_END_KEYWORDS)}).*{BLOCK_REFERENCE_PATTERN}"
+]
+
+# `\s` split in a space not preceded by another one (the first space of a run already matches everything the
+# following ones would, so runs of spaces are scanned once) and any other whitespace
+BLOCK_MENTION_PATTERN = r"(bloques?|no\.?|y|,|(?<! ) |[^\S ])[ \.#]*{i}"
+BLOCK_EXCLUSION_PATTERN = r"(bloque|b|no\.?)[ \.#]*{i}"
+BLOCK_ALERT_PATTERN = r"(bloque|b|bloque no\.?)[ \.#]*{i}"
+ALERT_EMOJIS = r"[✅🚨‼️❗]"
+
+BLOCK_LIST_PATTERN = re.compile(r"bloques?:?\s*([1-6,\s]+)", re.IGNORECASE)
+
+MAX_BLOCK_DURATION_SECONDS = 24 * 60 * 60
\ No newline at end of file
@@ -1,22 +1,158 @@
+import calendar
+import json
+import os
 import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Iterable, Iterator
 
 from core.classes import TelegramMessage
+from core.config import channel_username
 from core.utils import datestr_to_datetime
 
-import os
-from dotenv import load_dotenv
+DATABASE_PATH = 'telegram_messages.db'
+# Bump when the tables below change, so existing databases run the (idempotent) migrations again
+SCHEMA_VERSION = 6
+# Bump when the cache tables change, so existing caches are dropped and rebuilt
+CACHE_VERSION = 1
+# Derived tables, rebuilt from `messages` when missing (see `cache_path`)
+CACHE_TABLES = ('message_features', 'analysis_partials', 'state_checkpoints', 'token_counts')
+# `sync_state` key counting the writes of messages, copied to the cache it is consistent with
+ARCHIVE_REVISION = 'archive_revision'
+# Case and accent insensitive tokens for the `messages_fts` full-text index
+FTS_TOKENIZER = 'unicode61 remove_diacritics 2'
+# Rows fetched per batch by the streaming loaders
+LOAD_ARRAYSIZE = 1000
+# Reactions of message `m` as a JSON object, in emoji order
+REACTIONS_JSON_COLUMN = '''(
+    SELECT json_group_object(emoji, count)
+    FROM (SELECT emoji, count FROM message_reactions WHERE message_id = m.id ORDER BY emoji)
+)'''
+# Year loads read through memory-mapped I/O, with a bigger page cache and in-memory temporary b-trees (sorts)
+CONNECTION_PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+__databases = {}
+
+
+class Database:
+    """
+    Connection manager of a database file: one shared writer connection, opened (and migrated) on first use,
+    and new read-only connections for analysis workers.
+
+    The writer is bound to the thread that opens it, as every sqlite connection.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH):
+        self.path = path
+        self.__writer = None
+
+    @property
+    def writer(self) -> sqlite3.Connection:
+        """
+        Shared writer connection (not to be closed by its users).
+        """
+        if self.__writer is None:
+            self.__writer = setup_database(self.path)
+        return self.__writer
+
+    def reader(self) -> sqlite3.Connection:
+        """
+        New read-only connection (see `connect_read_only`).
+
+        **REMEMBER TO CLOSE CONNECTION TO DATABASE**
+        """
+        return connect_read_only(self.path)
+
+    def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def get_database(path: str = DATABASE_PATH) -> Database:
+    """
+    Shared `Database` manager of a database file in this process.
+
+    :param path: path of the sqlite database file (relative paths are resolved against the current directory)
+    :return: `Database` object
+    """
+    key = os.path.abspath(path)
+    if key not in __databases:
+        __databases[key] = Database(key)
+    return __databases[key]
+
+
+def close_databases():
+    """
+    Closes the shared writer connections of every database of this process.
+    """
+    for database in __databases.values():
+        database.close()
+    __databases.clear()
+
+
+@contextmanager
+def connection(read_only: bool = False, path: str = DATABASE_PATH):
+    """
+    Connection for a `with` block: the shared writer of the database, or a new read-only connection that is
+    closed on exit.
+
+    :param read_only: use a read-only connection (see `connect_read_only`)
+    :param path: path of the sqlite database file
+    """
+    if not read_only:
+        yield get_database(path).writer
+        return
+
+    conn = connect_read_only(path)
+    try:
+        yield conn
+    finally:
+        conn.close()
 
-load_dotenv()
-__channel_username = os.getenv("CHANNEL_USERNAME")
 
-def setup_database():
+def setup_database(path: str = DATABASE_PATH):
     """
-    Setup database by creating the corresponding tables.
+    Opens a new connection, creating the corresponding tables if the database schema is older than
+    `SCHEMA_VERSION` (so migrations only run once per database), and attaches its cache (see `cache_path`).
 
     **REMEMBER TO CLOSE CONNECTION TO DATABASE**
+    :param path: path of the sqlite database file
     :return: sqlite connection
     """
-    conn = sqlite3.connect('telegram_messages.db')
+    conn = sqlite3.connect(path)
+    __apply_pragmas(conn)
+    if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        __migrate(conn)
+    __attach_cache(conn, cache_path(path))
+    return conn
+
+def cache_path(path: str = DATABASE_PATH) -> str:
+    """
+    Path of the cache database of a database (<name>_cache.db): the tables derived from its messages (message
+    features, month partials, state machine checkpoints and word count snapshots, see `CACHE_TABLES`).
+
+    The cache is attached to every connection as `cache`, so its tables are queried by their unqualified names.
+    It is not committed with the archive: everything in it is rebuilt from `messages` when missing, and it is
+    emptied when it does not belong to the current archive revision (see `ARCHIVE_REVISION`).
+    :param path: path of the sqlite database file
+    :return: path of the cache database file
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}_cache{extension or '.db'}"
+
+def __migrate(conn):
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS messages (
@@ -37,103 +173,546 @@ def setup_database():
             FOREIGN KEY (message_id) REFERENCES messages (id)
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dirty_years (
+            year INTEGER PRIMARY KEY,
+            changed_at TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    ''')
+    __migrate_date_index(cursor)
+    __migrate_text_index(cursor)
+    moved = __migrate_cache_tables(cursor)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
+    if moved:
+        # give the space of the derived tables back, so the committed file shrinks
+        conn.execute('VACUUM')
+
+def connect_read_only(path: str = DATABASE_PATH):
+    """
+    Opens a read-only (`mode=ro`) connection. No migrations are run, so `setup_database` must have been called before.
+
+    **REMEMBER TO CLOSE CONNECTION TO DATABASE**
+    :param path: path of the sqlite database file
+    :return: sqlite connection
+    """
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    __apply_pragmas(conn)
+    __attach_cache(conn, cache_path(path), read_only=True)
     return conn
 
+def __apply_pragmas(conn):
+    for pragma, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f'PRAGMA {pragma} = {value}')
 
-def save_message_to_db(conn, msg: TelegramMessage):
+def __migrate_date_index(cursor):
     """
-    Saves message to database by replacing it if exists.
+    Adds the indexed `date_cuba_ts` column (epoch seconds of the Cuba date, read as UTC) to `messages`.
 
-    :param conn: sqlite connection
-    :param msg: the `TelegramMessage` object
+    It is a virtual generated column, so existing rows are backfilled by the index creation
+    and new rows never need to set it.
+    """
+    columns = {row[1] for row in cursor.execute('PRAGMA table_xinfo(messages)')}
+    if 'date_cuba_ts' not in columns:
+        cursor.execute('''
+            ALTER TABLE messages
+            ADD COLUMN date_cuba_ts INTEGER
+            GENERATED ALWAYS AS (CAST(strftime('%s', date_cuba) AS INTEGER)) VIRTUAL
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_date_cuba_ts ON messages (date_cuba_ts)')
+
+def __migrate_text_index(cursor):
+    """
+    Adds `messages_fts`, an FTS5 index of the message texts kept in sync with `messages` by triggers.
+
+    It is an external content table (the texts are read from `messages`, not duplicated), so `messages` rows must
+    be updated in place (upserts) instead of replaced: a REPLACE deletion does not fire the delete trigger.
+    Skipped, with a warning, if the sqlite build has no FTS5.
     """
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+        return
 
-    print(f'\n\nSaving message to database {msg.id}\n')
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO messages (id, date_utc, date_cuba, views, replies, text)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (msg.id, msg.date_utc, msg.date_cuba, msg.views, msg.replies, msg.text))
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE messages_fts
+            USING fts5(text, content='messages', content_rowid='id', tokenize='{FTS_TOKENIZER}')
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text index not available: {e}")
+        return
 
-        for emoji, count in msg.reactions.items():
-            cursor.execute('''
-                INSERT OR REPLACE INTO message_reactions (message_id, emoji, count)
-                VALUES (?, ?, ?)
-            ''', (msg.id, emoji, count))
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages
+        WHEN old.text IS NOT new.text BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+        END
+    ''')
+    cursor.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
 
-        conn.commit()
-    except Exception as e:
-        print(e)
+def __migrate_cache_tables(cursor) -> bool:
+    """
+    Drops the derived tables (and the triggers of `state_checkpoints`) that schemas older than 6 kept on the
+    database: they live on the cache database now (see `cache_path`), and are rebuilt there on the next analysis.
 
-def get_messages_by_year(year: int) -> list[TelegramMessage]:
+    :return: whether any table was dropped
     """
-        Get all messsages from db to In-Memory from a determined year.
+    tables = [table for table in CACHE_TABLES
+              if cursor.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                (table,)).fetchone()]
+    for trigger in ('state_checkpoints_insert', 'state_checkpoints_delete', 'state_checkpoints_update'):
+        cursor.execute(f'DROP TRIGGER IF EXISTS main.{trigger}')
+    for table in tables:
+        cursor.execute(f'DROP TABLE main.{table}')
+    return bool(tables)
 
-        :param year: year of analysis
-        :return: list of `TelegramMessage` objects
+def __attach_cache(conn, path: str, read_only: bool = False):
+    """
+    Attaches the cache database as `cache` (see `cache_path`).
+
+    The writer creates the cache tables (dropping them if the cache is older than `CACHE_VERSION`), empties them
+    if they do not belong to the current archive revision, and creates the (temporary, as they reach another
+    database) triggers that invalidate `state_checkpoints`. Read-only connections attach an empty in-memory
+    cache if there is none yet.
     """
-    messages = []
-    conn = setup_database()
+    if read_only and os.path.exists(path):
+        conn.execute('ATTACH DATABASE ? AS cache', (f'file:{path}?mode=ro',))
+        return
+
+    conn.execute('ATTACH DATABASE ? AS cache', (':memory:' if read_only else path,))
     cursor = conn.cursor()
-    search_pattern = f"{year}%"
+    if cursor.execute('PRAGMA cache.user_version').fetchone()[0] != CACHE_VERSION:
+        for table in CACHE_TABLES + ('cache_state',):
+            cursor.execute(f'DROP TABLE IF EXISTS cache.{table}')
+        __create_cache_tables(cursor)
+        cursor.execute(f'PRAGMA cache.user_version = {CACHE_VERSION}')
+    if read_only:
+        return
 
-    print(f'\n\nRetrieving messages for year {year}.')
+    __create_checkpoint_triggers(cursor)
+    revision = cursor.execute('SELECT value FROM sync_state WHERE key = ?', (ARCHIVE_REVISION,)).fetchone()
+    cached = cursor.execute('SELECT value FROM cache_state WHERE key = ?', (ARCHIVE_REVISION,)).fetchone()
+    if (revision or (0,))[0] != (cached or (0,))[0]:
+        print("⚠️ Cache from another revision of the archive, rebuilding it")
+        for table in CACHE_TABLES:
+            cursor.execute(f'DELETE FROM cache.{table}')
+        cursor.execute('INSERT OR REPLACE INTO cache_state (key, value) VALUES (?, ?)',
+                       (ARCHIVE_REVISION, (revision or (0,))[0]))
+    conn.commit()
 
+def __create_cache_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE cache.cache_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    ''')
     cursor.execute('''
-                   SELECT id, date_utc, date_cuba, views, replies, text
-                   FROM messages
-                   WHERE date_cuba LIKE ?
-                   ''', (search_pattern,))
-    rows = cursor.fetchall()
-    messages_dict: dict[int, TelegramMessage] = {}
-
-    for row in rows:
-        msg = TelegramMessage(
-            id=row[0],
-            date_utc=row[1],
-            date_cuba=row[2],
-            views=row[3],
-            replies=row[4],
-            text=row[5],
-            reactions={}
+        CREATE TABLE cache.message_features (
+            id INTEGER PRIMARY KEY,
+            text_hash INTEGER,
+            version INTEGER,
+            message_type INTEGER,
+            started INTEGER,
+            ended INTEGER,
+            listed INTEGER,
+            mentioned INTEGER,
+            recovered INTEGER,
+            affected INTEGER,
+            emergencies INTEGER,
+            flags INTEGER
         )
-        messages_dict[msg.id] = msg
+    ''')
+    cursor.execute('''
+        CREATE TABLE cache.analysis_partials (
+            year INTEGER,
+            month INTEGER,
+            version INTEGER,
+            last_message_id INTEGER,
+            message_count INTEGER,
+            data BLOB,
+            PRIMARY KEY (year, month)
+        )
+    ''')
+    # State of the state machines of each year after its last analyzed message (see `core.checkpoints`)
+    cursor.execute('''
+        CREATE TABLE cache.state_checkpoints (
+            year INTEGER,
+            name TEXT,
+            version INTEGER,
+            classifier_version INTEGER,
+            message_count INTEGER,
+            last_message_id INTEGER,
+            last_date_ts INTEGER,
+            state BLOB,
+            PRIMARY KEY (year, name)
+        )
+    ''')
+    # Per-month token snapshots of `core.words`, signed by a hash of the month texts
+    cursor.execute('''
+        CREATE TABLE cache.token_counts (
+            year INTEGER,
+            month INTEGER,
+            ngram INTEGER,
+            version INTEGER,
+            last_message_id INTEGER,
+            message_count INTEGER,
+            text_hash INTEGER,
+            counts BLOB,
+            PRIMARY KEY (year, month, ngram)
+        )
+    ''')
+
+def __create_checkpoint_triggers(cursor):
+    """
+    A checkpoint is only valid while the messages up to it do not change, so inserting, deleting or changing the
+    text or date of a message removes every checkpoint of its year at or after that message.
+    """
+    invalidate = '''
+        DELETE FROM state_checkpoints
+        WHERE year = CAST(strftime('%Y', {row}.date_cuba) AS INTEGER)
+          AND (last_date_ts, last_message_id) >= (CAST(strftime('%s', {row}.date_cuba) AS INTEGER), {row}.id);
+    '''
+    cursor.execute(f'''
+        CREATE TEMP TRIGGER IF NOT EXISTS state_checkpoints_insert AFTER INSERT ON main.messages BEGIN
+            {invalidate.format(row='new')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TEMP TRIGGER IF NOT EXISTS state_checkpoints_delete AFTER DELETE ON main.messages BEGIN
+            {invalidate.format(row='old')}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TEMP TRIGGER IF NOT EXISTS state_checkpoints_update AFTER UPDATE OF date_cuba, text ON main.messages
+        WHEN old.text IS NOT new.text OR old.date_cuba IS NOT new.date_cuba BEGIN
+            {invalidate.format(row='old')}
+            {invalidate.format(row='new')}
+        END
+    ''')
+
+
+def save_message_to_db(conn, msg: TelegramMessage) -> bool:
+    """
+    Saves message to database by replacing it if exists.
+    If the message (or any of its reactions) was inserted or changed, its year is marked as dirty.
+
+    :param conn: sqlite connection
+    :param msg: the `TelegramMessage` object
+    :return: True if the stored data changed, False otherwise
+    """
+    return bool(save_messages_to_db(conn, [msg], verbose=False))
+
+def save_messages_to_db(conn, messages: Iterable[TelegramMessage], batch_size: int = 500,
+                        wal: bool = False, verbose: bool = True, checkpoint: str | None = None,
+                        on_batch: Callable[[sqlite3.Connection, list[TelegramMessage]], None] | None = None) -> set[int]:
+    """
+    Saves messages to database in batches, replacing them if exist.
+
+    Each batch is compared against the stored rows and only the inserted or changed messages (and reactions)
+    are written, with `executemany` inside a single transaction. Years of changed messages are marked as dirty
+    (and their stored month partials removed) and the `last_message_id` high-water mark of `sync_state` is raised
+    in the same transaction.
+
+    :param conn: sqlite connection
+    :param messages: iterable of `TelegramMessage` objects (consumed lazily, so it can be a generator)
+    :param batch_size: number of messages per transaction
+    :param wal: use WAL journal and `synchronous=NORMAL` while writing (for big backfills)
+    :param verbose: print a line per batch
+    :param checkpoint: `sync_state` key to store the last message id of each committed batch.
+                       When given, a failed batch stops the process so the checkpoint never skips messages
+    :param on_batch: called with the connection and each batch inside its transaction, for custom checkpoints.
+                     When given, a failed batch stops the process too
+    :return: set of years with inserted or changed messages
+    """
+    changed_years = set()
+    iterator = iter(messages)
+
+    if wal:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+    try:
+        while batch := list(islice(iterator, batch_size)):
+            try:
+                changed = __changed_messages(conn, batch)
+                with conn:
+                    __write_messages(conn, changed)
+                    __update_sync_state(conn, batch, checkpoint)
+                    if on_batch:
+                        on_batch(conn, batch)
+                changed_years.update(int(msg.date_cuba[:4]) for msg in changed if msg.date_cuba)
+                if verbose:
+                    print(f'💾 Saved batch of {len(batch)} messages ({batch[0].id} - {batch[-1].id}): {len(changed)} changed')
+            except Exception as e:
+                print(e)
+                if checkpoint or on_batch:
+                    raise
+    finally:
+        if wal:
+            conn.execute('PRAGMA journal_mode=DELETE')
+            conn.execute('PRAGMA synchronous=FULL')
+
+    return changed_years
 
+def __changed_messages(conn, batch: list[TelegramMessage]) -> list[TelegramMessage]:
+    """
+    Filters the messages of a batch that are not stored yet or differ from the stored ones.
+    """
+    ids = [msg.id for msg in batch]
+    placeholders = ','.join('?' * len(ids))
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT id, date_utc, date_cuba, views, replies, text
+        FROM messages
+        WHERE id IN ({placeholders})
+    ''', ids)
+    stored = {row[0]: row[1:] for row in cursor.fetchall()}
+
+    cursor.execute(f'''
+        SELECT message_id, emoji, count
+        FROM message_reactions
+        WHERE message_id IN ({placeholders})
+    ''', ids)
+    stored_reactions = {}
+    for m_id, emoji, count in cursor.fetchall():
+        stored_reactions.setdefault(m_id, {})[emoji] = count
+
+    # Reactions are compared as a whole, so a reaction removed upstream also changes the message
+    return [
+        msg for msg in batch
+        if stored.get(msg.id) != (msg.date_utc, msg.date_cuba, msg.views, msg.replies, msg.text)
+        or stored_reactions.get(msg.id, {}) != msg.reactions
+    ]
+
+def __write_messages(conn, messages: list[TelegramMessage]):
+    cursor = conn.cursor()
+    # Upsert (not REPLACE) so the `messages_fts` triggers see the update
+    cursor.executemany('''
+        INSERT INTO messages (id, date_utc, date_cuba, views, replies, text)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            date_utc = excluded.date_utc, date_cuba = excluded.date_cuba, views = excluded.views,
+            replies = excluded.replies, text = excluded.text
+    ''', [(msg.id, msg.date_utc, msg.date_cuba, msg.views, msg.replies, msg.text) for msg in messages])
+
+    # The reactions of a changed message are replaced, dropping the ones that no longer exist
+    cursor.executemany('DELETE FROM message_reactions WHERE message_id = ?', [(msg.id,) for msg in messages])
+    cursor.executemany('''
+        INSERT INTO message_reactions (message_id, emoji, count)
+        VALUES (?, ?, ?)
+    ''', [(msg.id, emoji, count) for msg in messages for emoji, count in msg.reactions.items()])
+
+    years = [(year,) for year in {int(msg.date_cuba[:4]) for msg in messages if msg.date_cuba}]
+    cursor.executemany('''
+        INSERT OR REPLACE INTO dirty_years (year, changed_at)
+        VALUES (?, datetime('now'))
+    ''', years)
+    # Month partials (see `core.partials`) of a changed year are outdated, even if only views or reactions changed
+    cursor.executemany('DELETE FROM analysis_partials WHERE year = ?', years)
+
+    # The cache follows this revision of the archive (see `cache_path`)
+    cursor.execute('''
+        INSERT INTO sync_state (key, value) VALUES (?, 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1
+    ''', (ARCHIVE_REVISION,))
     cursor.execute('''
-                   SELECT message_id, emoji, count
-                   FROM message_reactions
-                   WHERE message_id IN (SELECT id
-                                        FROM messages
-                                        WHERE date_cuba LIKE ?)
-                   ''', (search_pattern,))
-    reaction_rows = cursor.fetchall()
-
-    for m_id, emoji, count in reaction_rows:
-        if m_id in messages_dict:
-            messages_dict[m_id].reactions[emoji] = count
-
-    print(f'Finished retrieval. Found {len(messages_dict)} messages for year {year}.')
-    conn.close()
-
-    data = list(messages_dict.values())
-
-    for msg in data:
-        msg.date_utc = msg.date_utc or ""
-        msg.date_cuba = msg.date_cuba or ""
-        msg.views = msg.views or 0
-        msg.replies = msg.replies or 0
-        msg.text = msg.text or ""
-        msg.reactions = msg.reactions or {}
-        msg.date_utc_d = datestr_to_datetime(msg.date_utc)
-        msg.date_cuba_d = datestr_to_datetime(msg.date_cuba)
-        msg.link = construct_link_by_id(msg.id)
+        INSERT OR REPLACE INTO cache_state (key, value)
+        SELECT key, value FROM sync_state WHERE key = ?
+    ''', (ARCHIVE_REVISION,))
+
+def __update_sync_state(conn, batch: list[TelegramMessage], checkpoint: str | None):
+    conn.execute('''
+        INSERT INTO sync_state (key, value)
+        VALUES ('last_message_id', ?)
+        ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+    ''', (max(msg.id for msg in batch),))
+
+    if checkpoint:
+        set_sync_state(conn, checkpoint, batch[-1].id)
+
+def get_sync_state(conn, key: str) -> int | None:
+    """
+    Retrieves a value of the `sync_state` table.
+
+    :param conn: sqlite connection
+    :param key: state key
+    :return: the stored value or None
+    """
+    row = conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+def set_sync_state(conn, key: str, value: int | None):
+    """
+    Stores a value of the `sync_state` table (None deletes it). Commit is up to the caller.
+
+    :param conn: sqlite connection
+    :param key: state key
+    :param value: new value
+    """
+    if value is None:
+        conn.execute('DELETE FROM sync_state WHERE key = ?', (key,))
+    else:
+        conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, value))
+
+def get_last_message_id(conn) -> int:
+    """
+    Retrieves the high-water mark: the highest message id stored on database.
+
+    :param conn: sqlite connection
+    :return: message id, 0 if there are no messages
+    """
+    last_id = get_sync_state(conn, 'last_message_id')
+    if last_id is None:
+        last_id = conn.execute('SELECT MAX(id) FROM messages').fetchone()[0]
+    return last_id or 0
+
+def get_dirty_years() -> list[int]:
+    """
+    Retrieves the years whose messages were inserted or changed since their last analysis.
+
+    :return: sorted list of years
+    """
+    with connection() as conn:
+        return [row[0] for row in conn.execute('SELECT year FROM dirty_years ORDER BY year')]
+
+def clear_dirty_year(year: int):
+    """
+    Marks a year as up to date, usually after its analysis was exported.
 
+    :param year: analyzed year
+    """
+    with connection() as conn, conn:
+        conn.execute('DELETE FROM dirty_years WHERE year = ?', (year,))
+
+def get_messages_by_year(year: int, read_only: bool = False) -> list[TelegramMessage]:
+    """
+        Get all messsages from db to In-Memory from a determined year, in date order.
+
+        :param year: year of analysis
+        :param read_only: use a read-only connection (see `connect_read_only`)
+        :return: list of `TelegramMessage` objects
+    """
+    print(f'\n\nRetrieving messages for year {year}.')
+    data = list(iter_messages_by_year(year, read_only))
+    print(f'Finished retrieval. Found {len(data)} messages for year {year}.')
     return data
 
+def iter_messages_by_year(year: int, read_only: bool = False) -> Iterator[TelegramMessage]:
+    """
+    Streams the messages of a year in date order, with a single query (reactions aggregated as a JSON object)
+    fetched in batches of `LOAD_ARRAYSIZE` rows.
+
+    :param year: year of analysis
+    :param read_only: use a read-only connection (see `connect_read_only`)
+    :return: iterator of ready to use `TelegramMessage` objects
+    """
+    start, end = year_bounds(year)
+    with connection(read_only) as conn:
+        cursor = conn.cursor()
+        cursor.arraysize = LOAD_ARRAYSIZE
+        cursor.execute(f'''
+                       SELECT m.id, m.date_utc, m.date_cuba, m.views, m.replies, m.text, {REACTIONS_JSON_COLUMN}
+                       FROM messages m
+                       WHERE m.date_cuba_ts >= ? AND m.date_cuba_ts < ?
+                       ORDER BY m.date_cuba_ts, m.id
+                       ''', (start, end))
+        while rows := cursor.fetchmany():
+            for row in rows:
+                yield __to_telegram_message(*row)
+
+def get_messages_by_ids(ids: Iterable[int], read_only: bool = False) -> dict[int, TelegramMessage]:
+    """
+    Get some messages by id (e.g. the ones referenced by an analysis).
+
+    :param ids: message ids
+    :param read_only: use a read-only connection (see `connect_read_only`)
+    :return: dict id -> `TelegramMessage` (missing ids are left out)
+    """
+    iterator = iter(set(ids))
+    messages = {}
+    with connection(read_only) as conn:
+        while batch := list(islice(iterator, 500)):
+            for row in conn.execute(f'''
+                    SELECT m.id, m.date_utc, m.date_cuba, m.views, m.replies, m.text, {REACTIONS_JSON_COLUMN}
+                    FROM messages m
+                    WHERE m.id IN ({",".join("?" * len(batch))})
+                    ''', batch):
+                messages[row[0]] = __to_telegram_message(*row)
+    return messages
+
+def __to_telegram_message(message_id, date_utc, date_cuba, views, replies, text, reactions) -> TelegramMessage:
+    return TelegramMessage(
+        id=message_id,
+        link=construct_link_by_id(message_id),
+        date_utc=date_utc or "",
+        date_utc_d=datestr_to_datetime(date_utc or ""),
+        date_cuba=date_cuba or "",
+        date_cuba_d=datestr_to_datetime(date_cuba or ""),
+        reactions=json.loads(reactions) if reactions else {},
+        views=views or 0,
+        replies=replies or 0,
+        text=text or "",
+    )
+
+def search_messages(query: str, year: int | None = None, limit: int = 20,
+                    read_only: bool = False) -> list[tuple[int, str, str]]:
+    """
+    Full-text search over the archive, best matches first (bm25).
+
+    :param query: FTS5 query (e.g. `apagón`, `"bloque 3" AND emergencia`, `desconex*`). If it is not valid FTS5
+        syntax, it is searched as a phrase
+    :param year: only messages of this year
+    :param limit: maximum number of results
+    :param read_only: use a read-only connection (see `connect_read_only`)
+    :return: list of (message id, Cuba date, snippet) tuples
+    """
+    start, end = year_bounds(year) if year is not None else (None, None)
+    sql = '''
+        SELECT m.id, m.date_cuba, snippet(messages_fts, 0, '[', ']', '…', 12)
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ? AND (? IS NULL OR (m.date_cuba_ts >= ? AND m.date_cuba_ts < ?))
+        ORDER BY bm25(messages_fts)
+        LIMIT ?
+    '''
+    with connection(read_only) as conn:
+        try:
+            return conn.execute(sql, (query, year, start, end, limit)).fetchall()
+        except sqlite3.OperationalError:
+            return conn.execute(sql, (__fts_phrase(query), year, start, end, limit)).fetchall()
+
+def __fts_phrase(phrase: str) -> str:
+    return '"' + phrase.replace('"', '""') + '"'
+
+def year_bounds(year: int) -> tuple[int, int]:
+    """
+    Range of `date_cuba_ts` values of a year.
+
+    :param year: year
+    :return: tuple (start, end) where start is inclusive and end exclusive
+    """
+    return calendar.timegm((year, 1, 1, 0, 0, 0)), calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+
 def construct_link_by_id(message_id):
-    return f"https://t.me/{__channel_username}/{message_id}"
+    return f"https://t.me/{channel_username()}/{message_id}"
 
 
 def get_year_range() -> tuple[int, int]:
@@ -143,27 +722,22 @@ def get_year_range() -> tuple[int, int]:
     :return: A tuple containing (first_year, last_year) as integers.
              Returns (None, None) if the database is empty.
     """
-    conn = setup_database()
-    cursor = conn.cursor()
-
     try:
-        cursor.execute('''
-                       SELECT MIN(SUBSTR(date_cuba, 1, 4)),
-                              MAX(SUBSTR(date_cuba, 1, 4))
-                       FROM messages
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                       SELECT (SELECT MIN(date_cuba_ts) FROM messages),
+                              (SELECT MAX(date_cuba_ts) FROM messages)
                        ''')
-
-        result = cursor.fetchone()
+            result = cursor.fetchone()
 
         if result and result[0] is not None:
-            first_year = int(result[0])
-            last_year = int(result[1])
+            first_year = time.gmtime(result[0]).tm_year
+            last_year = time.gmtime(result[1]).tm_year
             return first_year, last_year
 
         return None, None
 
     except Exception as e:
         print(f"Error retrieving year range: {e}")
-        return None, None
-    finally:
-        conn.close()
\ No newline at end of file
+        return None, None
\ No newline at end of file
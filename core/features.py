@@ -0,0 +1,121 @@
+import hashlib
+import re
+
+from core.blocks import match_blocks
+from core.classes import MessageFeatures, MessageType, BlockMatches
+from core.constants import SEN_PATTERNS, START_FAILURE_TRIGGER, END_FAILURE_TRIGGER
+from core.database import year_bounds
+
+# Bump when any classifier (message type, block regexes, SEN patterns) changes, so every cached feature is recomputed
+CLASSIFIER_VERSION = 1
+
+BLOCK_FEATURES = ['started', 'ended', 'listed', 'mentioned', 'recovered', 'affected', 'emergencies']
+SEN_MENTION_FLAG = 1
+SEN_FAILURE_START_FLAG = 2
+SEN_FAILURE_END_FLAG = 4
+
+MESSAGE_TYPE_BLOCKS_REGEX = re.compile(r'\b(bloque|b|bloque no\.?)[ \.#]*([1-6])', re.IGNORECASE)
+
+
+def extract_features(text: str) -> MessageFeatures:
+    """
+    Classifies a message: type, blocks detected and SEN markers.
+
+    :param text: text of the message
+    :return: `MessageFeatures` object
+    """
+    text = (text or "").lower()
+    return MessageFeatures(
+        message_type=classify_message(text),
+        blocks=match_blocks(text),
+        sen_mention=any(pattern in text for pattern in SEN_PATTERNS),
+        sen_failure_start=START_FAILURE_TRIGGER in text,
+        sen_failure_end=END_FAILURE_TRIGGER in text,
+    )
+
+def classify_message(text: str) -> int:
+    """
+    `MessageType` value of a message.
+
+    :param text: lowercased text of the message
+    """
+    if "disparado automático por frecuencia" in text or "daf" in text:
+        return MessageType.DAF.value
+    if "disparo del circuito" in text or "averías primarias" in text or "averías secundarias" in text or "transformadores dañados" in text:
+        return MessageType.FAILURE_BY_ZONE.value
+    if "en el día de ayer" in text:
+        return MessageType.DAILY_RESUME.value
+    if MESSAGE_TYPE_BLOCKS_REGEX.search(text):
+        return MessageType.BLOCK_INFORMATION.value
+    return MessageType.GENERAL_INFORMATION.value
+
+def text_hash(text: str) -> int:
+    """
+    64-bit (signed, so it fits a sqlite INTEGER) hash of a message text.
+    """
+    digest = hashlib.blake2b((text or "").encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+def encode_features(features: MessageFeatures) -> tuple[int, ...]:
+    """
+    Features as integers: message type, one bitmask (bit i-1 for block i) per `BLOCK_FEATURES` set, and SEN flags.
+    """
+    flags = ((SEN_MENTION_FLAG if features.sen_mention else 0)
+             | (SEN_FAILURE_START_FLAG if features.sen_failure_start else 0)
+             | (SEN_FAILURE_END_FLAG if features.sen_failure_end else 0))
+    masks = (sum(1 << (block - 1) for block in getattr(features.blocks, name)) for name in BLOCK_FEATURES)
+    return features.message_type, *masks, flags
+
+def decode_features(message_type: int, masks, flags: int) -> MessageFeatures:
+    """
+    Inverse of `encode_features`.
+    """
+    blocks = BlockMatches(*({i + 1 for i in range(6) if mask >> i & 1} for mask in masks))
+    return MessageFeatures(
+        message_type=message_type,
+        blocks=blocks,
+        sen_mention=bool(flags & SEN_MENTION_FLAG),
+        sen_failure_start=bool(flags & SEN_FAILURE_START_FLAG),
+        sen_failure_end=bool(flags & SEN_FAILURE_END_FLAG),
+    )
+
+def save_message_features(conn, features: dict[int, tuple[int, MessageFeatures]]):
+    """
+    Stores computed features in the `message_features` cache. Commit is up to the caller.
+
+    :param conn: sqlite connection
+    :param features: dict message id -> (text hash, `MessageFeatures`)
+    """
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO message_features
+            (id, text_hash, version, message_type, {", ".join(BLOCK_FEATURES)}, flags)
+        VALUES ({", ".join("?" * (len(BLOCK_FEATURES) + 5))})
+    ''', [
+        (message_id, hash_value, CLASSIFIER_VERSION, *encode_features(f))
+        for message_id, (hash_value, f) in features.items()
+    ])
+
+def refresh_message_features(conn, year: int) -> int:
+    """
+    Computes and stores the features of the messages of a year that are new, edited (different text hash)
+    or classified by an older `CLASSIFIER_VERSION`.
+
+    :param conn: sqlite connection
+    :param year: year
+    :return: number of messages classified
+    """
+    start, end = year_bounds(year)
+    stale = {}
+    for message_id, text, cached_hash, version in conn.execute('''
+            SELECT m.id, m.text, f.text_hash, f.version
+            FROM messages m
+            LEFT JOIN message_features f ON f.id = m.id
+            WHERE m.date_cuba_ts >= ? AND m.date_cuba_ts < ?
+        ''', (start, end)):
+        hash_value = text_hash(text)
+        if version != CLASSIFIER_VERSION or cached_hash != hash_value:
+            stale[message_id] = (hash_value, extract_features(text))
+
+    with conn:
+        save_message_features(conn, stale)
+    return len(stale)
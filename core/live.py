@@ -0,0 +1,143 @@
+import calendar
+import copy
+from collections import Counter
+
+from core.aggregators import consume_rows
+from core.analyzer import build_aggregators, new_analysis, export_analysis_to_json, export_rollup, load_rollup, \
+    merge_rollup, DATA_DIRECTORY, EXPORT_FORMAT_VERSION
+from core.artifacts import write_manifest, write_status
+from core.classes import TelegramMessage, UneAnalysis
+from core.columnar import YearMessages, stream_year_messages
+from core.database import connection, clear_dirty_year
+from core.features import save_message_features
+from core.partials import AnalysisPartial, save_partials
+from core.utils import datestr_to_datetime
+from core.words import refresh_token_counts, merge_token_counts
+
+
+class LiveAnalysis:
+    """
+    Analysis of one year kept in memory and updated message by message, for the live tail of the channel
+    (see `core.scrapper.tail_channel`) and its offline replay (see `benchmarks.live_replay`).
+
+    The aggregators of `core.analyzer.build_aggregators` (with the block and SEN state machines) consume the
+    stored messages of the year once, and then only the ones stored after the last consumed message, so a new
+    post costs a few milliseconds instead of a full analysis. Aggregators can't undo a message: an edit of a
+    consumed message, or a message older than the last consumed one, invalidates the state and the year is
+    loaded again on the next `update`. The analysis is finalized on a copy of the aggregators, so they keep
+    consuming messages after every export.
+
+    The all-time analysis is merged again on every export, from the partials and word counts of the other years,
+    loaded once (until a message of another year is applied), and the current ones of the year.
+    """
+
+    def __init__(self, year: int, read_only: bool = False):
+        """
+        :param year: year of analysis
+        :param read_only: read the messages through read-only connections, and never store anything
+        """
+        self.year = year
+        self.read_only = read_only
+        self.messages = YearMessages()
+        self.partials: dict[int, AnalysisPartial] = {}
+        self.aggregators = []
+        self.consumed_ids: set[int] = set()
+        self.last_key: tuple[int, int] | None = None
+        self.valid = False
+        self.words: dict[int, dict[int, Counter]] = {}
+        # partials and word counts of the other years (see `core.analyzer.load_rollup`)
+        self.rollup: tuple[dict[tuple[int, int], AnalysisPartial],
+                           dict[tuple[int, int], dict[int, Counter]]] | None = None
+
+    def apply(self, message: TelegramMessage) -> bool:
+        """
+        Applies a new or edited message, already stored on the database.
+
+        :param message: the stored message
+        :return: False if the message is not of this year
+        """
+        if int(message.date_cuba[:4]) != self.year:
+            self.rollup = None
+            return False
+
+        date_cuba_ts = calendar.timegm(datestr_to_datetime(message.date_cuba).timetuple())
+        if message.id in self.consumed_ids or (self.last_key and (date_cuba_ts, message.id) <= self.last_key):
+            self.valid = False
+        elif self.valid:
+            self.update()
+        return True
+
+    def update(self) -> int:
+        """
+        Consumes the messages stored after the last consumed one, or every message of the year if the state
+        is not valid (see `LiveAnalysis`).
+
+        :return: number of consumed messages
+        """
+        if not self.valid:
+            self.messages = YearMessages()
+            self.partials = {}
+            self.aggregators = build_aggregators(self.year, self.messages, partials=self.partials)
+            self.consumed_ids = set()
+            self.last_key = None
+            self.valid = True
+
+        rows = stream_year_messages(self.year, self.messages, read_only=self.read_only, after=self.last_key)
+        return consume_rows(self.messages, self.aggregators, self.__track(rows))
+
+    def analysis(self) -> tuple[UneAnalysis, dict[int, AnalysisPartial]]:
+        """
+        Finalizes a copy of the current state.
+
+        :return: tuple (`UneAnalysis`, month partials of the year)
+        """
+        if not self.valid:
+            self.update()
+
+        # the messages are shared, only the state of the aggregators (and the partials they fill) is copied
+        aggregators, partials = copy.deepcopy((self.aggregators, self.partials), {id(self.messages): self.messages})
+        data = new_analysis(self.year)
+        for aggregator in aggregators:
+            aggregator.finalize(data)
+        with connection(self.read_only) as conn:
+            self.words = refresh_token_counts(conn, self.year, persist=not self.read_only)
+        data.top25_most_repeated_words = dict(merge_token_counts(list(self.words.values())).most_common(25))
+        return data, partials
+
+    def export(self, export_version: int = EXPORT_FORMAT_VERSION) -> UneAnalysis:
+        """
+        Exports the current analysis as `core.analyzer.analyze_data` does (JSON, month partials, all-time rollup,
+        manifest and status), and marks the year as up to date.
+
+        :param export_version: JSON export format (see `core.analyzer.analyze_data`)
+        :return: the `UneAnalysis` object
+        """
+        data, partials = self.analysis()
+        if not self.read_only:
+            with connection() as conn:
+                if self.messages.computed_features:
+                    with conn:
+                        save_message_features(conn, self.messages.computed_features)
+                    self.messages.computed_features = {}
+                save_partials(conn, self.year, partials)
+            clear_dirty_year(self.year)
+
+        export_analysis_to_json(data, export_version)
+        if self.rollup is None:
+            monthly, words = load_rollup(read_only=self.read_only, trust_stored=True)
+            self.rollup = ({key: value for key, value in monthly.items() if key[0] != self.year},
+                           {key: value for key, value in words.items() if key[0] != self.year})
+        monthly, words = self.rollup
+        rollup = merge_rollup({**monthly, **{(self.year, month): value for month, value in partials.items()}},
+                              {**words, **{(self.year, month): value for month, value in self.words.items()}},
+                              read_only=self.read_only)
+        export_rollup(export_version, data=rollup)
+        write_manifest(DATA_DIRECTORY)
+        write_status(DATA_DIRECTORY, data.sync_date)
+        return data
+
+    def __track(self, rows):
+        for m in rows:
+            self.consumed_ids.add(m.id)
+            self.last_key = (m.date_cuba_ts, m.id)
+            yield m
@@ -0,0 +1,415 @@
+import json
+import zlib
+from collections import Counter
+
+from core.aggregators import Aggregator, BlockOutageAggregator, SENAggregator, to_msg_count
+from core.classes import UneAnalysis, TelegramMessage, SENFailureAnalysisEvent, Ranking
+from core.columnar import YearMessages
+from core.constants import POSITIVE_EMOJIS, NEGATIVE_EMOJIS, BLOCK_COUNT
+from core.database import year_bounds
+from core.ranking import TopK
+
+# Bump when the content of the partials changes, so every stored partial is recomputed
+PARTIALS_VERSION = 1
+
+SUM_FIELDS = ('messages', 'views', 'replies', 'reactions', 'positive', 'negative', 'text_length', 'sen_mentions')
+COUNTER_FIELDS = ('monthly_views', 'monthly_replies', 'monthly_reactions', 'monthly_messages', 'daily_messages',
+                  'message_types', 'reaction_counts', 'block_mentions', 'block_recoveries', 'block_affectations',
+                  'block_emergencies', 'block_seconds')
+LIST_FIELDS = ('block_weekday_seconds', 'block_hourly_seconds')
+
+
+class AnalysisPartial:
+    """
+    Mergeable partial aggregate of the analysis: the state of every metric of `UneAnalysis` that can be merged,
+    of one month (as stored on the `analysis_partials` table) or, once merged, of any set of months.
+
+    Sums and distributions are added, and first / last messages and top-K heaps keep the best of both (messages
+    are ordered by id, see `core.ranking.TopK.merge`). Block seconds and SEN events are the results of the year
+    state machines (see `PartialsAggregator`), so they are only added up. Word counts have their own month
+    snapshots (see `core.words`).
+    """
+
+    def __init__(self, rankings: list[Ranking]):
+        """
+        :param rankings: message rankings (see `core.analyzer.build_rankings`), for the top-K heaps
+        """
+        self.messages = 0
+        self.views = 0
+        self.replies = 0
+        self.reactions = 0
+        self.positive = 0
+        self.negative = 0
+        self.text_length = 0
+        self.sen_mentions = 0
+        self.first_id = None
+        self.last_id = None
+        self.first_text_id = None
+        self.last_text_id = None
+        self.monthly_views = Counter()
+        self.monthly_replies = Counter()
+        self.monthly_reactions = Counter()
+        self.monthly_messages = Counter()
+        self.daily_messages = Counter()
+        self.message_types = Counter()
+        self.reaction_counts = Counter()
+        self.block_mentions = Counter()
+        self.block_recoveries = Counter()
+        self.block_affectations = Counter()
+        self.block_emergencies = Counter()
+        self.block_seconds = Counter()
+        self.block_weekday_seconds = {i: [0] * 7 for i in range(1, BLOCK_COUNT + 1)}
+        self.block_hourly_seconds = {i: [0] * 24 for i in range(1, BLOCK_COUNT + 1)}
+        self.weekday_days = [0] * 7
+        self.sen_events: list[tuple[int, int, int]] = []
+        self.tops = {ranking.field_name: TopK(ranking.k, ranking.lowest, ranking.latest_on_ties)
+                     for ranking in rankings}
+
+    def merge(self, other: 'AnalysisPartial') -> 'AnalysisPartial':
+        """
+        Adds another partial (of other months) to this one.
+
+        :return: this partial
+        """
+        for name in SUM_FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in COUNTER_FIELDS:
+            getattr(self, name).update(getattr(other, name))
+        for name in LIST_FIELDS:
+            for block, values in getattr(other, name).items():
+                totals = getattr(self, name)[block]
+                for i, value in enumerate(values):
+                    totals[i] += value
+        for i, days in enumerate(other.weekday_days):
+            self.weekday_days[i] += days
+
+        self.first_id = self.__lowest(self.first_id, other.first_id)
+        self.last_id = self.__highest(self.last_id, other.last_id)
+        self.first_text_id = self.__lowest(self.first_text_id, other.first_text_id)
+        self.last_text_id = self.__highest(self.last_text_id, other.last_text_id)
+        self.sen_events = sorted(self.sen_events + other.sen_events)
+        for name, top in other.tops.items():
+            self.tops[name].merge(top)
+        return self
+
+    def message_ids(self) -> set[int]:
+        """
+        Ids of the messages referenced by the partial (first / last messages, tops and SEN events).
+        """
+        ids = {self.first_text_id, self.last_text_id}
+        ids.update(order for top in self.tops.values() for _, order in top.ranked())
+        ids.update(message_id for start, end, _ in self.sen_events for message_id in (start, end))
+        ids.discard(None)
+        return ids
+
+    def finalize(self, data: UneAnalysis, messages: dict[int, TelegramMessage], rankings: list[Ranking]):
+        """
+        Writes the merged metrics to an analysis (as the `core.aggregators` do for a year).
+
+        :param data: the `UneAnalysis` object (see `core.analyzer.new_analysis`)
+        :param messages: referenced messages by id (see `message_ids`)
+        :param rankings: the rankings the partial was built with
+        """
+        n = self.messages
+        data.first_message = messages.get(self.first_text_id)
+        data.last_message = messages.get(self.last_text_id)
+
+        data.total_messages = n
+        data.total_views = self.views
+        data.total_replies = self.replies
+        data.total_reactions = self.reactions
+        data.total_erased_messages = (self.last_id - self.first_id + 1) - n if n else 0
+        data.total_positive_reactions = self.positive
+        data.total_negative_reactions = self.negative
+        if n:
+            data.avg_views = round(self.views / n)
+            data.avg_replies = round(self.replies / n)
+            data.avg_reactions = round(self.reactions / n)
+            data.avg_positive_reactions = round(self.positive / n)
+            data.avg_negative_reactions = round(self.negative / n)
+            data.avg_text_length = round(self.text_length / n)
+
+        data.monthly_views = {i: self.monthly_views[i] for i in range(1, 13)}
+        data.monthly_replies = {i: self.monthly_replies[i] for i in range(1, 13)}
+        data.monthly_reactions = {i: self.monthly_reactions[i] for i in range(1, 13)}
+        data.monthly_messages = {i: self.monthly_messages[i] for i in range(1, 13)}
+        data.daily_messages = {i: self.daily_messages[i] for i in range(1, 367)}
+
+        data.distribution_message = {mt: self.message_types[mt] for mt in [1, 2, 3, 4, 5]}
+        data.distribution_reaction = dict(sorted(self.reaction_counts.items(), key=lambda item: item[1],
+                                                 reverse=True))
+
+        for ranking in rankings:
+            ranked = [to_msg_count(messages[order], score) for score, order in self.tops[ranking.field_name].ranked()
+                      if order in messages]
+            setattr(data, ranking.field_name, (ranked[0] if ranked else None) if ranking.single else ranked)
+
+        for block in data.blocks_analysis:
+            i = block.number
+            block.mentions = self.block_mentions[i]
+            block.declared_recoveries = self.block_recoveries[i]
+            block.declared_affectations = self.block_affectations[i]
+            block.declared_emergencies = self.block_emergencies[i]
+            block.estimated_affected_seconds = self.block_seconds[i]
+            block.weekday_off_seconds = dict(enumerate(self.block_weekday_seconds[i]))
+            block.weekday_off_avg_seconds = {
+                d: seconds / self.weekday_days[d] if self.weekday_days[d] > 0 else 0
+                for d, seconds in enumerate(self.block_weekday_seconds[i])
+            }
+            block.hourly_off_seconds = dict(enumerate(self.block_hourly_seconds[i]))
+
+        events = []
+        for start, end, duration in self.sen_events:
+            start_message = messages.get(start)
+            end_message = messages.get(end)
+            if start_message is None or end_message is None:
+                continue
+            events.append(SENFailureAnalysisEvent(
+                start_date=start_message.date_cuba,
+                start_date_d=start_message.date_cuba_d,
+                start_message=start_message,
+                end_date=end_message.date_cuba,
+                end_date_d=end_message.date_cuba_d,
+                end_message=end_message,
+                estimated_duration_seconds=duration
+            ))
+        data.sen_analysis.mentions = self.sen_mentions
+        data.sen_analysis.total_failure_events = len(events)
+        data.sen_analysis.failure_events = events
+
+    def to_dict(self) -> dict:
+        """
+        JSON serializable state of the partial (see `from_dict`).
+        """
+        return {
+            **{name: getattr(self, name) for name in SUM_FIELDS},
+            **{name: dict(getattr(self, name)) for name in COUNTER_FIELDS + LIST_FIELDS},
+            'first_id': self.first_id,
+            'last_id': self.last_id,
+            'first_text_id': self.first_text_id,
+            'last_text_id': self.last_text_id,
+            'weekday_days': self.weekday_days,
+            'sen_events': self.sen_events,
+            'tops': {name: top.ranked() for name, top in self.tops.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict, rankings: list[Ranking]) -> 'AnalysisPartial':
+        """
+        Partial from its `to_dict` state (JSON object keys are strings again, so numeric keys are converted back).
+        """
+        partial = cls(rankings)
+        for name in SUM_FIELDS + ('first_id', 'last_id', 'first_text_id', 'last_text_id', 'weekday_days'):
+            setattr(partial, name, state[name])
+        for name in COUNTER_FIELDS:
+            setattr(partial, name, Counter({
+                key if name == 'reaction_counts' else int(key): value for key, value in state[name].items()
+            }))
+        for name in LIST_FIELDS:
+            setattr(partial, name, {int(block): values for block, values in state[name].items()})
+        partial.sen_events = [tuple(event) for event in state['sen_events']]
+        for name, ranked in state['tops'].items():
+            if name in partial.tops:
+                for score, order in ranked:
+                    partial.tops[name].push(score, order)
+        return partial
+
+    @staticmethod
+    def __lowest(a, b):
+        return b if a is None else a if b is None else min(a, b)
+
+    @staticmethod
+    def __highest(a, b):
+        return b if a is None else a if b is None else max(a, b)
+
+
+# ----------------------------------------------- AGGREGATOR ------------------------------------------- #
+class PartialsAggregator(Aggregator):
+    """
+    Month partials of a year (see `AnalysisPartial`), in the same pass as the year analysis.
+
+    Block seconds and SEN events are taken from the year state machines on finalize, so it must run after the
+    `BlockOutageAggregator` and `SENAggregator` it is given. SEN events belong to the month they start. Every
+    month of the year gets a partial (weekday averages are relative to the whole year, as in the year analysis).
+    """
+
+    def __init__(self, messages: YearMessages, rankings: list[Ranking], outage: BlockOutageAggregator,
+                 sen: SENAggregator, partials: dict[int, AnalysisPartial]):
+        """
+        :param messages: the `YearMessages` container of the year
+        :param rankings: message rankings (see `core.analyzer.build_rankings`)
+        :param outage: block state machine of the year
+        :param sen: SEN state machine of the year
+        :param partials: dict month -> `AnalysisPartial` to fill
+        """
+        self.messages = messages
+        self.rankings = rankings
+        self.scorers = [(ranking.field_name, ranking.score) for ranking in rankings]
+        self.outage = outage
+        self.sen = sen
+        self.calendar = outage.calendar
+        self.partials = partials
+        self.month = None
+        self.partial = None
+
+    def consume(self, m, features):
+        day = self.calendar.day_index(m.date_cuba_ts)
+        month = self.calendar.months[day]
+        if month != self.month:
+            self.month = month
+            self.partial = self.__partial(month)
+        partial = self.partial
+
+        partial.messages += 1
+        partial.views += m.views
+        partial.replies += m.replies
+        partial.text_length += len(m.text)
+        partial.first_id = m.id if partial.first_id is None else min(partial.first_id, m.id)
+        partial.last_id = m.id if partial.last_id is None else max(partial.last_id, m.id)
+
+        reactions = 0
+        for emoji, count in m.reactions.items():
+            reactions += count
+            if emoji in POSITIVE_EMOJIS:
+                partial.positive += count
+            elif emoji in NEGATIVE_EMOJIS:
+                partial.negative += count
+        partial.reactions += reactions
+        if reactions:
+            partial.reaction_counts.update(m.reactions)
+
+        partial.monthly_messages[month] += 1
+        partial.monthly_views[month] += m.views
+        partial.monthly_replies[month] += m.replies
+        partial.monthly_reactions[month] += reactions
+        partial.daily_messages[day + 1] += 1
+        partial.message_types[features.message_type] += 1
+
+        blocks = features.blocks
+        if blocks.mentioned:
+            partial.block_mentions.update(blocks.mentioned)
+        if blocks.recovered:
+            partial.block_recoveries.update(blocks.recovered)
+        if blocks.affected:
+            partial.block_affectations.update(blocks.affected)
+        if blocks.emergencies:
+            partial.block_emergencies.update(blocks.emergencies)
+        if features.sen_mention:
+            partial.sen_mentions += 1
+
+        if m.text:
+            partial.first_text_id = m.id if partial.first_text_id is None else min(partial.first_text_id, m.id)
+            partial.last_text_id = m.id if partial.last_text_id is None else max(partial.last_text_id, m.id)
+            for name, score in self.scorers:
+                partial.tops[name].push(score(m), m.id)
+
+    def finalize(self, data):
+        for month in range(1, 13):
+            days = self.calendar.month_days(month)
+            partial = self.__partial(month)
+            for weekday in self.calendar.weekdays[days.start:days.stop]:
+                partial.weekday_days[weekday] += 1
+            for i in range(1, BLOCK_COUNT + 1):
+                day_off = self.outage.block_day_off[i]
+                hour_off = self.outage.block_hour_off[i]
+                partial.block_seconds[i] += sum(day_off[days.start:days.stop])
+                for weekday, day_seconds in zip(self.calendar.weekdays[days.start:days.stop],
+                                                day_off[days.start:days.stop]):
+                    partial.block_weekday_seconds[i][weekday] += day_seconds
+                for hour in range(24):
+                    partial.block_hourly_seconds[i][hour] += sum(hour_off[days.start * 24 + hour:days.stop * 24:24])
+
+        ids = self.messages.ids
+        dates = self.messages.date_cuba_ts
+        for start, end in self.sen.events:
+            month = self.calendar.month(dates[start])
+            self.__partial(month).sen_events.append((ids[start], ids[end], dates[end] - dates[start]))
+
+    def __partial(self, month: int) -> AnalysisPartial:
+        partial = self.partials.get(month)
+        if partial is None:
+            partial = self.partials[month] = AnalysisPartial(self.rankings)
+        return partial
+
+
+# ----------------------------------------------- STORAGE ------------------------------------------- #
+def save_partials(conn, year: int, partials: dict[int, AnalysisPartial]):
+    """
+    Replaces the stored month partials of a year.
+
+    :param conn: sqlite connection
+    :param year: year
+    :param partials: dict month -> `AnalysisPartial`
+    """
+    with conn:
+        conn.execute('DELETE FROM analysis_partials WHERE year = ?', (year,))
+        conn.executemany('''
+            INSERT INTO analysis_partials (year, month, version, last_message_id, message_count, data)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [
+            (year, month, PARTIALS_VERSION, partial.last_id, partial.messages,
+             zlib.compress(json.dumps(partial.to_dict(), separators=(',', ':'), ensure_ascii=False).encode('utf-8')))
+            for month, partial in sorted(partials.items())
+        ])
+
+def load_partials(conn, rankings: list[Ranking],
+                  years: list[int] | None = None) -> dict[tuple[int, int], AnalysisPartial]:
+    """
+    Stored month partials (of the current `PARTIALS_VERSION`).
+
+    :param conn: sqlite connection
+    :param rankings: message rankings the partials were built with
+    :param years: only these years (default: every year)
+    :return: dict (year, month) -> `AnalysisPartial`, in date order
+    """
+    partials = {}
+    for year, month, data in conn.execute('''
+            SELECT year, month, data FROM analysis_partials
+            WHERE version = ?
+            ORDER BY year, month
+        ''', (PARTIALS_VERSION,)):
+        if years is None or year in years:
+            partials[(year, month)] = AnalysisPartial.from_dict(json.loads(zlib.decompress(data)), rankings)
+    return partials
+
+def stale_partial_years(conn, years: list[int] | None = None) -> list[int]:
+    """
+    Years whose stored partials are missing, outdated or not consistent with their messages (last message id
+    and count of each month), or that have no messages anymore. Content changes (texts, views, replies, reactions)
+    are covered by `core.database.save_messages_to_db`, which removes the partials of the years it marks as dirty.
+
+    :param conn: sqlite connection
+    :param years: only these years, whose messages are read through the `date_cuba_ts` index (default: every
+        year, which reads the whole archive)
+    :return: sorted list of years
+    """
+    if years is not None and not years:
+        return []
+
+    where, params = '', []
+    if years is not None:
+        where = 'WHERE ' + ' OR '.join(['(date_cuba_ts >= ? AND date_cuba_ts < ?)'] * len(years))
+        params = [bound for year in years for bound in year_bounds(year)]
+    signatures = {
+        (year, month): (last_id, count)
+        for year, month, last_id, count in conn.execute(f'''
+            SELECT CAST(strftime('%Y', date_cuba) AS INTEGER), CAST(strftime('%m', date_cuba) AS INTEGER),
+                   MAX(id), COUNT(*)
+            FROM messages
+            {where}
+            GROUP BY 1, 2
+        ''', params)
+    }
+    stored = {
+        (year, month): (last_id, count, version)
+        for year, month, version, last_id, count in conn.execute(
+            'SELECT year, month, version, last_message_id, message_count FROM analysis_partials'
+        )
+        if years is None or year in years
+    }
+
+    stale = {year for (year, month), signature in signatures.items()
+             if stored.get((year, month)) != (*signature, PARTIALS_VERSION)}
+    years_with_messages = {year for year, _ in signatures}
+    stale.update(year for year, _ in stored if year not in years_with_messages)
+    return sorted(year for year in stale if years is None or year in years)
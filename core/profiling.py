@@ -0,0 +1,146 @@
+import cProfile
+import datetime
+import json
+import os
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+# Path of the JSON-lines performance log (spans are only recorded when it is set)
+PERF_LOG_ENV = 'UNE_PERF_LOG'
+# Directory for cProfile dumps (`analyze_<year>.prof`), independent of the log
+PROFILE_ENV = 'UNE_PROFILE'
+# Set to 0 to skip tracemalloc (it slows down the analysis) while logging spans
+PERF_MEMORY_ENV = 'UNE_PERF_MEMORY'
+# Identifier shared by the spans of one run, also in the worker processes
+RUN_ID_ENV = 'UNE_RUN_ID'
+
+
+class Spans:
+    """
+    Named spans of the analysis of one year: wall and CPU time, processed messages and, while tracemalloc is
+    tracing, the memory allocated (still held at the end) and the peak memory above the start of each span.
+
+    Spans can be nested; each record keeps the name of its parent. When disabled, spans cost almost nothing.
+    """
+
+    def __init__(self, year: int, enabled: bool):
+        self.year = year
+        self.enabled = enabled
+        self.records = []
+        self.__stack = []
+
+    @contextmanager
+    def span(self, name: str, messages: int = 0):
+        """
+        Measures the block inside. The yielded record can be updated (e.g. `record['messages'] = n`).
+
+        :param name: name of the span
+        :param messages: number of messages processed in the span
+        """
+        record = {'span': name, 'parent': self.__stack[-1]['span'] if self.__stack else None, 'messages': messages}
+        if not self.enabled:
+            yield record
+            return
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.__stack:
+                self.__stack[-1]['_peak'] = max(self.__stack[-1]['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start_memory'] = record['_peak'] = current
+
+        self.__stack.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall, 6)
+            record['cpu_seconds'] = round(time.process_time() - cpu, 6)
+            self.__stack.pop()
+
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(record.pop('_peak'), peak)
+                start = record.pop('_start_memory')
+                record['allocated_bytes'] = current - start
+                record['peak_bytes'] = peak - start
+                if self.__stack:
+                    self.__stack[-1]['_peak'] = max(self.__stack[-1]['_peak'], peak)
+            self.records.append(record)
+
+    def add(self, name: str, wall_seconds: float, messages: int = 0):
+        """
+        Records a span measured elsewhere (e.g. the time of one aggregator along the single pass), as a child of the
+        current span.
+        """
+        if self.enabled:
+            self.records.append({
+                'span': name, 'parent': self.__stack[-1]['span'] if self.__stack else None, 'messages': messages,
+                'wall_seconds': round(wall_seconds, 6),
+            })
+
+
+def start_run() -> str:
+    """
+    Identifier of the current run, created on first call and shared (through the environment) with the processes
+    started afterwards, so all the spans of a parallel analysis belong to the same run.
+    """
+    return os.environ.setdefault(RUN_ID_ENV, uuid.uuid4().hex)
+
+
+@contextmanager
+def profile_year(year: int):
+    """
+    Instruments the analysis of a year, according to the environment:
+
+    - `UNE_PERF_LOG=<path>`: spans are appended to the JSON-lines log (one line per span, with the run id, year,
+      timestamp and pid), tracing memory with tracemalloc unless `UNE_PERF_MEMORY=0`.
+    - `UNE_PROFILE=<directory>`: the whole analysis runs under cProfile, dumped to `<directory>/analyze_<year>.prof`
+      (see `python -m pstats`).
+
+    :param year: year of analysis
+    :return: the `Spans` of the year, already inside a root `analyze` span
+    """
+    log_path = os.getenv(PERF_LOG_ENV)
+    profile_directory = os.getenv(PROFILE_ENV)
+    spans = Spans(year, enabled=bool(log_path))
+
+    trace_memory = spans.enabled and os.getenv(PERF_MEMORY_ENV, '1') != '0' and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile_directory else None
+    if profiler:
+        profiler.enable()
+
+    try:
+        with spans.span('analyze'):
+            yield spans
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(profile_directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_directory, f"analyze_{year}.prof"))
+        if trace_memory:
+            tracemalloc.stop()
+        if spans.enabled:
+            __write_log(log_path, spans)
+
+
+def __write_log(path: str, spans: Spans):
+    common = {
+        'run': start_run(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'year': spans.year,
+    }
+    lines = "".join(json.dumps({**common, **record}) + "\n" for record in spans.records)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # A single append per year, so parallel workers don't interleave their lines
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(lines)
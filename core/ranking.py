@@ -0,0 +1,55 @@
+import heapq
+
+
+class TopK:
+    """
+    Bounded min-heap keeping the K best items of a stream, in O(log K) per pushed item and O(K) memory.
+
+    Items are ranked by score (highest first, or lowest first with `lowest`) and ties are broken by their order
+    in the stream: the earliest item wins by default (as a stable sort would keep it first), the latest one with
+    `latest_on_ties`.
+    """
+
+    def __init__(self, k: int, lowest: bool = False, latest_on_ties: bool = False):
+        """
+        :param k: number of items to keep
+        :param lowest: rank the lowest scores first (e.g. shortest messages)
+        :param latest_on_ties: on equal scores, rank the latest item first
+        """
+        self.k = k
+        self.lowest = lowest
+        self.latest_on_ties = latest_on_ties
+        self.heap = []
+
+    def push(self, score, order: int):
+        """
+        Offers one item.
+
+        :param score: score of the item
+        :param order: position of the item in the stream (e.g. its index), also used to retrieve it
+        """
+        item = (-score if self.lowest else score, order if self.latest_on_ties else -order)
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, item)
+        elif item > self.heap[0]:
+            heapq.heapreplace(self.heap, item)
+
+    def merge(self, other: 'TopK'):
+        """
+        Offers every item of another `TopK` of the same kind, so this one keeps the K best items of both streams.
+        Orders must be comparable across both streams (e.g. message ids).
+        """
+        for score, order in other.ranked():
+            self.push(score, order)
+
+    def ranked(self) -> list[tuple[int, int]]:
+        """
+        :return: list of (score, order) tuples, best first
+        """
+        return [
+            (-key if self.lowest else key, tie if self.latest_on_ties else -tie)
+            for key, tie in sorted(self.heap, reverse=True)
+        ]
+
+    def __len__(self):
+        return len(self.heap)
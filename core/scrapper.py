@@ -1,43 +1,316 @@
+import asyncio
+import bisect
+import datetime
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telethon import events
+from telethon.errors import FloodWaitError
 from telethon.sessions import StringSession
 from telethon.sync import TelegramClient
 import pytz
-from core.database import setup_database, save_message_to_db
-from core.classes import TelegramMessage
-import os
-from dotenv import load_dotenv
+from core.analyzer import EXPORT_FORMAT_VERSION
+from core.config import telegram_config, channel_username
+from core.database import connection, setup_database, save_messages_to_db, get_sync_state, set_sync_state, get_last_message_id, \
+    close_databases
+from core.classes import TelegramMessage, IdRange
+from core.live import LiveAnalysis
+
+__cuba_tz = pytz.timezone('America/Havana')
+
+REFRESH_WINDOW = 50
+BACKFILL_CHECKPOINT = 'backfill_checkpoint'
+DEBOUNCE_SECONDS = 30.0
+
+def process_all_messages(client=None, resume: bool = True) -> set[int]:
+    """
+    Process all messages from telegram channel and store them on database (in batches)
+
+    The backfill is checkpointed after every stored batch, so an interrupted run is resumed
+    from its checkpoint instead of starting over from the first message.
+    :param client: telethon client (by default one is created from the environment credentials)
+    :param resume: resume an interrupted backfill from its checkpoint
+    :return: set of years with inserted or changed messages
+    """
+    with connection() as conn:
+        min_id = (get_sync_state(conn, BACKFILL_CHECKPOINT) or 0) if resume else 0
+        if min_id:
+            print(f'⏩ Resuming backfill after message {min_id}')
+
+        with client or __client() as client:
+            messages = client.iter_messages(channel_username(), reverse=True, min_id=min_id)
+            changed_years = save_messages_to_db(conn, (__to_telegram_message(message) for message in messages),
+                                                wal=True, checkpoint=BACKFILL_CHECKPOINT)
+        set_sync_state(conn, BACKFILL_CHECKPOINT, None)
+        conn.commit()
+
+    return changed_years
+
+def process_latest_messages(client=None, window: int = REFRESH_WINDOW) -> set[int]:
+    """
+    Process latest messages from telegram channel and store them on database
+
+    The latest `window` messages are always fetched again to refresh their views, replies and reactions.
+    Only when there are more new messages than that, the gap since the stored high-water mark is fetched too.
+    :param client: telethon client (by default one is created from the environment credentials)
+    :param window: number of recent messages to refresh
+    :return: set of years with inserted or changed messages
+    """
+    with connection() as conn:
+        last_id = get_last_message_id(conn)
+
+        with client or __client() as client:
+            recent = list(client.get_messages(channel_username(), limit=window))
+            oldest_recent_id = min((message.id for message in recent), default=0)
+
+            messages = []
+            if last_id and oldest_recent_id > last_id + 1:
+                print(f'⏩ Fetching new messages between {last_id} and {oldest_recent_id}')
+                messages.extend(client.iter_messages(channel_username(), reverse=True,
+                                                     min_id=last_id, max_id=oldest_recent_id))
+            messages.extend(reversed(recent))
+
+            changed_years = save_messages_to_db(conn, (__to_telegram_message(message) for message in messages))
+
+    return changed_years
+
+def process_all_messages_concurrently(client=None, concurrency: int = 4, resume: bool = True) -> set[int]:
+    """
+    Process all messages from telegram channel and store them on database, fetching id ranges in parallel
+    (see `backfill_messages`)
+
+    :param client: telethon client (by default one is created from the environment credentials)
+    :param concurrency: number of id ranges fetched in parallel
+    :param resume: resume an interrupted backfill from its checkpoint
+    :return: set of years with inserted or changed messages
+    """
+    return asyncio.run(backfill_messages(client, concurrency=concurrency, resume=resume))
+
+async def backfill_messages(client=None, concurrency: int = 4, queue_size: int = 2000, batch_size: int = 500,
+                            resume: bool = True) -> set[int]:
+    """
+    Asyncio backfill pipeline: the channel history (after the checkpoint) is split in `concurrency` id ranges,
+    each one fetched by a producer with telethon's async `iter_messages` into a bounded queue, while a writer
+    thread stores the queued messages in batches. Network waits and disk writes overlap.
+
+    A flood wait on any producer pauses all of them for the required time. The checkpoint only advances
+    over contiguous stored ranges, so an interrupted backfill is resumed without gaps.
+    :param client: telethon client (by default one is created from the environment credentials)
+    :param concurrency: number of id ranges fetched in parallel
+    :param queue_size: maximum number of fetched messages waiting to be stored
+    :param batch_size: number of messages per transaction
+    :param resume: resume an interrupted backfill from its checkpoint
+    :return: set of years with inserted or changed messages
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=queue_size)
+    resume_at = 0.0
+
+    # sqlite connections are bound to their thread, so every database call goes through the same worker
+    executor = ThreadPoolExecutor(max_workers=1)
+    conn = await loop.run_in_executor(executor, setup_database)
+
+    async def fetch_range(index: int, id_range: IdRange):
+        nonlocal resume_at
+        min_id = id_range.min_id
+        try:
+            while True:
+                try:
+                    async for message in client.iter_messages(channel_username(), reverse=True,
+                                                              min_id=min_id, max_id=id_range.max_id + 1):
+                        if (delay := resume_at - loop.time()) > 0:
+                            await asyncio.sleep(delay)
+                        await queue.put((index, __to_telegram_message(message)))
+                        min_id = message.id
+                    break
+                except FloodWaitError as e:
+                    print(f'⏳ Flood wait of {e.seconds} s fetching messages after {min_id}')
+                    resume_at = max(resume_at, loop.time() + e.seconds)
+                    await asyncio.sleep(e.seconds)
+            id_range.fetched = True
+        except Exception:
+            await queue.put((index, None))
+            raise
+        await queue.put((index, None))
 
-load_dotenv()
-__api_id = int(os.getenv("API_ID"))
-__api_hash = os.getenv("API_HASH")
-__api_session = os.getenv("API_SESSION")
-__phone = os.getenv("PHONE")
-__channel_username = os.getenv("CHANNEL_USERNAME")
-__session = StringSession(__api_session) if __api_session else 'session_name'
+    try:
+        min_id = (await loop.run_in_executor(executor, get_sync_state, conn, BACKFILL_CHECKPOINT) or 0) if resume else 0
+        if min_id:
+            print(f'⏩ Resuming backfill after message {min_id}')
 
-def process_all_messages():
+        async with client or __client() as client:
+            latest = await client.get_messages(channel_username(), limit=1)
+            ranges = split_id_range(min_id, latest[0].id if latest else min_id, concurrency)
+
+            writer = asyncio.ensure_future(
+                loop.run_in_executor(executor, __write_queued_messages, conn, queue, loop, ranges, batch_size)
+            )
+            producers = asyncio.gather(*(fetch_range(i, r) for i, r in enumerate(ranges)), return_exceptions=True)
+
+            await asyncio.wait([writer, producers], return_when=asyncio.FIRST_EXCEPTION)
+            if writer.done() and writer.exception():
+                producers.cancel()
+                raise writer.exception()
+
+            errors = [result for result in await producers if isinstance(result, Exception)]
+            changed_years = await writer
+            if errors:
+                raise errors[0]
+    finally:
+        await loop.run_in_executor(executor, conn.close)
+        executor.shutdown()
+
+    return changed_years
+
+def tail_messages(client=None, debounce: float = DEBOUNCE_SECONDS, export_version: int = EXPORT_FORMAT_VERSION):
+    """
+    Live mode: syncs the latest messages and then keeps listening to the channel (see `tail_channel`) until
+    the client is disconnected.
     """
-    Process all messages from telegram channel and store them on database
+    process_latest_messages(client)
+    asyncio.run(tail_channel(client, debounce=debounce, export_version=export_version))
+
+async def tail_channel(client=None, debounce: float = DEBOUNCE_SECONDS,
+                       export_version: int = EXPORT_FORMAT_VERSION):
     """
-    conn = setup_database()
+    Listens to new and edited messages of the channel (telethon `NewMessage` and `MessageEdited` events), storing
+    each one and applying it to the in-memory analysis of its year (see `core.live.LiveAnalysis`), so the
+    analysis is never recomputed from scratch on a new post.
 
-    with TelegramClient(__session, __api_id, __api_hash) as client:
-        for message in client.iter_messages(__channel_username, reverse=True):
-            __process_message(conn, message)
-        conn.close()
+    Exports are debounced: the first change schedules one export `debounce` seconds later, and the changes
+    until then are exported together. When a message of a new year arrives, the previous year is exported and
+    the new one is followed. Messages of older years are only stored (their years stay dirty, see `main.analyze`).
 
-def process_latest_messages():
+    Database writes, analysis updates and exports run on a worker thread, so they never stall the delivery of
+    events. A single worker keeps them in order (and sqlite connections are bound to their thread).
+    :param client: telethon client (by default one is created from the environment credentials)
+    :param debounce: seconds between the first change and its export
+    :param export_version: JSON export format (see `core.analyzer.analyze_data`)
     """
-    Process latest 50 messages from telegram channel and store them on database
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    exports = set()
+    pending = None
+
+    # the shared writer of this thread (e.g. opened by `process_latest_messages`) is opened again by the worker
+    close_databases()
+    live = LiveAnalysis(datetime.datetime.now(__cuba_tz).year)
+
+    def store_and_apply(analysis: LiveAnalysis, message: TelegramMessage) -> bool:
+        # a single job, so no export runs between storing a message and applying it
+        with connection() as conn:
+            if not save_messages_to_db(conn, [message]):
+                return False
+        return analysis.apply(message)
+
+    def export(analysis: LiveAnalysis):
+        started = time.perf_counter()
+        analysis.export(export_version)
+        print(f'📤 Live analysis of {analysis.year} exported in {time.perf_counter() - started:.2f} s')
+
+    def schedule_export():
+        nonlocal pending
+        pending = None
+        future = loop.run_in_executor(executor, export, live)
+        exports.add(future)
+        future.add_done_callback(exported)
+
+    def exported(future: asyncio.Future):
+        exports.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f'❌ Error exporting the live analysis: {future.exception()}')
+
+    async def on_message(event):
+        nonlocal live, pending
+        message = __to_telegram_message(event.message)
+        year = int(message.date_cuba[:4])
+        if year > live.year:
+            if pending is not None:
+                pending.cancel()
+                schedule_export()
+            live = LiveAnalysis(year)
+
+        started = time.perf_counter()
+        if await loop.run_in_executor(executor, store_and_apply, live, message):
+            print(f'⚡ Message {message.id} applied in {(time.perf_counter() - started) * 1000:.1f} ms')
+            if pending is None:
+                pending = loop.call_later(debounce, schedule_export)
+
+    try:
+        await loop.run_in_executor(executor, live.update)
+        async with client or __client() as client:
+            client.add_event_handler(on_message, events.NewMessage(chats=channel_username()))
+            client.add_event_handler(on_message, events.MessageEdited(chats=channel_username()))
+            print(f'👂 Listening to {channel_username()}')
+            try:
+                await client.run_until_disconnected()
+            finally:
+                if pending is not None:
+                    pending.cancel()
+                    schedule_export()
+                await asyncio.gather(*exports, return_exceptions=True)
+    finally:
+        await loop.run_in_executor(executor, close_databases)
+        executor.shutdown()
+
+def split_id_range(min_id: int, max_id: int, parts: int) -> list[IdRange]:
+    """
+    Splits the message ids in (min_id, max_id] in contiguous ranges.
+
+    :param min_id: exclusive lower bound
+    :param max_id: inclusive upper bound
+    :param parts: maximum number of ranges
+    :return: list of `IdRange` objects
+    """
+    step = max(1, math.ceil((max_id - min_id) / max(1, parts)))
+    return [
+        IdRange(min_id=lower, max_id=min(lower + step, max_id), last_written_id=lower)
+        for lower in range(min_id, max_id, step)
+    ]
+
+def backfill_checkpoint(ranges: list[IdRange]) -> int | None:
+    """
+    Highest message id such that every message up to it is stored, None if all ranges are done.
     """
-    conn = setup_database()
-    with TelegramClient(__session, __api_id, __api_hash) as client:
-        messages = client.get_messages(__channel_username, limit=50)
+    for id_range in ranges:
+        if not id_range.done:
+            return id_range.last_written_id
+    return None
 
-        for message in messages:
-            __process_message(conn, message)
-    conn.close()
+def __write_queued_messages(conn, queue: asyncio.Queue, loop, ranges: list[IdRange], batch_size: int) -> set[int]:
+    upper_bounds = [id_range.max_id for id_range in ranges]
 
-def __process_message(conn, message):
+    def queued_messages():
+        remaining = len(ranges)
+        while remaining:
+            index, msg = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+            if msg is None:
+                remaining -= 1
+                ranges[index].done = ranges[index].fetched
+            else:
+                yield msg
+
+    def checkpoint(batch_conn, batch: list[TelegramMessage]):
+        for msg in batch:
+            id_range = ranges[bisect.bisect_left(upper_bounds, msg.id)]
+            id_range.last_written_id = max(id_range.last_written_id, msg.id)
+        set_sync_state(batch_conn, BACKFILL_CHECKPOINT, backfill_checkpoint(ranges))
+
+    changed_years = save_messages_to_db(conn, queued_messages(), batch_size=batch_size, wal=True, on_batch=checkpoint)
+    with conn:
+        set_sync_state(conn, BACKFILL_CHECKPOINT, backfill_checkpoint(ranges))
+    return changed_years
+
+def __client() -> TelegramClient:
+    config = telegram_config()
+    session = StringSession(config.api_session) if config.api_session else 'session_name'
+    return TelegramClient(session, config.api_id, config.api_hash)
+
+def __to_telegram_message(message) -> TelegramMessage:
+    """
+    Converts a telethon message to a `TelegramMessage`.
+    """
     reactions = {}
     if hasattr(message, 'reactions') and hasattr(message.reactions, 'results'):
         for reaction in message.reactions.results:
@@ -47,16 +320,14 @@ def __process_message(conn, message):
 
     views = getattr(message, 'views', 0)
     replies_count = 0
-    print(message)
     if hasattr(message, 'replies') and message.replies:
         replies_count = message.replies.replies
 
     utc_time = message.date
-    cuba_tz = pytz.timezone('America/Havana')
-    cuba_time = utc_time.astimezone(cuba_tz)
+    cuba_time = utc_time.astimezone(__cuba_tz)
     cuba_date = cuba_time.strftime("%Y-%m-%d %H:%M:%S")
 
-    msg = TelegramMessage(
+    return TelegramMessage(
         id=message.id,
         date_utc=message.date.strftime("%Y-%m-%d %H:%M:%S"),
         date_cuba=cuba_date,
@@ -64,6 +335,4 @@ def __process_message(conn, message):
         views=views,
         replies=replies_count,
         text=message.text
-    )
-    save_message_to_db(conn, msg)
-    print(msg)
\ No newline at end of file
+    )
\ No newline at end of file
@@ -1,9 +1,14 @@
 import json
-from dataclasses import asdict, is_dataclass
+from dataclasses import asdict, is_dataclass, fields
 from datetime import datetime
 from enum import Enum
 
-from core.classes import MessageType
+from core.classes import MessageType, TelegramMessage, TelegramMessageWithCount, UneAnalysis
+
+COMPACT_FORMAT_VERSION = 2
+# Fields that change on every run without any data change, exported to the status file instead
+VOLATILE_FIELDS = {'sync_date'}
+COMPACT_MESSAGE_FIELDS = ['id', 'date_utc', 'date_cuba', 'reactions', 'views', 'replies', 'text']
 
 class UneAnalysisEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -15,4 +20,67 @@ class UneAnalysisEncoder(json.JSONEncoder):
             return obj.value
         if is_dataclass(obj):
             return asdict(obj)
-        return super().default(obj)
\ No newline at end of file
+        return super().default(obj)
+
+def to_compact_dict(analysis: UneAnalysis) -> dict:
+    """
+    Converts the analysis to the v2 (compact) export format.
+
+    Every exported message is stored once in a `messages` table keyed by id, and the analysis references it
+    by id (`{"id": ..., "count": ...}` for messages with count). The fields that can be derived on the client
+    (`link` from `link_base`, and every `*_d` datetime duplicate) are dropped.
+    :param analysis: the `UneAnalysis` object
+    :return: JSON serializable dict (datetimes still need `UneAnalysisEncoder`)
+    """
+    messages = {}
+    link_base = ""
+
+    def compact(obj):
+        nonlocal link_base
+        if isinstance(obj, TelegramMessage):
+            messages.setdefault(obj.id, {name: getattr(obj, name) for name in COMPACT_MESSAGE_FIELDS})
+            link_base = link_base or obj.link.rsplit('/', 1)[0]
+            return {"id": obj.id, "count": obj.count} if isinstance(obj, TelegramMessageWithCount) else obj.id
+        if is_dataclass(obj):
+            return {f.name: compact(getattr(obj, f.name)) for f in fields(obj) if not f.name.endswith('_d')}
+        if isinstance(obj, list):
+            return [compact(value) for value in obj]
+        if isinstance(obj, dict):
+            return {key: compact(value) for key, value in obj.items()}
+        return obj
+
+    data = without_volatile_fields(compact(analysis))
+    return {"version": COMPACT_FORMAT_VERSION, "link_base": link_base, **data, "messages": messages}
+
+def compact_legacy_dict(analysis_dict: dict) -> dict:
+    """
+    Converts an analysis exported in the v1 format (the `asdict` of an `UneAnalysis`) to the v2 (compact) format,
+    as `to_compact_dict` does with the `UneAnalysis` object.
+
+    :param analysis_dict: deserialized v1 analysis
+    :return: JSON serializable dict
+    """
+    messages = {}
+    link_base = ""
+
+    def compact(obj):
+        nonlocal link_base
+        if isinstance(obj, dict) and 'link' in obj and 'date_utc' in obj:
+            messages.setdefault(obj['id'], {name: obj.get(name) for name in COMPACT_MESSAGE_FIELDS})
+            link_base = link_base or obj['link'].rsplit('/', 1)[0]
+            return {"id": obj['id'], "count": obj['count']} if 'count' in obj else obj['id']
+        if isinstance(obj, dict):
+            # `*_d` duplicates sit next to the field they duplicate
+            return {key: compact(value) for key, value in obj.items() if not (key.endswith('_d') and key[:-2] in obj)}
+        if isinstance(obj, list):
+            return [compact(value) for value in obj]
+        return obj
+
+    data = without_volatile_fields(compact(analysis_dict))
+    return {"version": COMPACT_FORMAT_VERSION, "link_base": link_base, **data, "messages": messages}
+
+def without_volatile_fields(analysis_dict: dict) -> dict:
+    """
+    Removes the `VOLATILE_FIELDS` of a serialized analysis, so its content (and hash) only changes with the data.
+    """
+    return {key: value for key, value in analysis_dict.items() if key not in VOLATILE_FIELDS}
@@ -1,17 +1,14 @@
-import os
-from dotenv import load_dotenv
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 
-load_dotenv()
-__api_id = int(os.getenv("API_ID"))
-__api_hash = os.getenv("API_HASH")
+from core.config import telegram_config
 
 def session_generator():
     """
         Prints out the session from Telegram (API_SESSION) according to API_ID and API_HASH
     """
-    with TelegramClient(StringSession(), __api_id, __api_hash) as client:
+    config = telegram_config()
+    with TelegramClient(StringSession(), config.api_id, config.api_hash) as client:
         print("Your string session is:")
         print(client.session.save())
 
@@ -0,0 +1,103 @@
+import calendar
+import datetime
+from array import array
+
+DAY_SECONDS = 24 * 60 * 60
+HOUR_SECONDS = 60 * 60
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+
+
+class YearCalendar:
+    """
+    Epoch-day offsets of a year, so timestamps (epoch seconds, see `date_cuba_ts`) are bucketed by
+    day of year, month, weekday and hour with integer arithmetic and lookup tables instead of datetimes.
+    """
+
+    def __init__(self, year: int):
+        self.year = year
+        self.start = calendar.timegm((year, 1, 1, 0, 0, 0))
+        self.first_day = self.start // DAY_SECONDS
+        self.days = 366 if calendar.isleap(year) else 365
+
+        start_date = datetime.date(year, 1, 1)
+        self.months = bytes((start_date + datetime.timedelta(days=i)).month for i in range(self.days))
+        self.weekdays = bytes((self.first_day + i + EPOCH_WEEKDAY) % 7 for i in range(self.days))
+
+    def day_index(self, ts: int) -> int:
+        """
+        0-based day of the year of a timestamp.
+        """
+        return ts // DAY_SECONDS - self.first_day
+
+    def month(self, ts: int) -> int:
+        return self.months[self.day_index(ts)]
+
+    def month_days(self, month: int) -> range:
+        """
+        0-based days of the year of a month.
+        """
+        start = self.months.find(month)
+        return range(start, start + calendar.monthrange(self.year, month)[1])
+
+    def weekday_counts(self) -> dict[int, int]:
+        """
+        Number of days of the year for each weekday (Monday is 0).
+        """
+        counts = {d: 0 for d in range(7)}
+        for weekday in self.weekdays:
+            counts[weekday] += 1
+        return counts
+
+    def day_buckets(self) -> array:
+        """
+        Zeroed per-day seconds buckets of the year (see `split_interval`).
+        """
+        return array('q', [0]) * self.days
+
+    def hour_buckets(self) -> array:
+        """
+        Zeroed per-hour seconds buckets of the year (see `split_interval`).
+        """
+        return array('q', [0]) * (self.days * 24)
+
+    def fold_by_month(self, day_buckets: array) -> dict[int, int]:
+        totals = {m: 0 for m in range(1, 13)}
+        for month, seconds in zip(self.months, day_buckets):
+            totals[month] += seconds
+        return totals
+
+    def fold_by_weekday(self, day_buckets: array) -> dict[int, int]:
+        totals = {d: 0 for d in range(7)}
+        for weekday, seconds in zip(self.weekdays, day_buckets):
+            totals[weekday] += seconds
+        return totals
+
+    @staticmethod
+    def fold_by_hour(hour_buckets: array) -> dict[int, int]:
+        return {h: sum(hour_buckets[h::24]) for h in range(24)}
+
+
+def split_interval(start: int, end: int, bucket_seconds: int, buckets: array, origin: int):
+    """
+    Adds the seconds of the interval [start, end) to every bucket it overlaps.
+
+    Partial buckets only happen at both ends, the ones in between receive `bucket_seconds` each.
+    :param start: start timestamp (epoch seconds)
+    :param end: end timestamp (epoch seconds)
+    :param bucket_seconds: size of the buckets (e.g. `DAY_SECONDS` or `HOUR_SECONDS`)
+    :param buckets: seconds of each bucket, where bucket 0 starts at `origin`
+    :param origin: timestamp of the start of the first bucket
+    """
+    if end <= start:
+        return
+
+    first = (start - origin) // bucket_seconds
+    last = (end - 1 - origin) // bucket_seconds
+    if first == last:
+        buckets[first] += end - start
+        return
+
+    buckets[first] += origin + (first + 1) * bucket_seconds - start
+    for bucket in range(first + 1, last):
+        buckets[bucket] += bucket_seconds
+    buckets[last] += end - origin - last * bucket_seconds
@@ -0,0 +1,199 @@
+import calendar
+import hashlib
+import json
+import re
+import zlib
+from collections import Counter
+from itertools import pairwise
+
+from core.constants import STOP_WORDS
+from core.database import connection, year_bounds
+
+# Bump when the tokenization changes, so every stored snapshot is recomputed
+TOKENIZER_VERSION = 1
+NGRAMS = (1, 2)
+
+WORD_REGEX = re.compile(r'[a-záéíóúüñ]{2,}')
+ACCENT_FOLDING = str.maketrans('áéíóúü', 'aeiouu')
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Words of a message without stop words.
+
+    :param text: lowercased text of the message
+    :return: list of words in text order
+    """
+    return [word for word in WORD_REGEX.findall(text) if word not in STOP_WORDS]
+
+def fold_accents(token: str) -> str:
+    """
+    Removes acute accents and diaeresis (ñ is kept, it is a different letter).
+    """
+    return token.translate(ACCENT_FOLDING)
+
+def count_tokens(texts, counters: dict[int, Counter] | None = None) -> dict[int, Counter]:
+    """
+    Counts words (1-grams) and pairs of consecutive words (2-grams) of several messages.
+
+    :param texts: texts of the messages
+    :param counters: counters to update (by n-gram size), new ones by default
+    :return: dict n -> `Counter`
+    """
+    counters = counters if counters is not None else {n: Counter() for n in NGRAMS}
+    for text in texts:
+        if not text:
+            continue
+        tokens = tokenize(text.lower())
+        counters[1].update(tokens)
+        counters[2].update(f"{a} {b}" for a, b in pairwise(tokens))
+    return counters
+
+def refresh_token_counts(conn, year: int, persist: bool = True) -> dict[int, dict[int, Counter]]:
+    """
+    Per-month token counts of a year, from the `token_counts` snapshots.
+
+    A month snapshot is reused while its messages keep the same last message id, count and texts (hashed, see
+    `month_text_signatures`) and `TOKENIZER_VERSION` is the same. Otherwise the month is tokenized again and, with
+    `persist`, its snapshot replaced.
+    :param conn: sqlite connection (read-only connections need `persist=False`)
+    :param year: year
+    :param persist: store the recomputed snapshots
+    :return: dict month -> n -> `Counter` (months without messages are missing)
+    """
+    signatures = month_text_signatures(conn, year)
+    snapshots = {}
+    for month, ngram, version, last_id, count, hash_value, counts in conn.execute('''
+            SELECT month, ngram, version, last_message_id, message_count, text_hash, counts
+            FROM token_counts
+            WHERE year = ?
+        ''', (year,)):
+        if version == TOKENIZER_VERSION and signatures.get(month) == (last_id, count, hash_value):
+            snapshots.setdefault(month, {})[ngram] = Counter(json.loads(zlib.decompress(counts)))
+
+    result = {}
+    for month, signature in signatures.items():
+        if len(snapshots.get(month, {})) == len(NGRAMS):
+            result[month] = snapshots[month]
+            continue
+
+        month_start, month_end = __month_bounds(year, month)
+        texts = (row[0] for row in conn.execute('''
+            SELECT text FROM messages
+            WHERE date_cuba_ts >= ? AND date_cuba_ts < ?
+            ORDER BY date_cuba_ts, id
+        ''', (month_start, month_end)))
+        result[month] = count_tokens(texts)
+
+        if persist:
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO token_counts
+                        (year, month, ngram, version, last_message_id, message_count, text_hash, counts)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', [
+                    (year, month, n, TOKENIZER_VERSION, *signature,
+                     zlib.compress(json.dumps(counter, ensure_ascii=False).encode('utf-8')))
+                    for n, counter in result[month].items()
+                ])
+
+    if persist:
+        with conn:
+            conn.execute(
+                f'DELETE FROM token_counts WHERE year = ? AND month NOT IN ({",".join("?" * len(signatures))})',
+                (year, *signatures)
+            )
+    return dict(sorted(result.items()))
+
+def load_token_counts(conn, year: int) -> dict[int, dict[int, Counter]]:
+    """
+    Stored per-month token counts of a year (of the current `TOKENIZER_VERSION`), without checking them against
+    the messages (see `refresh_token_counts`).
+
+    :param conn: sqlite connection
+    :param year: year
+    :return: dict month -> n -> `Counter` (months without a complete snapshot are missing)
+    """
+    snapshots = {}
+    for month, ngram, counts in conn.execute('''
+            SELECT month, ngram, counts
+            FROM token_counts
+            WHERE year = ? AND version = ?
+        ''', (year, TOKENIZER_VERSION)):
+        snapshots.setdefault(month, {})[ngram] = Counter(json.loads(zlib.decompress(counts)))
+    return {month: counters for month, counters in sorted(snapshots.items()) if len(counters) == len(NGRAMS)}
+
+def month_text_signatures(conn, year: int) -> dict[int, tuple[int, int, int]]:
+    """
+    Signature of the texts of each month of a year: last message id, number of messages and a 64-bit hash (signed,
+    as `core.features.text_hash`) of their ids and texts in date order, so any text edit changes it.
+
+    :param conn: sqlite connection
+    :param year: year
+    :return: dict month -> (last message id, message count, text hash) (months without messages are missing)
+    """
+    start, end = year_bounds(year)
+    signatures = {}
+    month, last_id, count, digest = None, 0, 0, None
+
+    def signature() -> tuple[int, int, int]:
+        return last_id, count, int.from_bytes(digest.digest(), 'little', signed=True)
+
+    for message_month, message_id, text in conn.execute('''
+            SELECT CAST(strftime('%m', date_cuba) AS INTEGER), id, text
+            FROM messages
+            WHERE date_cuba_ts >= ? AND date_cuba_ts < ?
+            ORDER BY date_cuba_ts, id
+        ''', (start, end)):
+        if message_month != month:
+            if month is not None:
+                signatures[month] = signature()
+            month, last_id, count, digest = message_month, 0, 0, hashlib.blake2b(digest_size=8)
+        last_id = max(last_id, message_id)
+        count += 1
+        digest.update(f"{message_id}\x00{text or ''}\x00".encode('utf-8'))
+
+    if month is not None:
+        signatures[month] = signature()
+    return signatures
+
+def merge_token_counts(monthly: list[dict[int, Counter]], ngram: int = 1, accent_folding: bool = False) -> Counter:
+    """
+    Merges month snapshots (in date order, so ties keep the first appearance order).
+
+    :param monthly: snapshots as returned by `refresh_token_counts`
+    :param ngram: 1 for words, 2 for pairs of consecutive words
+    :param accent_folding: merge the tokens that only differ in accents
+    :return: `Counter` of tokens
+    """
+    merged = Counter()
+    for counters in monthly:
+        if accent_folding:
+            for token, count in counters[ngram].items():
+                merged[fold_accents(token)] += count
+        else:
+            merged.update(counters[ngram])
+    return merged
+
+def get_top_words(year: int, k: int = 25, months: range = range(1, 13), ngram: int = 1,
+                  accent_folding: bool = False, read_only: bool = False) -> dict[str, int]:
+    """
+    Top K most repeated words (or 2-grams) of a year or some of its months, merged from the month snapshots.
+
+    :param year: year
+    :param k: number of tokens
+    :param months: months to merge
+    :param ngram: 1 for words, 2 for pairs of consecutive words
+    :param accent_folding: merge the tokens that only differ in accents
+    :param read_only: use a read-only connection (stale months are tokenized but not stored)
+    :return: dict token -> count, most repeated first
+    """
+    with connection(read_only) as conn:
+        monthly = refresh_token_counts(conn, year, persist=not read_only)
+
+    selected = [counters for month, counters in monthly.items() if month in months]
+    return dict(merge_token_counts(selected, ngram, accent_folding).most_common(k))
+
+def __month_bounds(year: int, month: int) -> tuple[int, int]:
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return calendar.timegm((year, month, 1, 0, 0, 0)), calendar.timegm((next_year, next_month, 1, 0, 0, 0))
@@ -1,12 +1,140 @@
-from core import *
+"""
+UNE Unwrapped entry point.
+
+    python main.py [all] [--export-version {1,2}]  sync the latest messages and analyze the changed years
+    python main.py sync [--full] [--concurrency N]
+    python main.py analyze [YEAR ...] [--all-years] [--workers N] [--export-version {1,2}]
+    python main.py search QUERY [--year YEAR] [--limit N]
+    python main.py tail [--debounce SECONDS] [--export-version {1,2}]
+    python main.py session                     print a Telegram session string (API_SESSION)
+
+`analyze` runs offline against `telegram_messages.db`: Telegram modules and credentials are only loaded to sync.
+"""
+import argparse
+
+
+def sync(full: bool = False, concurrency: int = 1):
+    """
+    Message Retrieving from Telegram. Changed years are marked as dirty on the database.
+
+    :param full: fetch the whole channel history (resuming an interrupted backfill) instead of the latest messages
+    :param concurrency: id ranges fetched in parallel on a full sync
+    """
+    from core.scrapper import process_latest_messages, process_all_messages, process_all_messages_concurrently
+
+    if not full:
+        process_latest_messages()
+    elif concurrency > 1:
+        process_all_messages_concurrently(concurrency=concurrency)
+    else:
+        process_all_messages()
+
+
+def analyze(years: list[int] | None = None, all_years: bool = False, workers: int | None = None,
+            export_version: int | None = None):
+    """
+    Data Analysis, by default only of the years with inserted or changed messages since their last analysis.
+    Analysis files of older exports, without content hash, are republished first (see `migrate_legacy_exports`).
+
+    :param years: years to analyze
+    :param all_years: analyze every year on the database
+    :param workers: maximum number of processes (see `analyze_years`)
+    :param export_version: JSON export format (see `core.analyzer.analyze_data`), the current one by default
+    """
+    from core import analyze_years, get_dirty_years, clear_dirty_year, get_year_range
+    from core.analyzer import migrate_legacy_exports, EXPORT_FORMAT_VERSION
+
+    export_version = EXPORT_FORMAT_VERSION if export_version is None else export_version
+    migrate_legacy_exports(export_version)
+
+    if all_years:
+        first_year, last_year = get_year_range()
+        years = list(range(first_year, last_year + 1)) if first_year is not None else []
+    dirty = set(get_dirty_years())
+    years = years or sorted(dirty)
+    if not years:
+        print("✅ No years to analyze")
+        return
+
+    analyze_years(years, workers=workers, export_version=export_version)
+    for year in dirty.intersection(years):
+        clear_dirty_year(year)
+
+
+def tail(debounce: float | None = None, export_version: int | None = None):
+    """
+    Live mode: new and edited posts update the current year analysis as they arrive
+    (see `core.scrapper.tail_channel`).
+
+    :param debounce: seconds between the first change and its export
+    :param export_version: JSON export format (see `core.analyzer.analyze_data`), the current one by default
+    """
+    from core.analyzer import EXPORT_FORMAT_VERSION
+    from core.scrapper import tail_messages, DEBOUNCE_SECONDS
+
+    tail_messages(debounce=DEBOUNCE_SECONDS if debounce is None else debounce,
+                  export_version=EXPORT_FORMAT_VERSION if export_version is None else export_version)
+
+
+def search(query: str, year: int | None = None, limit: int = 20):
+    """
+    Full-text search over the archive (see `core.database.search_messages`).
+    """
+    from core.database import search_messages, construct_link_by_id
+
+    results = search_messages(query, year=year, limit=limit)
+    for message_id, date_cuba, snippet in results:
+        print(f"{date_cuba}  {construct_link_by_id(message_id)}\n    {' '.join(snippet.split())}")
+    print(f"🔎 {len(results)} messages found")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="⚡ UNE Unwrapped - Resumen Eléctrico de La Habana")
+    commands = parser.add_subparsers(dest='command')
+
+    # 1: indented, messages embedded on every ranking (for consumers of the old files); 2: compact (default)
+    export_options = argparse.ArgumentParser(add_help=False)
+    export_options.add_argument('--export-version', type=int, choices=(1, 2), default=None,
+                                help="JSON export format (default: 2)")
+
+    commands.add_parser('all', parents=[export_options],
+                        help="sync the latest messages and analyze the changed years (default)")
+
+    sync_parser = commands.add_parser('sync', help="fetch messages from Telegram")
+    sync_parser.add_argument('--full', action='store_true', help="fetch the whole channel history")
+    sync_parser.add_argument('--concurrency', type=int, default=1, help="id ranges fetched in parallel (--full)")
+
+    analyze_parser = commands.add_parser('analyze', parents=[export_options], help="analyze the database offline and export the JSON files")
+    analyze_parser.add_argument('years', nargs='*', type=int, help="years to analyze (default: changed years)")
+    analyze_parser.add_argument('--all-years', action='store_true', help="analyze every year on the database")
+    analyze_parser.add_argument('--workers', type=int, default=None, help="maximum number of processes")
+
+    search_parser = commands.add_parser('search', help="full-text search over the stored messages")
+    search_parser.add_argument('query', help="FTS5 query, e.g. apagón or \"bloque 3\" AND emergencia")
+    search_parser.add_argument('--year', type=int, default=None, help="only messages of this year")
+    search_parser.add_argument('--limit', type=int, default=20, help="maximum number of results")
+
+    tail_parser = commands.add_parser('tail', parents=[export_options], help="keep listening to the channel and update the current year live")
+    tail_parser.add_argument('--debounce', type=float, default=None, help="seconds between a change and its export")
+
+    commands.add_parser('session', help="print a Telegram session string (API_SESSION)")
+
+    args = parser.parse_args(argv)
+    command = args.command or 'all'
+
+    if command in ('all', 'sync'):
+        sync(full=getattr(args, 'full', False), concurrency=getattr(args, 'concurrency', 1))
+    if command in ('all', 'analyze'):
+        analyze(getattr(args, 'years', None), getattr(args, 'all_years', False), getattr(args, 'workers', None),
+                getattr(args, 'export_version', None))
+    if command == 'search':
+        search(args.query, args.year, args.limit)
+    if command == 'tail':
+        tail(args.debounce, args.export_version)
+    if command == 'session':
+        from core.session_manager import session_generator
+        session_generator()
+
 
 if __name__ == '__main__':
-    # Message Retrieving from Telegram
-    # process_all_messages()
-    process_latest_messages()
-
-    # Data Analysis
-    first_year, last_year = get_year_range()
-    years = list(range(first_year, last_year + 1))
-    for year in years:
-        analyze_data(year)
+    main()
@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+from core.database import close_databases
+from tests.fakes import FakeAsyncTelegramClient
+from tests.synthetic import generate_messages, CHANNEL_USERNAME
+
+ARCHIVE_SIZE = 3000
+
+os.environ.setdefault('CHANNEL_USERNAME', CHANNEL_USERNAME)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs a test inside an empty temporary directory, so `telegram_messages.db` and the exported data are its own.
+    """
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    close_databases()
+
+
+@pytest.fixture(scope='session')
+def archive():
+    """
+    Synthetic channel history of `ARCHIVE_SIZE` messages (see `tests.synthetic`), shared by every test.
+    """
+    return list(generate_messages(ARCHIVE_SIZE))
+
+
+@pytest.fixture
+def async_client(archive):
+    """
+    Factory of `FakeAsyncTelegramClient` serving `archive`, with the given latency, failure or flood wait.
+    """
+    return lambda **kwargs: FakeAsyncTelegramClient(archive, **kwargs)
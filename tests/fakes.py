@@ -0,0 +1,153 @@
+"""
+In-process stand-ins for the telethon clients used by `core.scrapper`, serving synthetic messages (see
+`tests.synthetic`) without network access. Also used by the benchmarks.
+"""
+import asyncio
+import datetime
+import time
+from types import SimpleNamespace
+from typing import Iterable
+
+from telethon.errors import FloodWaitError
+
+from core.classes import TelegramMessage
+
+PAGE_SIZE = 100
+
+
+class FakeTelegramClient:
+    """
+    Serves a fixed channel history through the subset of the telethon API used by `core.scrapper`.
+
+    Every page of `PAGE_SIZE` messages counts as one API request (as telethon does) and can be delayed
+    by `latency` seconds. `fail_after` raises `ConnectionError` after yielding that many messages,
+    to simulate an interrupted backfill.
+    """
+
+    def __init__(self, messages: Iterable[TelegramMessage], latency: float = 0.0, fail_after: int | None = None):
+        self.messages = sorted((to_telethon_message(m) for m in messages), key=lambda m: m.id)
+        self.latency = latency
+        self.fail_after = fail_after
+        self.requests = 0
+        self.served = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def iter_messages(self, entity, limit: int | None = None, *, min_id: int = 0, max_id: int = 0,
+                      reverse: bool = False):
+        selected = [m for m in self.messages if m.id > min_id and (not max_id or m.id < max_id)]
+        if not reverse:
+            selected.reverse()
+        if limit is not None:
+            selected = selected[:limit]
+
+        for i, message in enumerate(selected):
+            if i % PAGE_SIZE == 0:
+                self.__request()
+            if self.fail_after is not None and self.served >= self.fail_after:
+                raise ConnectionError(f'Fake connection lost after {self.served} messages')
+            self.served += 1
+            yield message
+
+    def get_messages(self, entity, limit: int = 1):
+        return list(self.iter_messages(entity, limit=limit))
+
+    def __request(self):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeAsyncTelegramClient(FakeTelegramClient):
+    """
+    Async version of `FakeTelegramClient` (as used inside an asyncio loop), where `latency` is awaited.
+
+    `flood_wait` raises a `FloodWaitError` of that many seconds once, on the request number `flood_wait_at`.
+    """
+
+    def __init__(self, messages: Iterable[TelegramMessage], latency: float = 0.0, fail_after: int | None = None,
+                 flood_wait: int = 0, flood_wait_at: int = 3):
+        super().__init__(messages, latency, fail_after)
+        self.flood_wait = flood_wait
+        self.flood_wait_at = flood_wait_at
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def iter_messages(self, entity, limit: int | None = None, *, min_id: int = 0, max_id: int = 0,
+                            reverse: bool = False):
+        selected = [m for m in self.messages if m.id > min_id and (not max_id or m.id < max_id)]
+        if not reverse:
+            selected.reverse()
+        if limit is not None:
+            selected = selected[:limit]
+
+        for i, message in enumerate(selected):
+            if i % PAGE_SIZE == 0:
+                await self.__request()
+            if self.fail_after is not None and self.served >= self.fail_after:
+                raise ConnectionError(f'Fake connection lost after {self.served} messages')
+            self.served += 1
+            yield message
+
+    async def get_messages(self, entity, limit: int = 1):
+        return [message async for message in self.iter_messages(entity, limit=limit)]
+
+    async def __request(self):
+        self.requests += 1
+        if self.flood_wait and self.requests == self.flood_wait_at:
+            raise FloodWaitError(request=None, capture=self.flood_wait)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeEventClient:
+    """
+    Delivers messages as events to the handlers registered by `core.scrapper.tail_channel`, one after another,
+    and disconnects `wait` seconds after the last one.
+    """
+
+    def __init__(self, messages: Iterable[TelegramMessage], wait: float = 0.0):
+        self.messages = list(messages)
+        self.wait = wait
+        self.handlers = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def add_event_handler(self, handler, event):
+        self.handlers.append(handler)
+
+    async def run_until_disconnected(self):
+        for message in self.messages:
+            await self.handlers[0](SimpleNamespace(message=to_telethon_message(message)))
+        await asyncio.sleep(self.wait)
+
+
+def to_telethon_message(msg: TelegramMessage) -> SimpleNamespace:
+    """
+    Builds an object with the attributes of a telethon `Message` read by the scrapper.
+    """
+    date = datetime.datetime.strptime(msg.date_utc, "%Y-%m-%d %H:%M:%S").replace(tzinfo=datetime.timezone.utc)
+    return SimpleNamespace(
+        id=msg.id,
+        date=date,
+        text=msg.text,
+        views=msg.views,
+        replies=SimpleNamespace(replies=msg.replies),
+        reactions=SimpleNamespace(results=[
+            SimpleNamespace(reaction=SimpleNamespace(emoticon=emoji), count=count)
+            for emoji, count in msg.reactions.items()
+        ]),
+    )
+
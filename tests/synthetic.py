@@ -0,0 +1,151 @@
+"""
+Synthetic UNE channel messages for the tests and benchmarks.
+
+The generated archive mimics the real channel: block affectations and restorations, block lists, emergencies,
+DAF notices, failures by zone, daily summaries, SEN disconnection cycles (from "desconexión del sistema
+electroenergético nacional" to "100 %") and emoji reactions biased by the kind of message.
+"""
+import datetime
+import random
+from typing import Iterator
+
+from core.classes import TelegramMessage
+
+# Channel whose links the synthetic archive produces; the committed benchmark baselines were built with it
+CHANNEL_USERNAME = 'EmpresaElectricaDeLaHabana'
+
+REACTION_EMOJIS = ['👍', '👎', '🤬', '😢', '❤', '🙏', '😱', '👏', '😁', '🔥']
+POSITIVE_REACTIONS = ['👍', '❤', '🙏', '👏', '😁']
+NEGATIVE_REACTIONS = ['👎', '🤬', '😢', '😱']
+MUNICIPALITIES = ['Playa', 'Plaza de la Revolución', 'Centro Habana', 'La Habana Vieja', 'Regla', 'Habana del Este',
+                  'Guanabacoa', 'San Miguel del Padrón', 'Diez de Octubre', 'Cerro', 'Marianao', 'La Lisa',
+                  'Boyeros', 'Arroyo Naranjo', 'Cotorro']
+
+AFFECTATION_TEMPLATES = [
+    "⚠️ #UNE | Afectación por déficit de capacidad de generación.\n"
+    "A las {time} se afecta el servicio eléctrico al Bloque no. {b}.\n"
+    "Estimados clientes, la Empresa Eléctrica de La Habana les ofrece disculpas por las molestias ocasionadas.",
+    "⚠️ Por déficit de generación se encuentra afectado el bloque {b} desde las {time}",
+    "Bloque #{b} fuera de servicio por déficit en la generación. Se estima su restablecimiento en {hours} horas.",
+]
+RESTORATION_TEMPLATES = [
+    "✅ #UNE | Restablecimiento del servicio eléctrico al bloque {b} a las {time}.",
+    "Se restablece el bloque no. {b} de manera paulatina. Gracias por su comprensión.",
+    "Se normaliza el servicio en el bloque {b}. Se recuperan los circuitos afectados.",
+]
+EMERGENCY_TEMPLATES = [
+    "🚨 Afectación de emergencia: bloque no. {b} fuera de servicio por emergencia en el SEN.",
+    "‼️ Bloque {b} y bloque {c} afectados por emergencia a las {time}.",
+]
+LIST_TEMPLATE = "📋 Bloques: {blocks} afectados en este momento por déficit de capacidad de generación."
+DAF_TEMPLATES = [
+    "⚡ DAF (disparado automático por frecuencia) a las {time}. Afectados los circuitos {n} y {m} del bloque {b}.",
+    "Ocurre disparo por DAF en varios circuitos de {municipality}. Se trabaja en su restablecimiento.",
+]
+ZONE_TEMPLATES = [
+    "🔧 Disparo del circuito {n} en el municipio {municipality}. Brigadas trabajando en la avería.",
+    "Averías primarias en {n} circuitos y {m} transformadores dañados en {municipality}.",
+    "Averías secundarias reportadas en {municipality}: {n} casos pendientes.",
+]
+SUMMARY_TEMPLATE = (
+    "📊 #UNE | En el día de ayer se afectó el servicio por déficit de capacidad de generación durante {hours} horas.\n"
+    "La máxima afectación fue de {mw} MW a las {time}, coincidente con la hora pico.\n"
+    "Para hoy se estima un déficit de {mw2} MW en el horario de mayor demanda."
+)
+GENERAL_TEMPLATES = [
+    "ℹ️ Estimados clientes, recuerden que pueden pagar la factura eléctrica a través de Transfermóvil y EnZona.",
+    "La Empresa Eléctrica de La Habana informa que las oficinas comerciales de {municipality} cambian su horario.",
+    "Recomendamos el ahorro de electricidad en el horario pico de 6:00 pm a 10:00 pm.",
+]
+SEN_FAILURE_START = ("🔴 #UNE | A las {time} ocurre la desconexión del sistema electroenergético nacional (SEN). "
+                     "Se trabaja en el restablecimiento del sistema.")
+SEN_FAILURE_PROGRESS = "🔄 Avanza el restablecimiento del Sistema Eléctrico Nacional: {p} % de los clientes con servicio."
+SEN_FAILURE_END = "✅ Restablecido al 100 % el sistema electroenergético nacional a las {time}."
+
+
+def generate_messages(count: int, seed: int = 666, start: datetime.datetime = datetime.datetime(2022, 1, 1),
+                      first_id: int = 1, mean_interval: float = 1800) -> Iterator[TelegramMessage]:
+    """
+    Generates synthetic messages in date order.
+
+    :param count: number of messages
+    :param seed: random seed, so the same archive is generated on every run
+    :param start: date (Cuba) of the first message
+    :param first_id: id of the first message
+    :param mean_interval: mean seconds between messages (e.g. `365 * 86400 / count` fills one year)
+    :return: iterator of `TelegramMessage` objects
+    """
+    rnd = random.Random(seed)
+    t = start
+    message_id = first_id
+    active_blocks = set()
+    sen_failure = 0
+
+    for _ in range(count):
+        t += datetime.timedelta(seconds=max(1, int(rnd.expovariate(1 / mean_interval))))
+        values = {
+            'b': rnd.randint(1, 6), 'c': rnd.randint(1, 6), 'n': rnd.randint(1, 300), 'm': rnd.randint(1, 300),
+            'time': t.strftime("%I:%M %p").lower(), 'hours': rnd.randint(1, 20), 'mw': rnd.randint(300, 1800),
+            'mw2': rnd.randint(300, 1800), 'municipality': rnd.choice(MUNICIPALITIES),
+        }
+
+        if sen_failure:
+            sen_failure -= 1
+            text = SEN_FAILURE_END if not sen_failure else SEN_FAILURE_PROGRESS
+            values['p'] = rnd.randint(5, 95)
+            mood = 1 if not sen_failure else -1
+        elif rnd.random() < 0.002:
+            sen_failure = rnd.randint(3, 30)
+            active_blocks.clear()
+            text, mood = SEN_FAILURE_START, -1
+        else:
+            text, mood = __block_text(rnd, active_blocks, values)
+
+        yield TelegramMessage(
+            id=message_id,
+            date_utc=(t + datetime.timedelta(hours=5)).strftime("%Y-%m-%d %H:%M:%S"),
+            date_cuba=t.strftime("%Y-%m-%d %H:%M:%S"),
+            reactions=__reactions(rnd, mood),
+            views=int(rnd.lognormvariate(9, 0.8)),
+            replies=int(rnd.expovariate(1 / 40)),
+            text=text.format(**values),
+        )
+        message_id += rnd.choice([1] * 19 + [2])
+
+
+def __block_text(rnd: random.Random, active_blocks: set[int], values: dict) -> tuple[str, int]:
+    kind = rnd.random()
+    b = values['b']
+    if kind < 0.30:
+        active_blocks.add(b)
+        return rnd.choice(AFFECTATION_TEMPLATES), -1
+    if kind < 0.50:
+        if active_blocks:
+            values['b'] = rnd.choice(sorted(active_blocks))
+            active_blocks.discard(values['b'])
+        return rnd.choice(RESTORATION_TEMPLATES), 1
+    if kind < 0.60:
+        active_blocks.update(rnd.sample(range(1, 7), rnd.randint(1, 4)))
+        values['blocks'] = ", ".join(str(block) for block in sorted(active_blocks))
+        return LIST_TEMPLATE, -1
+    if kind < 0.65:
+        active_blocks.update((b, values['c']))
+        return rnd.choice(EMERGENCY_TEMPLATES), -1
+    if kind < 0.72:
+        return rnd.choice(DAF_TEMPLATES), -1
+    if kind < 0.82:
+        return rnd.choice(ZONE_TEMPLATES), -1
+    if kind < 0.87:
+        return SUMMARY_TEMPLATE, -1
+    if kind < 0.90:
+        return "", 0
+    return rnd.choice(GENERAL_TEMPLATES), 0
+
+
+def __reactions(rnd: random.Random, mood: int) -> dict[str, int]:
+    weights = [
+        3 if (mood > 0 and emoji in POSITIVE_REACTIONS) or (mood < 0 and emoji in NEGATIVE_REACTIONS) else 1
+        for emoji in REACTION_EMOJIS
+    ]
+    emojis = dict.fromkeys(rnd.choices(REACTION_EMOJIS, weights)[0] for _ in range(rnd.randint(0, 5)))
+    return {emoji: int(rnd.expovariate(1 / 300)) + 1 for emoji in emojis}
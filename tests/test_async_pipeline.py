@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from core.classes import IdRange
+from core.database import connection, get_sync_state
+from core.scrapper import backfill_messages, split_id_range, backfill_checkpoint, BACKFILL_CHECKPOINT
+
+
+def __stored_ids() -> list[int]:
+    with connection() as conn:
+        return [row[0] for row in conn.execute('SELECT id FROM messages ORDER BY id')]
+
+
+def __checkpoint() -> int | None:
+    with connection() as conn:
+        return get_sync_state(conn, BACKFILL_CHECKPOINT)
+
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_backfill_stores_every_message(workdir, archive, async_client, concurrency):
+    changed_years = asyncio.run(backfill_messages(async_client(), concurrency=concurrency))
+    assert __stored_ids() == [m.id for m in archive]
+    assert changed_years == {int(m.date_cuba[:4]) for m in archive}
+    assert __checkpoint() is None
+
+
+def test_backfill_waits_flood_waits(workdir, archive, async_client):
+    asyncio.run(backfill_messages(async_client(flood_wait=1), concurrency=4))
+    assert __stored_ids() == [m.id for m in archive]
+
+
+def test_interrupted_backfill_resumes_without_gaps(workdir, archive, async_client):
+    with pytest.raises(ConnectionError):
+        asyncio.run(backfill_messages(async_client(fail_after=len(archive) // 3), concurrency=4,
+                                      batch_size=100))
+
+    checkpoint = __checkpoint()
+    stored = set(__stored_ids())
+    assert checkpoint is not None
+    assert all(m.id in stored for m in archive if m.id <= checkpoint)
+
+    client = async_client()
+    asyncio.run(backfill_messages(client, concurrency=4))
+    assert __stored_ids() == [m.id for m in archive]
+    assert __checkpoint() is None
+    assert client.served == sum(1 for m in archive if m.id > checkpoint) + 1
+
+
+def test_split_id_range_covers_the_whole_range():
+    ranges = split_id_range(10, 105, 4)
+    assert [(r.min_id, r.max_id) for r in ranges] == [(10, 34), (34, 58), (58, 82), (82, 105)]
+    assert split_id_range(10, 10, 4) == []
+
+
+def test_backfill_checkpoint_stops_at_the_first_unfinished_range():
+    ranges = [IdRange(0, 10, 10, done=True), IdRange(10, 20, 15), IdRange(20, 30, 30, done=True)]
+    assert backfill_checkpoint(ranges) == 15
+    ranges[1].done = True
+    assert backfill_checkpoint(ranges) is None
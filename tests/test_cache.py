@@ -0,0 +1,75 @@
+import datetime
+import shutil
+import sqlite3
+from dataclasses import replace
+
+from core.analyzer import analyze_data, rollup_analysis, serialize_analysis, DATA_DIRECTORY
+from core.database import connection, close_databases, save_messages_to_db, cache_path, DATABASE_PATH, \
+    CACHE_TABLES
+from tests.synthetic import generate_messages
+
+YEAR = 2025
+
+
+def __tables(path: str) -> set[str]:
+    with sqlite3.connect(path) as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    conn.close()
+    return tables
+
+
+def __analyzed_year(workdir) -> list:
+    messages = [
+        m for m in generate_messages(800, start=datetime.datetime(YEAR, 1, 1), mean_interval=300 * 86400 / 800)
+        if m.date_cuba.startswith(str(YEAR))
+    ]
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+    with connection() as conn:
+        save_messages_to_db(conn, messages, verbose=False)
+    analyze_data(YEAR, update_manifest=False)
+    return messages
+
+
+def test_derived_tables_are_kept_in_the_cache(workdir):
+    __analyzed_year(workdir)
+    close_databases()
+
+    assert cache_path() == 'telegram_messages_cache.db'
+    assert not __tables(DATABASE_PATH).intersection(CACHE_TABLES)
+    assert __tables(cache_path()).issuperset(CACHE_TABLES)
+    with connection(read_only=True) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM analysis_partials WHERE year = ?', (YEAR,)).fetchone()[0] == 12
+
+
+def test_derived_tables_of_older_schemas_are_dropped(workdir):
+    with sqlite3.connect(DATABASE_PATH) as conn:
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY, date_utc TEXT, date_cuba TEXT, '
+                     'views INTEGER, replies INTEGER, text TEXT)')
+        conn.execute('CREATE TABLE message_features (id INTEGER PRIMARY KEY, text_hash INTEGER)')
+        conn.execute('CREATE TABLE state_checkpoints (year INTEGER, name TEXT)')
+        conn.execute('CREATE TRIGGER state_checkpoints_insert AFTER INSERT ON messages BEGIN '
+                     'DELETE FROM state_checkpoints; END')
+        conn.execute('PRAGMA user_version = 5')
+    conn.close()
+
+    __analyzed_year(workdir)
+    close_databases()
+    assert not __tables(DATABASE_PATH).intersection(CACHE_TABLES + ('state_checkpoints_insert',))
+
+
+def test_cache_of_another_revision_is_emptied(workdir):
+    messages = __analyzed_year(workdir)
+    close_databases()
+    shutil.copy(cache_path(), 'old_cache.db')
+
+    # the archive changes without this cache (e.g. it was not saved), so its partials are not removed
+    edited = messages[10]
+    with connection() as conn:
+        save_messages_to_db(conn, [replace(edited, views=edited.views + 1000, text=edited.text.upper())],
+                            verbose=False)
+    close_databases()
+    shutil.copy('old_cache.db', cache_path())
+
+    with connection() as conn:
+        assert all(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0 for table in CACHE_TABLES)
+    assert serialize_analysis(rollup_analysis(trust_stored=True)) == serialize_analysis(rollup_analysis())
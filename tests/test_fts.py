@@ -0,0 +1,75 @@
+import sqlite3
+from dataclasses import replace
+
+from core.classes import TelegramMessage
+from core.database import connection, save_messages_to_db, search_messages, DATABASE_PATH, SCHEMA_VERSION
+
+TEXTS = {
+    1: "Desconexión del Sistema Electroenergético Nacional",
+    2: "Se restablece el bloque 3 de manera paulatina",
+    3: "Afectación por déficit de capacidad de generación en el bloque 5",
+}
+
+
+def __message(message_id: int, text: str) -> TelegramMessage:
+    date = f'2025-01-0{message_id} 10:00:00'
+    return TelegramMessage(id=message_id, date_utc=date, date_cuba=date, text=text)
+
+
+def __store(messages):
+    with connection() as conn:
+        save_messages_to_db(conn, messages, verbose=False)
+
+
+def __found(query: str) -> list[int]:
+    return sorted(row[0] for row in search_messages(query))
+
+
+def test_migration_indexes_existing_messages(workdir):
+    # a database from before the full-text index (schema v0): only the original tables
+    with sqlite3.connect(DATABASE_PATH) as conn:
+        conn.execute('CREATE TABLE messages (id INTEGER PRIMARY KEY, date_utc TEXT, date_cuba TEXT, '
+                     'views INTEGER, replies INTEGER, text TEXT)')
+        conn.executemany('INSERT INTO messages VALUES (?, ?, ?, 0, 0, ?)',
+                         [(m.id, m.date_utc, m.date_cuba, m.text) for m in
+                          (__message(i, text) for i, text in TEXTS.items())])
+    conn.close()
+
+    assert __found('desconexion') == [1]
+    assert __found('bloque') == [2, 3]
+    assert __found('"bloque 3"') == [2]
+    assert search_messages('bloque', year=2024) == []
+    with connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION
+
+
+def test_index_follows_inserts_edits_and_deletes(workdir):
+    __store([__message(i, text) for i, text in TEXTS.items()])
+    assert __found('bloque') == [2, 3]
+
+    # edited text: the old words are no longer found, the new ones are
+    __store([__message(2, "Se restablece el circuito 12 de manera paulatina")])
+    assert __found('bloque') == [3]
+    assert __found('circuito') == [2]
+
+    # other edits (views, reactions) keep the text indexed
+    __store([replace(__message(3, TEXTS[3]), views=500, reactions={'👍': 4})])
+    assert __found('deficit') == [3]
+
+    with connection() as conn:
+        conn.execute('DELETE FROM messages WHERE id = 1')
+        conn.commit()
+    assert __found('desconexion') == []
+    assert __found('"sistema electroenergetico"') == []
+
+    __store([__message(4, "Nueva desconexión total del sistema")])
+    assert __found('desconexion') == [4]
+
+
+def test_invalid_query_is_searched_as_a_phrase(workdir):
+    __store([__message(i, text) for i, text in TEXTS.items()])
+    # not valid FTS5 syntax, so the punctuation is dropped and the words are searched in order
+    assert __found('bloque 3"') == [2]
+    assert __found('"bloque 5') == [3]
+    assert __found('bloque 5 (') == [3]
+    assert __found('5 bloque (') == []
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import json
+import threading
+from dataclasses import replace
+
+import core.live
+import core.scrapper
+from core.analyzer import analyze_data, rollup_analysis, serialize_analysis, DATA_DIRECTORY
+from core.artifacts import MANIFEST_FILENAME
+from core.database import connection, save_messages_to_db
+from core.live import LiveAnalysis
+from core.scrapper import tail_channel
+from tests.fakes import FakeEventClient
+from tests.synthetic import generate_messages
+
+
+def __messages_of(year: int, count: int, mean_interval: float, first_id: int = 1) -> list:
+    messages = generate_messages(count, start=datetime.datetime(year, 1, 1), mean_interval=mean_interval,
+                                 first_id=first_id)
+    return [m for m in messages if m.date_cuba.startswith(str(year))]
+
+
+def __store(messages):
+    with connection() as conn:
+        save_messages_to_db(conn, messages, verbose=False)
+
+
+def test_live_analysis_follows_new_and_edited_messages(workdir):
+    messages = __messages_of(2025, 1200, 250 * 86400 / 1200)
+    history, new_posts = messages[:600], messages[600:]
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+    __store(history)
+
+    live = LiveAnalysis(2025)
+    assert live.update() == len(history)
+    for i, message in enumerate(new_posts, 1):
+        __store([message])
+        live.apply(message)
+        assert live.valid
+        if i % 200 == 0:
+            # an edit of a consumed message invalidates the state, and the year is loaded again
+            edited = replace(history[i // 2], text=history[i // 2].text + ' (editado)')
+            __store([edited])
+            live.apply(edited)
+            assert not live.valid
+            assert live.update() == len(history) + i
+
+    assert serialize_analysis(live.export()) == serialize_analysis(analyze_data(2025, update_manifest=False))
+
+
+def test_live_rollup_merges_the_other_years_once(workdir, monkeypatch):
+    previous = __messages_of(2024, 900, 350 * 86400 / 900)
+    messages = __messages_of(2025, 900, 250 * 86400 / 900, first_id=previous[-1].id + 1)
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+    __store(previous + messages[:300])
+    analyze_data(2024, update_manifest=False)
+
+    loads = []
+    load_rollup = core.live.load_rollup
+    monkeypatch.setattr(core.live, 'load_rollup', lambda **kwargs: loads.append(kwargs) or load_rollup(**kwargs))
+
+    def exported_rollup() -> bytes:
+        with open(workdir / DATA_DIRECTORY / MANIFEST_FILENAME, encoding='utf-8') as f:
+            return (workdir / DATA_DIRECTORY / json.load(f)['years']['all']).read_bytes()
+
+    live = LiveAnalysis(2025)
+    for i, message in enumerate(messages[300:], 1):
+        __store([message])
+        live.apply(message)
+        if i % 200 == 0:
+            live.export()
+            assert exported_rollup() == serialize_analysis(rollup_analysis())
+    assert len(loads) == 1
+
+    # a message of another year changes its partials, so they are loaded again
+    edited = replace(previous[10], text=previous[10].text + ' chispazo' * 5000)
+    __store([edited])
+    assert not live.apply(edited)
+    live.export()
+    assert len(loads) == 2
+    assert exported_rollup() == serialize_analysis(rollup_analysis())
+
+
+def test_tail_channel_stores_and_exports_off_the_event_loop(workdir, monkeypatch):
+    year = datetime.datetime.now().year
+    messages = __messages_of(year, 300, 600)
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+
+    threads = set()
+    save_messages_to_db = core.scrapper.save_messages_to_db
+
+    def recorded_save(*args, **kwargs):
+        threads.add(threading.get_ident())
+        return save_messages_to_db(*args, **kwargs)
+
+    monkeypatch.setattr(core.scrapper, 'save_messages_to_db', recorded_save)
+    asyncio.run(tail_channel(FakeEventClient(messages, wait=1.5), debounce=1.0))
+
+    assert threads and threading.get_ident() not in threads
+    with open(workdir / DATA_DIRECTORY / MANIFEST_FILENAME, encoding='utf-8') as f:
+        exported = (workdir / DATA_DIRECTORY / json.load(f)['years'][str(year)]).read_bytes()
+    assert exported == serialize_analysis(analyze_data(year, update_manifest=False))
@@ -0,0 +1,59 @@
+import datetime
+from dataclasses import replace
+
+from tests.synthetic import generate_messages
+from core.analyzer import analyze_data, rollup_analysis, serialize_analysis, DATA_DIRECTORY
+from core.database import connection, save_messages_to_db
+from core.partials import stale_partial_years
+
+YEAR = 2025
+
+
+def __store(messages):
+    with connection() as conn:
+        save_messages_to_db(conn, messages, verbose=False)
+
+
+def test_rollup_follows_edits_of_stored_messages(workdir):
+    messages = [
+        m for m in generate_messages(1500, start=datetime.datetime(YEAR, 1, 1), mean_interval=300 * 86400 / 1500)
+        if m.date_cuba.startswith(str(YEAR))
+    ]
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+    __store(messages)
+    analyze_data(YEAR, update_manifest=False)
+    with connection() as conn:
+        assert stale_partial_years(conn) == []
+
+    # same id and count, only the content changes
+    edited = messages[10]
+    __store([replace(edited, views=edited.views + 1000, text=edited.text.upper(), reactions={})])
+    with connection() as conn:
+        assert stale_partial_years(conn) == [YEAR]
+
+    rollup = rollup_analysis([YEAR])
+    analysis = analyze_data(YEAR, update_manifest=False)
+    rollup.year, rollup.sync_date = analysis.year, analysis.sync_date
+    assert serialize_analysis(rollup) == serialize_analysis(analysis)
+
+
+def test_trusted_rollup_matches_the_checked_one(workdir):
+    # three years, 2023 left without analysis
+    messages = list(generate_messages(3000, start=datetime.datetime(YEAR - 3, 1, 1),
+                                      mean_interval=3 * 365 * 86400 / 3000))
+    years = sorted({int(m.date_cuba[:4]) for m in messages})
+    (workdir / DATA_DIRECTORY).mkdir(parents=True)
+    __store(messages)
+    for year in years[:-1]:
+        if year != YEAR - 2:
+            analyze_data(year, update_manifest=False)
+    assert serialize_analysis(rollup_analysis(trust_stored=True)) == serialize_analysis(rollup_analysis())
+
+    # an edited text removes the partials of its year, so the trusted rollup reads that year again
+    edited = next(m for m in messages if m.date_cuba.startswith(str(YEAR - 1)) and m.text)
+    __store([replace(edited, text=edited.text + " chispazo" * 5000)])
+    trusted = rollup_analysis(trust_stored=True)
+    assert next(iter(trusted.top25_most_repeated_words)) == 'chispazo'
+    assert serialize_analysis(trusted) == serialize_analysis(rollup_analysis())
+    with connection() as conn:
+        assert stale_partial_years(conn) == []
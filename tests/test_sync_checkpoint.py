@@ -0,0 +1,68 @@
+import pytest
+
+from tests.fakes import FakeTelegramClient, PAGE_SIZE
+from tests.synthetic import generate_messages
+from core.database import connection, get_sync_state, get_last_message_id
+from core.scrapper import process_all_messages, process_latest_messages, BACKFILL_CHECKPOINT, REFRESH_WINDOW
+
+COUNT = 2000
+
+
+@pytest.fixture
+def archive():
+    return list(generate_messages(COUNT + REFRESH_WINDOW * 5))
+
+
+def __stored_messages() -> int:
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+def __checkpoint() -> int | None:
+    with connection() as conn:
+        return get_sync_state(conn, BACKFILL_CHECKPOINT)
+
+
+def test_interrupted_backfill_resumes_from_checkpoint(workdir, archive):
+    history = archive[:COUNT]
+    with pytest.raises(ConnectionError):
+        process_all_messages(FakeTelegramClient(history, fail_after=COUNT // 2))
+
+    checkpoint = __checkpoint()
+    assert checkpoint is not None and 0 < checkpoint <= history[COUNT // 2].id
+    assert __stored_messages() >= sum(1 for m in history if m.id <= checkpoint)
+
+    client = FakeTelegramClient(history)
+    process_all_messages(client)
+    assert __stored_messages() == COUNT
+    assert __checkpoint() is None
+    assert client.requests < COUNT // PAGE_SIZE
+
+
+def test_backfill_without_resume_starts_over(workdir, archive):
+    history = archive[:COUNT]
+    with pytest.raises(ConnectionError):
+        process_all_messages(FakeTelegramClient(history, fail_after=COUNT // 2))
+
+    client = FakeTelegramClient(history)
+    process_all_messages(client, resume=False)
+    assert __stored_messages() == COUNT
+    assert client.requests == COUNT // PAGE_SIZE
+
+
+def test_sync_only_refreshes_the_window_past_the_high_water_mark(workdir, archive):
+    process_all_messages(FakeTelegramClient(archive[:COUNT]))
+
+    client = FakeTelegramClient(archive[:COUNT + 10])
+    process_latest_messages(client)
+    assert __stored_messages() == COUNT + 10
+    assert client.requests == 1
+
+
+def test_sync_fills_the_gap_beyond_the_refresh_window(workdir, archive):
+    process_all_messages(FakeTelegramClient(archive[:COUNT]))
+
+    process_latest_messages(FakeTelegramClient(archive))
+    assert __stored_messages() == len(archive)
+    with connection() as conn:
+        assert get_last_message_id(conn) == archive[-1].id
@@ -0,0 +1,19 @@
+from dataclasses import replace
+
+from tests.synthetic import generate_messages
+from core.database import connection, save_messages_to_db
+from core.words import get_top_words
+
+
+def test_top_words_follow_edits_that_keep_the_text_length(workdir):
+    messages = list(generate_messages(200))
+    year = int(messages[0].date_cuba[:4])
+    with connection() as conn:
+        save_messages_to_db(conn, messages, verbose=False)
+    assert 'zzzz' not in get_top_words(year)
+
+    edited = [replace(m, text='zzzz ' * (len(m.text) // 5) + ' ' * (len(m.text) % 5)) for m in messages[:50]]
+    assert all(len(e.text) == len(m.text) for e, m in zip(edited, messages))
+    with connection() as conn:
+        save_messages_to_db(conn, edited, verbose=False)
+    assert next(iter(get_top_words(year))) == 'zzzz'